@@ -92,7 +92,8 @@ async function runAllMigrations() {
       'migration_add_ot_threshold.sql',
       'migration_add_global_settings.sql',
       'migration_add_staff_work_fields.sql',
-      'migration_add_password_reset.sql'
+      'migration_add_password_reset.sql',
+      'migration_add_encoding_tracking.sql'
     ];
     
     for (const migrationFile of migrations) {
@@ -133,6 +134,7 @@ async function runAllMigrations() {
     console.log('   ✅ Added on-duty enabled functionality');
     console.log('   ✅ Added staff work fields (work status, manager, project code)');
     console.log('   ✅ Added password reset functionality');
+    console.log('   ✅ Added face encoding tracking (stale encoding detection)');
     
   } catch (error) {
     console.error('❌ Migration process failed:', error.message);
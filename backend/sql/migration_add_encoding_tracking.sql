@@ -0,0 +1,40 @@
+-- Migration: Track which photo each stored face encoding was computed from
+-- Lets the encoding watcher (python populate_encodings.py --watch) find stale
+-- encodings after a staff photo is replaced, and lets the recognizer reload
+-- only the rows that changed.
+
+ALTER TABLE staff
+ADD COLUMN IF NOT EXISTS face_encoding_image_path VARCHAR(255),
+ADD COLUMN IF NOT EXISTS face_encoding_updated_at TIMESTAMP;
+
+COMMENT ON COLUMN staff.face_encoding_image_path IS 'face_image_path the stored face_encoding was generated from';
+COMMENT ON COLUMN staff.face_encoding_updated_at IS 'When face_encoding was last written';
+
+-- Existing encodings are assumed to match the current photo
+UPDATE staff
+SET face_encoding_image_path = face_image_path,
+    face_encoding_updated_at = COALESCE(updated_at, CURRENT_TIMESTAMP)
+WHERE face_encoding IS NOT NULL
+  AND face_encoding != ''
+  AND face_encoding_image_path IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_staff_face_encoding_updated_at ON staff(face_encoding_updated_at);
+
+-- Wake the watcher as soon as a photo is added or replaced
+-- (wrapped in a DO block so scripts/run_all_migration.js runs it as one statement)
+DO $$
+BEGIN
+    EXECUTE $fn$
+        CREATE OR REPLACE FUNCTION notify_staff_face_changed() RETURNS trigger AS $body$
+        BEGIN
+            PERFORM pg_notify('staff_face_changed', NEW.staff_id);
+            RETURN NEW;
+        END;
+        $body$ LANGUAGE plpgsql
+    $fn$;
+    DROP TRIGGER IF EXISTS trg_staff_face_changed ON staff;
+    CREATE TRIGGER trg_staff_face_changed
+        AFTER INSERT OR UPDATE OF face_image_path ON staff
+        FOR EACH ROW
+        EXECUTE FUNCTION notify_staff_face_changed();
+END $$;
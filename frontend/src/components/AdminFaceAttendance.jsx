@@ -26,12 +26,28 @@ import {
 import { CheckCircle, Close } from '@mui/icons-material'
 import { useAuth } from '../context/AuthContext'
 import API_BASE_URL, { getRecognitionUrl, getRecognitionConfig } from '../config/api'
+import recognitionService from '../services/recognitionService'
 import toast from 'react-hot-toast'
 
 const CAMERA_STORAGE_KEY = 'faceapp_camera_in_use'
 const CAMERA_CLAIM_TTL = 5000
 const CAMERA_HEARTBEAT_INTERVAL = 2000
 
+// Messages for the recognizer's quality gate rejections ("retry": true)
+const QUALITY_RETRY_MESSAGES = {
+  face_too_small: 'Please move closer to the camera',
+  face_blurred: 'Please hold still',
+  face_not_frontal: 'Please look straight at the camera',
+}
+
+// /recognize-and-record actions that wrote (or queued) attendance
+const RECORDED_ACTION_LABELS = {
+  checked_in: 'Check-in',
+  checked_out: 'Check-out',
+  checked_out_updated: 'Check-out',
+  queued: 'Attendance',
+}
+
 export default function AdminFaceAttendance() {
   const { user } = useAuth()
   const videoRef = useRef(null)
@@ -883,6 +899,7 @@ export default function AdminFaceAttendance() {
           })
           
           if (attendanceResponse.ok) {
+            markRecentMatch(best.staffId, token)
             const attendanceData = await attendanceResponse.json()
             // Show success popup with staff details
             showSuccessPopup(
@@ -965,7 +982,7 @@ export default function AdminFaceAttendance() {
     if (best?.staffId) {
       try {
         const token = localStorage.getItem('token')
-        await fetch(`${API_BASE_URL}/api/attendance/face-event`, {
+        const attendanceResponse = await fetch(`${API_BASE_URL}/api/attendance/face-event`, {
           method: 'POST',
           headers: {
             'Authorization': `Bearer ${token}`,
@@ -973,163 +990,153 @@ export default function AdminFaceAttendance() {
           },
           body: JSON.stringify({ staffId: best.staffId })
         })
+        if (attendanceResponse.ok) {
+          markRecentMatch(best.staffId, token)
+        }
       } catch (e) {
         // ignore UI error; result still shown
       }
     }
   }
 
-  async function recognizeBlobSimple(blob, filename) {
+  // Tell the recognizer attendance was written, so repeat scans of this
+  // person are suppressed at every kiosk. Only call after the backend write succeeded.
+  function markRecentMatch(staffId, token) {
+    const markFormData = new FormData()
+    markFormData.append('staffId', staffId)
+    fetch(getRecognitionUrl('markMatch'), {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+      body: markFormData
+    }).catch(() => {
+      // the browser cooldown still applies
+    })
+  }
+
+  async function recognizeBlobSimple(blob, filename, qualityRetries = 1) {
     console.log('[RECOGNIZE] Starting recognition for:', filename, 'Blob size:', blob.size, 'bytes')
     
     setError('')
     setLoadingMessage('Recognizing face...')
     setActiveStep(2) // Face Recognition step
     
-    const formData = new FormData()
-    formData.append('image', blob, filename)
-    
     try {
-      const recognizeSimpleUrl = getRecognitionUrl('recognizeSimple')
-      const config = getRecognitionConfig()
-      
-      console.log('[RECOGNIZE] Sending to Python service:', recognizeSimpleUrl)
-      console.log('[RECOGNIZE] Timeout configured:', config.timeout, 'ms')
+      // One request recognizes, applies the shared cooldown and records attendance
+      const token = localStorage.getItem('token')
+      console.log('[RECOGNIZE] Sending to Python service:', getRecognitionUrl('recognizeAndRecord'))
       
       const startTime = Date.now()
-      const res = await fetch(recognizeSimpleUrl, { 
-        method: 'POST', 
-        body: formData,
-        headers: {
-          'Accept': 'application/json',
-        },
-        signal: AbortSignal.timeout(config.timeout)
-      })
+      const result = await recognitionService.recognizeAndRecord(blob, token, filename)
+      console.log('[RECOGNIZE] Response received in', Date.now() - startTime, 'ms, status:', result.status)
       
-      const requestDuration = Date.now() - startTime
-      console.log('[RECOGNIZE] Response received in', requestDuration, 'ms')
-      console.log('[RECOGNIZE] Response status:', res.status, res.statusText)
-      
-      let data
-      try {
-        const responseText = await res.text()
-        console.log('[RECOGNIZE] Response text length:', responseText.length)
-        data = JSON.parse(responseText)
-        console.log('[RECOGNIZE] Parsed response:', data)
-      } catch (parseError) {
-        console.error('[RECOGNIZE] JSON parse error:', parseError)
-        setError('Invalid response from recognition service: ' + parseError.message)
-        return
+      const data = result.data
+      if (!data) {
+        throw new Error(result.error || 'No response from recognition service')
       }
-      
+      console.log('[RECOGNIZE] Parsed response:', data)
       setLastResult(data)
 
-      // If a confident match was found, mark attendance via backend
-      const best = Array.isArray(data?.matches) ? data.matches.find(m => m.matched) : null
-      console.log('[RECOGNIZE] Best match:', best)
-      
-      if (best?.staffId) {
-        console.log('[RECOGNIZE] Match found! Staff:', best.staffId, 'Confidence:', best.score)
-        
-        // Check cooldown period (2 minutes) to prevent duplicate marks
-        const now = Date.now()
-        const lastMarkTime = recentAttendanceMarks.current.get(best.staffId)
-        const cooldownPeriod = 2 * 60 * 1000 // 2 minutes in milliseconds
-        
-        if (lastMarkTime && (now - lastMarkTime) < cooldownPeriod) {
-          const remainingSeconds = Math.ceil((cooldownPeriod - (now - lastMarkTime)) / 1000)
-          const elapsedSeconds = Math.floor((now - lastMarkTime) / 1000)
-          console.log(`[RECOGNIZE] ⏸️ Cooldown active for Staff ${best.staffId}. Wait ${remainingSeconds} more seconds.`)
-          
-          // Show info message in continuous mode (don't show as error)
-          if (continuousMode) {
-            console.log(`[RECOGNIZE] Skipping attendance mark for ${best.fullName || best.staffId} - marked ${elapsedSeconds}s ago`)
-            // Show brief toast notification
-            toast.info(`${best.fullName || best.staffId} already marked ${elapsedSeconds}s ago. Cooldown: ${remainingSeconds}s remaining.`, {
-              duration: 2000,
-              position: 'top-center',
-              style: {
-                background: '#2196f3',
-                color: 'white',
-                fontSize: '14px'
-              }
-            })
-          } else {
-            setError(`${best.fullName || best.staffId} was already marked ${elapsedSeconds} seconds ago. Wait ${remainingSeconds} more seconds.`)
-          }
+      // Frame rejected before encoding: tell the person why and try a fresh frame
+      if (data.retry) {
+        const message = QUALITY_RETRY_MESSAGES[data.reason] || 'Face not clear enough, please try again'
+        console.log('[RECOGNIZE] Frame rejected by quality gate:', data.reason, data.quality)
+        if (continuousMode) {
+          // The next scan captures a new frame anyway
+          toast(message, { duration: 2000, position: 'top-center' })
           return
         }
-        
-        console.log('[RECOGNIZE] ✅ Cooldown check passed, proceeding to mark attendance')
-        setLoadingMessage('Recording attendance...')
-        setActiveStep(3) // Attendance Marked step
-        try {
-          const token = localStorage.getItem('token')
-          
-          // Create FormData to send face image and data
-          const attendanceFormData = new FormData()
-          attendanceFormData.append('staffId', best.staffId)
-          attendanceFormData.append('confidenceScore', best.score || 0)
-          
-          // Add the captured frame as the face image
-          attendanceFormData.append('faceImage', blob, 'face_capture.jpg')
-          
-          console.log('[RECOGNIZE] Sending attendance to backend:', `${API_BASE_URL}/api/attendance/face-event`)
-          
-          const attendanceResponse = await fetch(`${API_BASE_URL}/api/attendance/face-event`, {
-            method: 'POST',
-            headers: {
-              'Authorization': `Bearer ${token}`,
-            },
-            body: attendanceFormData
-          })
-          
-          console.log('[RECOGNIZE] Attendance response status:', attendanceResponse.status)
-          
-          if (attendanceResponse.ok) {
-            const attendanceData = await attendanceResponse.json()
-            console.log('[RECOGNIZE] Attendance marked successfully:', attendanceData)
-            
-            // Record this attendance mark with timestamp
-            recentAttendanceMarks.current.set(best.staffId, now)
-            console.log(`[RECOGNIZE] 🕐 Cooldown started for Staff ${best.staffId} - 2 minutes`)
-            
-            // Update cooldown display list
-            updateCooldownList()
-            
-            // Clean up old entries (older than 3 minutes)
-            const threeMinutesAgo = now - (3 * 60 * 1000)
-            for (const [staffId, timestamp] of recentAttendanceMarks.current.entries()) {
-              if (timestamp < threeMinutesAgo) {
-                recentAttendanceMarks.current.delete(staffId)
-                console.log(`[RECOGNIZE] 🧹 Cleaned up old cooldown for Staff ${staffId}`)
-              }
-            }
-            
-            // Update display after cleanup
-            updateCooldownList()
-            
-            // Show success popup with staff details
-            showSuccessPopup(
-              best.fullName || best.staffId, 
-              best.staffId, 
-              best.score || 0, 
-              attendanceData.action || attendanceData.attendanceType || 'Check-in'
-            )
-          } else {
-            const errorText = await attendanceResponse.text()
-            console.error('[RECOGNIZE] Attendance marking failed:', errorText)
+        if (qualityRetries > 0 && videoRef.current && canvasRef.current && videoRef.current.readyState === 4) {
+          setLoadingMessage(message)
+          await new Promise(resolve => setTimeout(resolve, 500))
+          const video = videoRef.current
+          const canvas = canvasRef.current
+          canvas.width = video.videoWidth
+          canvas.height = video.videoHeight
+          canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height)
+          const retryBlob = await new Promise((resolve) => canvas.toBlob(resolve, 'image/jpeg', 0.9))
+          if (retryBlob) {
+            await recognizeBlobSimple(retryBlob, filename, qualityRetries - 1)
+            return
           }
-        } catch (e) {
-          console.error('[RECOGNIZE] Attendance error:', e)
-          // ignore UI error; result still shown
         }
-      } else {
+        setError(message)
+        return
+      }
+      
+      if (!result.success) {
+        // 401/403 (expired or non-operator token) or a server error; nothing was recorded
+        console.error('[RECOGNIZE] Recognize and record failed:', result.status, data.message)
+        if (!continuousMode) {
+          setError('Attendance could not be recorded: ' + (data.message || result.error))
+        }
+        return
+      }
+
+      const best = Array.isArray(data.matches) ? data.matches.find(m => m.matched) : null
+      console.log('[RECOGNIZE] Best match:', best, 'action:', data.action)
+      
+      if (!best?.staffId) {
         console.log('[RECOGNIZE] No matching face found')
         if (!continuousMode) {
-        setError('No matching face found in database')
+          setError('No matching face found in database')
+        }
+        return
+      }
+      const staffName = best.fullName || best.staffId
+      
+      // Server-side cooldown shared by all kiosks (recognizer MATCH_SUPPRESSION_SECONDS)
+      if (data.action === 'suppressed') {
+        const elapsedSeconds = Math.floor(best.suppressedSecondsAgo || 0)
+        console.log(`[RECOGNIZE] ⏸️ Recognizer suppressed repeat match for Staff ${best.staffId} (marked ${elapsedSeconds}s ago)`)
+        if (continuousMode) {
+          toast(`${staffName} already marked ${elapsedSeconds}s ago.`, {
+            duration: 2000,
+            position: 'top-center',
+            style: {
+              background: '#2196f3',
+              color: 'white',
+              fontSize: '14px'
+            }
+          })
+        } else {
+          setError(`${staffName} was already marked ${elapsedSeconds} seconds ago.`)
+        }
+        return
+      }
+      
+      // Attendance rules left the record as it was (e.g. check-out too soon after check-in)
+      if (data.action === 'ignored') {
+        console.log(`[RECOGNIZE] Attendance unchanged for Staff ${best.staffId}`)
+        if (continuousMode) {
+          toast(`${staffName}: attendance already up to date.`, { duration: 2000, position: 'top-center' })
+        } else {
+          setError(`${staffName}: attendance is already up to date.`)
+        }
+        return
+      }
+      
+      const attendanceType = RECORDED_ACTION_LABELS[data.action] || 'Attendance'
+      console.log('[RECOGNIZE] Attendance recorded:', data.action, data.eventId || data.attendance)
+      setActiveStep(3) // Attendance Marked step
+      
+      // Record this attendance mark with timestamp, for the operator's cooldown list
+      const now = Date.now()
+      recentAttendanceMarks.current.set(best.staffId, now)
+      
+      // Clean up old entries (older than 3 minutes)
+      const threeMinutesAgo = now - (3 * 60 * 1000)
+      for (const [staffId, timestamp] of recentAttendanceMarks.current.entries()) {
+        if (timestamp < threeMinutesAgo) {
+          recentAttendanceMarks.current.delete(staffId)
+          console.log(`[RECOGNIZE] 🧹 Cleaned up old cooldown for Staff ${staffId}`)
         }
       }
+      updateCooldownList()
+      
+      // Show success popup with staff details
+      showSuccessPopup(staffName, best.staffId, best.score || 0, attendanceType)
     } catch (e) {
       console.error('[RECOGNIZE] Recognition error:', e)
       if (!continuousMode) {
@@ -1197,13 +1204,16 @@ export default function AdminFaceAttendance() {
         attendanceFormData.append('confidenceScore', best.score || 0)
         attendanceFormData.append('faceImage', file, filename)
         
-        await fetch(`${API_BASE_URL}/api/attendance/face-event`, {
+        const attendanceResponse = await fetch(`${API_BASE_URL}/api/attendance/face-event`, {
           method: 'POST',
           headers: {
             'Authorization': `Bearer ${token}`,
           },
           body: attendanceFormData
         })
+        if (attendanceResponse.ok) {
+          markRecentMatch(best.staffId, token)
+        }
       } catch (e) {
         // ignore UI error; result still shown
       }
@@ -1275,6 +1285,7 @@ export default function AdminFaceAttendance() {
           })
           
           if (attendanceResponse.ok) {
+            markRecentMatch(best.staffId, token)
             const attendanceData = await attendanceResponse.json()
             // Show success popup with staff details
             showSuccessPopup(
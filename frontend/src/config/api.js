@@ -11,6 +11,8 @@ const RECOGNITION_SERVICE_CONFIG = {
     health: '/health',
     recognize: '/recognize',
     recognizeSimple: '/recognize-simple',
+    recognizeAndRecord: '/recognize-and-record',
+    markMatch: '/recent-matches/mark',
     livenessCheck: '/liveness-check',
     reload: '/reload'
   },
@@ -156,6 +156,86 @@ class RecognitionService {
     }
   }
 
+  /**
+   * Recognize a face and record the check-in/check-out in one request
+   * (replaces recognizeSimple followed by POST /api/attendance/face-event)
+   * @param {File|Blob} image - Image file or blob
+   * @param {string} token - Backend JWT of an admin or operator
+   * @param {string} filename - Filename for the image
+   * @returns {Promise<Object>}
+   */
+  async recognizeAndRecord(image, token, filename = 'image.jpg') {
+    try {
+      const formData = new FormData()
+      formData.append('image', image, filename)
+
+      const response = await this.makeRequest('recognizeAndRecord', {
+        method: 'POST',
+        body: formData,
+        headers: {
+          'Accept': 'application/json',
+          'Authorization': `Bearer ${token}`,
+        }
+      })
+
+      const responseText = await response.text()
+      const data = JSON.parse(responseText)
+      
+      return { 
+        success: response.ok, 
+        data, 
+        status: response.status,
+        error: response.ok ? null : data.message || 'Unknown error'
+      }
+    } catch (error) {
+      console.error('Recognize and record error:', error)
+      return { 
+        success: false, 
+        error: error.message,
+        isNetworkError: error.name === 'TypeError' && error.message.includes('fetch')
+      }
+    }
+  }
+
+  /**
+   * Open the recognizer's suppression window for a staff member after their
+   * attendance was written through POST /api/attendance/face-event
+   * @param {string} staffId - Staff ID that was recorded
+   * @param {string} token - Backend JWT of an admin or operator
+   * @returns {Promise<Object>}
+   */
+  async markMatch(staffId, token) {
+    try {
+      const formData = new FormData()
+      formData.append('staffId', staffId)
+
+      const response = await this.makeRequest('markMatch', {
+        method: 'POST',
+        body: formData,
+        headers: {
+          'Accept': 'application/json',
+          'Authorization': `Bearer ${token}`,
+        }
+      })
+
+      const data = await response.json()
+      
+      return { 
+        success: response.ok, 
+        data, 
+        status: response.status,
+        error: response.ok ? null : data.message || 'Unknown error'
+      }
+    } catch (error) {
+      console.error('Mark match error:', error)
+      return { 
+        success: false, 
+        error: error.message,
+        isNetworkError: error.name === 'TypeError' && error.message.includes('fetch')
+      }
+    }
+  }
+
   /**
    * Reload the face database
    * @returns {Promise<Object>}
@@ -0,0 +1,75 @@
+"""
+Admin Authentication Module
+Verifies the HS256 JWT issued by the Node backend (/api/auth/login) so the
+recognizer can restrict diagnostic endpoints to the same users and roles.
+"""
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from functools import wraps
+
+from flask import request, jsonify, g
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64decode(segment):
+    padding = '=' * (-len(segment) % 4)
+    return base64.urlsafe_b64decode(segment + padding)
+
+
+def decode_token(token, secret):
+    """Return the payload of a valid, unexpired HS256 token or raise TokenError"""
+    try:
+        header_b64, payload_b64, signature_b64 = token.split('.')
+        header = json.loads(_b64decode(header_b64))
+        payload = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+    except Exception:
+        raise TokenError("Malformed token")
+
+    if header.get('alg') != 'HS256':
+        raise TokenError("Unsupported token algorithm")
+
+    expected = hmac.new(secret.encode('utf-8'), f"{header_b64}.{payload_b64}".encode('ascii'), hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise TokenError("Invalid token signature")
+
+    exp = payload.get('exp')
+    if exp is not None and time.time() >= exp:
+        raise TokenError("Token expired")
+    return payload
+
+
+def require_role(*roles):
+    """Route decorator mirroring the backend's auth + requireAdmin middleware"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get('Authorization', '')
+            token = header[7:] if header.startswith('Bearer ') else None
+            if not token:
+                return jsonify({"message": "No token provided"}), 401
+            try:
+                user = decode_token(token, config.service.jwt_secret)
+            except TokenError as e:
+                logger.warning(f"Rejected token for {request.path}: {e}")
+                return jsonify({"message": "Invalid token"}), 401
+            if user.get('role') not in roles:
+                return jsonify({"message": f"Access denied. {' or '.join(r.capitalize() for r in roles)} role required."}), 403
+            g.user = user
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+require_admin = require_role('admin')
@@ -0,0 +1,174 @@
+"""
+Allocation Tracker Module
+Runtime-toggleable tracemalloc diagnostics for memory-leak investigation.
+
+While active, every log_performance block records how much traced memory it
+left behind, grouped by pipeline stage (decode, detection, landmarks,
+encoding, ...). Snapshots can be taken at any time; each new snapshot is
+compared with the previous one to list the source lines whose allocations
+grew the most in between, alongside the per-stage growth over the same
+window.
+
+tracemalloc slows allocation-heavy code noticeably, so it is off by default
+and should only be switched on while a leak is being chased.
+"""
+import os
+import time
+import threading
+import tracemalloc
+
+from metrics import normalize_name, stage_for
+
+# Frames from these files are noise in a leak report
+_IGNORED_FILES = (
+    tracemalloc.__file__,
+    '<frozen importlib._bootstrap>',
+    '<frozen importlib._bootstrap_external>',
+    '<unknown>',
+)
+
+# Stages reported first; anything else follows alphabetically
+STAGE_ORDER = ('decode', 'detection', 'landmarks', 'encoding', 'liveness', 'matching', 'db_load', 'request', 'other')
+
+
+class TrackerInactive(Exception):
+    pass
+
+
+class AllocationTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._snapshot = None
+        self._snapshot_time = None
+        self._stage_growth = {}
+        self.started_at = None
+        self.last_report = None
+
+    @property
+    def active(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=25):
+        """Begin tracing; frames is the traceback depth kept per allocation"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start(max(1, int(frames)))
+            self.started_at = time.time()
+            self._stage_growth = {}
+            self._snapshot = self._take_snapshot()
+            self._snapshot_time = time.time()
+            self.last_report = None
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return False
+            tracemalloc.stop()
+            self._snapshot = None
+            self._snapshot_time = None
+            self.started_at = None
+            return True
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, path) for path in _IGNORED_FILES]
+        )
+
+    def stage_enter(self, operation_name):
+        """Called when a timed block starts; returns a token for stage_exit"""
+        if not tracemalloc.is_tracing():
+            return None
+        name, _ = normalize_name(operation_name)
+        stage = stage_for(name)
+        stack = getattr(self._local, 'stages', None)
+        if stack is None:
+            stack = self._local.stages = []
+        # Nested blocks of the same stage are only counted by the outermost one
+        outermost = stage not in stack
+        stack.append(stage)
+        return (stage, outermost, tracemalloc.get_traced_memory()[0])
+
+    def stage_exit(self, token):
+        if token is None:
+            return
+        stage, outermost, before = token
+        stack = getattr(self._local, 'stages', None)
+        if stack:
+            stack.pop()
+        if not outermost or not tracemalloc.is_tracing():
+            return
+        growth = tracemalloc.get_traced_memory()[0] - before
+        with self._lock:
+            entry = self._stage_growth.setdefault(stage, {"calls": 0, "net_bytes": 0, "max_bytes": 0})
+            entry["calls"] += 1
+            entry["net_bytes"] += growth
+            if growth > entry["max_bytes"]:
+                entry["max_bytes"] = growth
+
+    def snapshot(self, limit=20, group_by='lineno'):
+        """Compare a fresh snapshot with the previous one and make it the new baseline"""
+        if group_by not in ('lineno', 'traceback', 'filename'):
+            raise ValueError("group_by must be 'lineno', 'traceback' or 'filename'")
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise TrackerInactive("Allocation tracking is not running")
+            previous, previous_time = self._snapshot, self._snapshot_time
+            stage_growth, self._stage_growth = self._stage_growth, {}
+
+        current = self._take_snapshot()
+        now = time.time()
+        stats = current.compare_to(previous, group_by)
+        growth = [stat for stat in stats if stat.size_diff > 0][:limit]
+        traced, peak = tracemalloc.get_traced_memory()
+
+        def stage_key(item):
+            stage = item[0]
+            return (STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER), stage)
+
+        report = {
+            "pid": os.getpid(),
+            "from": previous_time,
+            "to": now,
+            "window_s": round(now - previous_time, 3),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "total_growth_bytes": sum(stat.size_diff for stat in stats),
+            "stages": {stage: values for stage, values in sorted(stage_growth.items(), key=stage_key)},
+            "top_growth": [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size_bytes": stat.size,
+                    "count": stat.count,
+                    "traceback": stat.traceback.format(most_recent_first=True)[:12] if group_by == 'traceback' else None,
+                }
+                for stat in growth
+            ],
+        }
+        with self._lock:
+            self._snapshot, self._snapshot_time = current, now
+            self.last_report = report
+        return report
+
+    def status(self):
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            return {
+                "active": tracemalloc.is_tracing(),
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+                "traced_bytes": traced,
+                "peak_bytes": peak,
+                "baseline_at": self._snapshot_time,
+                "stages_since_baseline": {stage: dict(values) for stage, values in self._stage_growth.items()},
+            }
+
+
+# Global tracker; tracing state is per worker process
+allocation_tracker = AllocationTracker()
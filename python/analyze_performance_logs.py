@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Streaming analyzer for the performance log tree written by performance_logger.py
+(logs/performance/YYYY/MMYYYY/DDMMYYYY/performance.log).
+
+Reads the files line by line, pairs START/END lines by operation and trace ID,
+and computes p50/p95/p99 per pipeline stage per day and per hour using
+fixed-size log-scale histograms, so memory stays flat no matter how many
+months of logs are scanned. Writes a text report and a compact columnar JSON
+summary, and flags day-over-day p95 regressions.
+
+Usage:
+    python analyze_performance_logs.py
+    python analyze_performance_logs.py --log-dir logs/performance --from 2025-10-01 --to 2025-10-31
+    python analyze_performance_logs.py --report perf_report.txt --summary perf_summary.json --tolerance 0.15
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import argparse
+from datetime import datetime, date
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(__file__))
+
+from metrics import normalize_name, stage_for
+
+LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}) (\d{2}):\d{2}:\d{2} \| \w+ \| (START|END): (\S+)(?: \| (.*))?$')
+DURATION_RE = re.compile(r'"duration_ms": "?([0-9.]+)')
+TRACE_RE = re.compile(r'"trace_id": "([^"]+)"')
+DATE_FOLDER_RE = re.compile(r'^(\d{2})(\d{2})(\d{4})$')
+
+# Stages shown in the report, in pipeline order
+STAGE_ORDER = ('request', 'db_load', 'decode', 'detection', 'landmarks', 'encoding', 'liveness', 'matching', 'other')
+
+# Highlighted in the regression table
+KEY_STAGES = ('detection', 'matching')
+
+PERCENTILES = (0.50, 0.95, 0.99)
+
+
+class LogHistogram:
+    """Streaming quantile sketch with ~2% relative error and bounded size"""
+
+    GROWTH = 1.04
+    _LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = int(math.log(value) / self._LOG_GROWTH) if value > 0.001 else -1000
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index == -1000:
+                    return 0.0
+                # Midpoint of the bucket in log space
+                return min(self.GROWTH ** (index + 0.5), self.max)
+        return self.max
+
+
+def parse_date(text):
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d%m%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Invalid date: {text} (use YYYY-MM-DD)")
+
+
+def iter_log_files(log_dir, start=None, end=None):
+    """Yield (date, path) for every daily log under log_dir in chronological order"""
+    found = []
+    for root, _, files in os.walk(log_dir):
+        if 'performance.log' not in files:
+            continue
+        match = DATE_FOLDER_RE.match(os.path.basename(root))
+        if not match:
+            continue
+        day, month, year = (int(g) for g in match.groups())
+        try:
+            log_date = date(year, month, day)
+        except ValueError:
+            continue
+        if (start and log_date < start) or (end and log_date > end):
+            continue
+        found.append((log_date, os.path.join(root, 'performance.log')))
+    return sorted(found)
+
+
+class Analyzer:
+    def __init__(self, by_operation=False):
+        self.by_operation = by_operation
+        self.daily = {}
+        self.hourly = {}
+        self.lines = 0
+        self.paired = 0
+        self.unmatched_ends = 0
+        self.orphan_starts = 0
+
+    def _key_name(self, operation):
+        name, _ = normalize_name(operation)
+        return name if self.by_operation else stage_for(name)
+
+    def _record(self, day, hour, name, duration_ms):
+        for table, key in ((self.daily, (day, name)), (self.hourly, (day, hour, name))):
+            hist = table.get(key)
+            if hist is None:
+                hist = table[key] = LogHistogram()
+            hist.add(duration_ms)
+
+    def process_file(self, path):
+        # Open STARTs per (trace_id, operation); only lives for one file
+        open_starts = {}
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                self.lines += 1
+                match = LINE_RE.match(line.rstrip('\n'))
+                if not match:
+                    continue
+                day, hour, kind, operation, extra = match.groups()
+                trace = None
+                if extra:
+                    trace_match = TRACE_RE.search(extra)
+                    if trace_match:
+                        trace = trace_match.group(1)
+                key = (trace, operation)
+
+                if kind == 'START':
+                    open_starts[key] = open_starts.get(key, 0) + 1
+                    continue
+
+                pending = open_starts.get(key, 0)
+                if pending:
+                    if pending == 1:
+                        del open_starts[key]
+                    else:
+                        open_starts[key] = pending - 1
+                    self.paired += 1
+                else:
+                    self.unmatched_ends += 1
+
+                duration = DURATION_RE.search(extra or '')
+                if duration:
+                    self._record(day, hour, self._key_name(operation), float(duration.group(1)))
+
+        self.orphan_starts += sum(open_starts.values())
+
+    def rows(self, table):
+        """Flatten a histogram table into dict rows sorted by time then stage order"""
+        def order(name):
+            return STAGE_ORDER.index(name) if name in STAGE_ORDER else len(STAGE_ORDER)
+
+        rows = []
+        for key in sorted(table, key=lambda k: (k[:-1], order(k[-1]), k[-1])):
+            hist = table[key]
+            row = {
+                "day": key[0],
+                "hour": key[1] if len(key) == 3 else None,
+                "stage": key[-1],
+                "count": hist.count,
+                "mean_ms": round(hist.total / hist.count, 2),
+                "max_ms": round(hist.max, 2),
+            }
+            for q in PERCENTILES:
+                row[f"p{int(q * 100)}_ms"] = round(hist.quantile(q), 2)
+            rows.append(row)
+        return rows
+
+    def regressions(self, tolerance):
+        """Compare each stage's p95 with the previous day that has data for it"""
+        by_stage = {}
+        for (day, name), hist in sorted(self.daily.items()):
+            by_stage.setdefault(name, []).append((day, hist.quantile(0.95)))
+
+        results = []
+        for name, points in by_stage.items():
+            for (prev_day, prev_p95), (day, p95) in zip(points, points[1:]):
+                if not prev_p95:
+                    continue
+                change = (p95 - prev_p95) / prev_p95
+                results.append({
+                    "stage": name,
+                    "day": day,
+                    "previous_day": prev_day,
+                    "p95_ms": round(p95, 2),
+                    "previous_p95_ms": round(prev_p95, 2),
+                    "change": round(change, 4),
+                    "regression": change > tolerance,
+                })
+        return sorted(results, key=lambda r: (r["day"], r["stage"]))
+
+
+def columnar(rows):
+    """Turn a list of dict rows into {column: [values...]} for a compact summary file"""
+    if not rows:
+        return {"columns": [], "rows": 0}
+    columns = list(rows[0].keys())
+    summary = {"columns": columns, "rows": len(rows)}
+    for column in columns:
+        summary[column] = [row[column] for row in rows]
+    return summary
+
+
+def format_report(analyzer, files, tolerance, show_hourly):
+    out = []
+    label = "Operation" if analyzer.by_operation else "Stage"
+    out.append("=" * 90)
+    out.append(" " * 25 + "PERFORMANCE LOG ANALYSIS")
+    out.append("=" * 90)
+    if files:
+        out.append(f"Files: {len(files)} ({files[0][0]} to {files[-1][0]})")
+    out.append(f"Lines read: {analyzer.lines}   START/END pairs: {analyzer.paired}   "
+               f"Unmatched END: {analyzer.unmatched_ends}   Orphan START: {analyzer.orphan_starts}")
+
+    header = f"{label:<28} {'Count':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'Max ms':>10}"
+
+    def table(rows, key_name):
+        current = None
+        for row in rows:
+            group = row["day"] if key_name == "day" else f"{row['day']} {row['hour']}:00"
+            if group != current:
+                current = group
+                out.append("")
+                out.append(f"[{group}]")
+                out.append(header)
+                out.append("-" * 90)
+            out.append(f"{row['stage']:<28} {row['count']:>8} {row['p50_ms']:>10.2f} {row['p95_ms']:>10.2f} "
+                       f"{row['p99_ms']:>10.2f} {row['max_ms']:>10.2f}")
+
+    out.append("")
+    out.append("DAILY PERCENTILES")
+    table(analyzer.rows(analyzer.daily), "day")
+
+    if show_hourly:
+        out.append("")
+        out.append("HOURLY PERCENTILES")
+        table(analyzer.rows(analyzer.hourly), "hour")
+
+    out.append("")
+    out.append(f"DAY-OVER-DAY p95 CHANGES (regression threshold +{tolerance * 100:.0f}%)")
+    out.append("-" * 90)
+    regressions = analyzer.regressions(tolerance)
+    if not regressions:
+        out.append("Not enough days of data to compare")
+    for r in regressions:
+        marker = "▲ REGRESSION" if r["regression"] else ("▼ faster" if r["change"] < -tolerance else "")
+        key = " *" if r["stage"] in KEY_STAGES else ""
+        out.append(f"{r['day']} {r['stage'] + key:<28} {r['previous_p95_ms']:>10.2f} -> {r['p95_ms']:>10.2f} ms "
+                   f"({r['change'] * 100:+6.1f}%) {marker}")
+    out.append("=" * 90)
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze performance logs with per-stage percentiles')
+    parser.add_argument('--log-dir', default='logs/performance', help='Root of the dated performance log tree')
+    parser.add_argument('--from', dest='start', type=parse_date, help='First day to include (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', type=parse_date, help='Last day to include (YYYY-MM-DD)')
+    parser.add_argument('--by-operation', action='store_true', help='Group by operation name instead of stage')
+    parser.add_argument('--hourly', action='store_true', help='Include the per-hour tables in the text report')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative p95 increase flagged as a regression')
+    parser.add_argument('--report', help='Write the text report to this file as well as stdout')
+    parser.add_argument('--summary', default='performance_summary.json', help='Columnar JSON summary output path')
+    args = parser.parse_args()
+
+    files = iter_log_files(args.log_dir, args.start, args.end)
+    if not files:
+        print(f"No performance.log files found under {args.log_dir}")
+        sys.exit(1)
+
+    analyzer = Analyzer(by_operation=args.by_operation)
+    for _, path in files:
+        analyzer.process_file(path)
+
+    report = format_report(analyzer, files, args.tolerance, args.hourly)
+    print(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+
+    summary = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "log_dir": args.log_dir,
+        "grouping": "operation" if args.by_operation else "stage",
+        "daily": columnar(analyzer.rows(analyzer.daily)),
+        "hourly": columnar(analyzer.rows(analyzer.hourly)),
+        "regressions": columnar(analyzer.regressions(args.tolerance)),
+    }
+    with open(args.summary, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, separators=(',', ':'))
+    print(f"\nSummary written to {args.summary}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Attendance Queue Module
+Write-behind queue for attendance recorded by /recognize-and-record.
+
+The request thread appends each confident match (with its face crop) as one
+JSON line to a per-process journal and returns immediately. A background
+writer reads the journal in batches, writes the face crops into
+backend/uploads/attendance/..., applies the batch to Postgres in a single
+transaction (attendance_recorder.apply_face_events) and then advances the
+journal's offset file. If the database is unreachable the batch stays in the
+journal and is retried with backoff, so a short outage delays attendance but
+never loses it.
+
+Layout under the queue directory:
+    events-<pid>.jsonl       journal of the running worker
+    events-<pid>.offset      bytes of the journal already applied
+    recovered-<pid>-<owner>.jsonl/.offset
+                             journal of a dead worker claimed by <owner>
+    rejected.jsonl           events the database refused (e.g. deleted staff)
+
+Delivery is at-least-once: a crash between the commit and the offset update
+replays that batch, which apply_face_events treats as a no-op because events
+carry their scan time.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import logging
+import threading
+from datetime import datetime
+
+import psutil
+import psycopg2
+
+from attendance_recorder import apply_face_events, attendance_image_path
+
+logger = logging.getLogger(__name__)
+
+_JOURNAL_RE = re.compile(r'^events-(\d+)\.jsonl$')
+_RECOVERED_RE = re.compile(r'^recovered-(\d+)-(\d+)\.jsonl$')
+
+# How often the writer looks for journals left behind by dead workers
+ORPHAN_SCAN_INTERVAL_SECONDS = 60
+MAX_RETRY_DELAY_SECONDS = 60
+
+
+class AttendanceQueue:
+    def __init__(self, directory, backend_root, connection_factory, batch_size=50, flush_interval=1.0):
+        self.directory = directory
+        self.backend_root = backend_root
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueued = 0
+        self.applied = 0
+        self.ignored = 0
+        self.failures = 0
+        self.skipped_lines = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._journal = None
+        self._writer = None
+        self._writer_pid = None
+
+    def _own_journal(self):
+        return os.path.join(self.directory, f"events-{os.getpid()}.jsonl")
+
+    def start(self):
+        """Start this process's writer (idempotent; called again after fork)"""
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # A handle inherited from the master would write into the master's journal
+            self._journal = open(self._own_journal(), 'ab')
+            self._wake = threading.Event()
+            self._stop = threading.Event()
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._write_loop, name="attendance-queue-writer", daemon=True)
+            self._writer.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the writer (before forking); unapplied events stay in the journal"""
+        writer = self._writer
+        if writer is None or self._writer_pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        writer.join(timeout)
+        with self._lock:
+            self._journal.close()
+            self._writer = None
+
+    def enqueue(self, staff_id, confidence, crop_jpeg=None):
+        """Journal one scan and return its event; the database write happens later"""
+        self.start()
+        event = {
+            "event_id": uuid.uuid4().hex,
+            "staff_id": staff_id,
+            "ts": time.time(),
+            "confidence": confidence,
+            "image": attendance_image_path(staff_id, datetime.now()) if crop_jpeg else None,
+        }
+        line = dict(event, image_b64=base64.b64encode(crop_jpeg).decode('ascii') if crop_jpeg else None)
+        data = (json.dumps(line, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            self._journal.write(data)
+            # Into the OS cache, so the event survives a crash of this process
+            self._journal.flush()
+            self.enqueued += 1
+        self._wake.set()
+        return event
+
+    # --- writer thread -------------------------------------------------
+
+    def _write_loop(self):
+        delay = self.flush_interval
+        next_orphan_scan = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                if time.time() >= next_orphan_scan:
+                    self._claim_orphans()
+                    next_orphan_scan = time.time() + ORPHAN_SCAN_INTERVAL_SECONDS
+                for journal in self._recovered_journals():
+                    if self._drain(journal, final=True):
+                        self._remove(journal)
+                if self._drain(self._own_journal()):
+                    self._compact()
+                delay = self.flush_interval
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(MAX_RETRY_DELAY_SECONDS, max(delay, self.flush_interval) * 2)
+                logger.warning(f"Attendance queue flush failed, retrying in {delay:.0f}s: {e}")
+
+    def _drain(self, journal, final=False):
+        """
+        Apply every complete line of a journal; True once it is fully applied.
+        A final journal gets no more writes, so a torn last line is dropped.
+        """
+        offset = self._read_offset(journal)
+        if offset > os.path.getsize(journal):
+            # Left over from a compaction cut short after the truncate; the
+            # lines it counted are gone, so everything in the file is new
+            offset = 0
+        with open(journal, 'rb') as f:
+            f.seek(offset)
+            while True:
+                events, consumed = self._read_batch(f)
+                if not consumed:
+                    break
+                if events:
+                    self._apply(events)
+                offset += consumed
+                self._write_offset(journal, offset)
+        if offset >= os.path.getsize(journal):
+            return True
+        if final:
+            self.skipped_lines += 1
+            return True
+        return False
+
+    def _read_batch(self, f):
+        """Up to batch_size events and the bytes they span; a torn last line is left for later"""
+        events = []
+        consumed = 0
+        while len(events) < self.batch_size:
+            start = f.tell()
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                f.seek(start)
+                break
+            consumed += len(line)
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                self.skipped_lines += 1
+        return events, consumed
+
+    def _apply(self, events):
+        try:
+            with self.connection_factory() as conn:
+                results = apply_face_events(conn, events, self._write_image)
+        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+            # One bad event must not block the queue: isolate it and set it aside
+            if len(events) > 1:
+                for event in events:
+                    self._apply([event])
+                return
+            self._reject(events[0], e)
+            return
+        for event, action in results:
+            if action == "ignored":
+                self.ignored += 1
+            else:
+                self.applied += 1
+                logger.info(f"Attendance {action} for staff {event['staff_id']} (queued {event['event_id']})")
+
+    def _reject(self, event, error):
+        self.rejected += 1
+        logger.error(f"Attendance event {event.get('event_id')} for staff {event.get('staff_id')} rejected: {error}")
+        record = dict(event, error=str(error), image_b64=None)
+        with open(os.path.join(self.directory, 'rejected.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def _write_image(self, event):
+        if not event.get("image_b64"):
+            return
+        path = os.path.join(self.backend_root, *event["image"].split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(base64.b64decode(event["image_b64"]))
+        os.replace(tmp, path)
+
+    def _compact(self):
+        # Start the journal over once everything in it is applied
+        journal = self._own_journal()
+        with self._lock:
+            if os.path.getsize(journal) == self._read_offset(journal) > 0:
+                # Offset first: a crash in between replays applied events
+                # (re-applying them changes nothing) instead of skipping new ones
+                self._write_offset(journal, 0)
+                self._journal.truncate(0)
+
+    @staticmethod
+    def _offset_path(journal):
+        return journal[:-len('.jsonl')] + '.offset'
+
+    def _read_offset(self, journal):
+        try:
+            with open(self._offset_path(journal), 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, journal, offset):
+        path = self._offset_path(journal)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+        os.replace(tmp, path)
+
+    def _remove(self, journal):
+        for path in (journal, self._offset_path(journal)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _recovered_journals(self):
+        me = str(os.getpid())
+        journals = []
+        for name in sorted(os.listdir(self.directory)):
+            m = _RECOVERED_RE.match(name)
+            if m and m.group(2) == me:
+                journals.append(os.path.join(self.directory, name))
+        return journals
+
+    def _claim_orphans(self):
+        """Take over journals whose worker (or previous claimer) is no longer running"""
+        me = os.getpid()
+        for name in os.listdir(self.directory):
+            m = _JOURNAL_RE.match(name)
+            if m:
+                original, owner = int(m.group(1)), int(m.group(1))
+            else:
+                m = _RECOVERED_RE.match(name)
+                if not m:
+                    continue
+                original, owner = int(m.group(1)), int(m.group(2))
+            if owner == me or psutil.pid_exists(owner):
+                continue
+            source = os.path.join(self.directory, name)
+            target = os.path.join(self.directory, f"recovered-{original}-{me}.jsonl")
+            try:
+                # Rename is atomic, so only one surviving worker wins the journal
+                os.rename(source, target)
+            except OSError:
+                continue
+            if os.path.exists(self._offset_path(source)):
+                os.replace(self._offset_path(source), self._offset_path(target))
+            self.recovered += 1
+            logger.info(f"Recovered attendance journal of worker {original} ({name})")
+
+    def stats(self):
+        pending_bytes = 0
+        try:
+            journals = [self._own_journal()] + self._recovered_journals()
+            for journal in journals:
+                if os.path.exists(journal):
+                    size = os.path.getsize(journal)
+                    offset = self._read_offset(journal)
+                    pending_bytes += size - offset if offset <= size else size
+        except OSError:
+            pass
+        return {
+            "directory": self.directory,
+            "enqueued": self.enqueued,
+            "applied": self.applied,
+            "ignored": self.ignored,
+            "failures": self.failures,
+            "skipped_lines": self.skipped_lines,
+            "rejected": self.rejected,
+            "recovered_journals": self.recovered,
+            "pending_bytes": pending_bytes,
+            "last_error": self.last_error,
+        }
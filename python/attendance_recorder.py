@@ -0,0 +1,229 @@
+"""
+Attendance Recorder Module
+Records a face check-in/check-out straight from the recognizer, following the
+same daily rules as the backend's POST /api/attendance/face-event:
+  - no attendance today            -> check in
+  - checked in, no check-out yet   -> check out once 5 minutes have passed,
+                                      otherwise ignore
+  - already checked out            -> move check-out to this scan
+Face captures are stored under backend/uploads/attendance/YYYY/MMYYYY/DDMMYYYY
+with the backend's file naming, so the admin pages show them unchanged.
+"""
+import io
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+
+from PIL import Image
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Same as the backend's fiveMinutesMs
+MIN_CHECKOUT_INTERVAL_SECONDS = 5 * 60
+
+# Context kept around the detected face box, as a fraction of the box size
+CROP_MARGIN = 0.5
+CROP_JPEG_QUALITY = 90
+
+
+def crop_face_jpeg(img_array, bbox):
+    """JPEG bytes of the face region (left, top, right, bottom) plus a margin"""
+    left, top, right, bottom = bbox
+    height, width = img_array.shape[:2]
+    pad_x = int((right - left) * CROP_MARGIN)
+    pad_y = int((bottom - top) * CROP_MARGIN)
+    region = img_array[max(0, top - pad_y):min(height, bottom + pad_y),
+                       max(0, left - pad_x):min(width, right + pad_x)]
+    buf = io.BytesIO()
+    Image.fromarray(region).save(buf, format='JPEG', quality=CROP_JPEG_QUALITY)
+    return buf.getvalue()
+
+
+def attendance_image_path(staff_id, now):
+    """Relative path stored in the database, matching the backend's multer layout"""
+    year = f"{now.year:04d}"
+    month_folder = f"{now.month:02d}{year}"
+    date_folder = f"{now.day:02d}{month_folder}"
+    filename = f"attendance-{staff_id}-{int(time.time() * 1000)}.jpg"
+    return '/'.join(('uploads', 'attendance', year, month_folder, date_folder, filename))
+
+
+def _row_to_dict(cur, row):
+    record = {}
+    for column, value in zip((d[0] for d in cur.description), row):
+        record[column] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return record
+
+
+def record_face_event(conn, staff_id, confidence, crop_jpeg, backend_root):
+    """
+    Apply one recognised scan inside a single transaction on conn.
+    Returns (action, attendance_row); action is checked_in, checked_out,
+    checked_out_updated or ignored. The capture is written only when a row
+    changes and is removed again if the transaction fails.
+    """
+    cur = conn.cursor()
+    image_file = None
+    try:
+        # Serialise scans of the same person so two kiosks cannot both check them in
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"attendance:{staff_id}",))
+        cur.execute(
+            """
+            SELECT NOW(), CURRENT_DATE, a.attendance_id, a.check_in_time, a.check_out_time,
+                   a.check_in_time IS NOT NULL AND NOW() - a.check_in_time >= make_interval(secs => %s)
+            FROM (SELECT 1) AS one
+            LEFT JOIN LATERAL (
+                SELECT attendance_id, check_in_time, check_out_time
+                FROM attendance
+                WHERE staff_id = %s AND date = CURRENT_DATE
+                ORDER BY attendance_id DESC
+                LIMIT 1
+            ) AS a ON TRUE
+            """,
+            (MIN_CHECKOUT_INTERVAL_SECONDS, staff_id),
+        )
+        now, today, attendance_id, check_in_time, check_out_time, interval_elapsed = cur.fetchone()
+
+        if attendance_id is not None and check_out_time is None and not interval_elapsed:
+            cur.execute("SELECT * FROM attendance WHERE attendance_id = %s", (attendance_id,))
+            row = _row_to_dict(cur, cur.fetchone())
+            conn.commit()
+            return "ignored", row
+
+        # Folder date follows the local clock, like the backend's multer storage
+        relative_path = attendance_image_path(staff_id, datetime.now())
+        if crop_jpeg:
+            image_file = os.path.join(backend_root, *relative_path.split('/'))
+            os.makedirs(os.path.dirname(image_file), exist_ok=True)
+            with open(image_file, 'wb') as f:
+                f.write(crop_jpeg)
+        else:
+            relative_path = None
+
+        if attendance_id is None:
+            action = "checked_in"
+            cur.execute(
+                """
+                INSERT INTO attendance (staff_id, check_in_time, date, status, check_in_face_image_path, check_in_confidence_score)
+                VALUES (%s, NOW(), %s, 'present', %s, %s) RETURNING *
+                """,
+                (staff_id, today, relative_path, confidence),
+            )
+        else:
+            action = "checked_out" if check_out_time is None else "checked_out_updated"
+            cur.execute(
+                """
+                UPDATE attendance
+                SET check_out_time = NOW(), check_out_face_image_path = %s, check_out_confidence_score = %s
+                WHERE attendance_id = %s RETURNING *
+                """,
+                (relative_path, confidence, attendance_id),
+            )
+        row = _row_to_dict(cur, cur.fetchone())
+        conn.commit()
+        logger.info(f"Attendance {action} for staff {staff_id} on {today} with face image: {relative_path}")
+        return action, row
+    except Exception:
+        conn.rollback()
+        if image_file and os.path.exists(image_file):
+            os.remove(image_file)
+        raise
+    finally:
+        cur.close()
+
+
+def apply_face_events(conn, events, write_image=None):
+    """
+    Apply a batch of queued scans (see attendance_queue.py) in one transaction.
+    Each event carries its own scan time, so the rules above are evaluated as
+    of the scan rather than the flush, and re-applying an already committed
+    batch changes nothing. write_image(event) is called for every event that
+    changes a row, before the commit. Returns [(event, action)].
+    """
+    if not events:
+        return []
+    events = sorted(events, key=lambda e: e["ts"])
+    for event in events:
+        event["_at"] = datetime.fromtimestamp(event["ts"])
+    min_interval = timedelta(seconds=MIN_CHECKOUT_INTERVAL_SECONDS)
+    staff_ids = sorted({e["staff_id"] for e in events})
+    keys = sorted({(e["staff_id"], e["_at"].date()) for e in events})
+
+    cur = conn.cursor()
+    try:
+        # Same per-person lock as record_face_event, taken in a fixed order
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('attendance:' || s)) FROM (SELECT unnest(%s::text[]) AS s ORDER BY 1) AS ids",
+            (staff_ids,),
+        )
+        cur.execute(
+            """
+            SELECT DISTINCT ON (staff_id, date) staff_id, date, attendance_id, check_in_time, check_out_time
+            FROM attendance
+            WHERE (staff_id, date) IN (SELECT * FROM unnest(%s::varchar[], %s::date[]))
+            ORDER BY staff_id, date, attendance_id DESC
+            """,
+            ([k[0] for k in keys], [k[1] for k in keys]),
+        )
+        state = {
+            (staff_id, date): {"attendance_id": attendance_id, "check_in": check_in, "check_out": check_out}
+            for staff_id, date, attendance_id, check_in, check_out in cur.fetchall()
+        }
+
+        results = []
+        for event in events:
+            key = (event["staff_id"], event["_at"].date())
+            at = event["_at"]
+            row = state.get(key)
+            if row is None:
+                row = state[key] = {"attendance_id": None, "check_in": at, "check_out": None,
+                                    "check_in_image": event.get("image"), "check_in_confidence": event.get("confidence")}
+                action = "checked_in"
+            elif row["check_out"] is None:
+                if row["check_in"] is None or at - row["check_in"] < min_interval:
+                    results.append((event, "ignored"))
+                    continue
+                action = "checked_out"
+            elif at > row["check_out"]:
+                action = "checked_out_updated"
+            else:
+                results.append((event, "ignored"))
+                continue
+            if action != "checked_in":
+                row.update(check_out=at, check_out_image=event.get("image"),
+                           check_out_confidence=event.get("confidence"), dirty=True)
+            if write_image is not None and event.get("image"):
+                write_image(event)
+            results.append((event, action))
+
+        inserts = [(staff_id, row["check_in"], date, row["check_in_image"], row["check_in_confidence"],
+                    row["check_out"], row.get("check_out_image"), row.get("check_out_confidence"))
+                   for (staff_id, date), row in state.items() if row["attendance_id"] is None]
+        updates = [(row["attendance_id"], row["check_out"], row["check_out_image"], row["check_out_confidence"])
+                   for row in state.values() if row["attendance_id"] is not None and row.get("dirty")]
+        if inserts:
+            execute_values(cur, """
+                INSERT INTO attendance (staff_id, check_in_time, date, status, check_in_face_image_path,
+                    check_in_confidence_score, check_out_time, check_out_face_image_path, check_out_confidence_score)
+                VALUES %s
+            """, inserts, template="(%s, %s, %s, 'present', %s::varchar, %s::numeric, %s::timestamp, %s::varchar, %s::numeric)")
+        if updates:
+            execute_values(cur, """
+                UPDATE attendance AS a
+                SET check_out_time = v.check_out_time,
+                    check_out_face_image_path = v.image_path,
+                    check_out_confidence_score = v.confidence
+                FROM (VALUES %s) AS v(attendance_id, check_out_time, image_path, confidence)
+                WHERE a.attendance_id = v.attendance_id
+            """, updates, template="(%s, %s::timestamp, %s::varchar, %s::numeric)")
+        conn.commit()
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        for event in events:
+            event.pop("_at", None)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the recognizer's hot paths.
+
+Times each pipeline stage in isolation, with no database or HTTP server:
+    - gallery decode: JSON text -> preallocated float64 matrix, as load_known_faces does,
+      for synthetic galleries of 1k / 10k / 100k identities
+    - image decode through the frame buffer pool
+    - HOG (or CNN) detection at several resolutions
+    - landmark extraction and encoding on the detected face
+    - face_distance matching against each synthetic gallery
+    - the liveness checks (blink, head movement, face quality)
+
+Results are written as JSON. When a baseline file from an earlier run is
+given, every benchmark's median is compared with it and anything slower
+than the tolerance is flagged as a regression.
+
+Usage:
+    python benchmark_recognizer.py --images test_images
+    python benchmark_recognizer.py --images test_images --output bench_new.json --baseline bench_old.json --tolerance 0.15
+    python benchmark_recognizer.py --gallery-sizes 1000,10000 --resolutions 480,720 --repeat 20 --fail-on-regression
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(__file__))
+
+import face_recognition
+
+from config import config
+from frame_pool import FramePool
+from gallery_matrix import GalleryMatrix
+from liveness import is_blinking, has_head_movement, detect_face_quality, landmarks_from_shape
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Frames per request in the liveness flow
+LIVENESS_FRAMES = 5
+
+# Used when no test images are given or no face is found in them
+SYNTHETIC_IMAGE_SIZE = 480
+
+
+def time_call(fn, repeat, warmup):
+    """Run fn warmup + repeat times and return per-call timings in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings, **extra):
+    values = np.array(timings)
+    return {
+        "runs": len(timings),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+        **extra,
+    }
+
+
+def synthetic_gallery(size, seed=0):
+    """Random unit-norm 128-d encodings serialized the way the staff table stores them"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(size, 128))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [json.dumps(vector.tolist()) for vector in vectors]
+
+
+def decode_gallery(rows):
+    """Decode straight into a preallocated matrix, as load_known_faces does with the row count"""
+    gallery = GalleryMatrix(len(rows))
+    for text in rows:
+        arr = np.array(json.loads(text), dtype='float64')
+        if arr.shape == (128,):
+            gallery.append(arr)
+    return gallery.finish()
+
+
+def load_test_images(images_dir, limit):
+    """Return the raw bytes of up to `limit` test images, or a synthetic frame"""
+    blobs = []
+    if images_dir:
+        for name in sorted(os.listdir(images_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(images_dir, name), 'rb') as f:
+                    blobs.append((name, f.read()))
+            if len(blobs) >= limit:
+                break
+    if not blobs:
+        rng = np.random.default_rng(1)
+        frame = rng.integers(0, 255, (SYNTHETIC_IMAGE_SIZE, SYNTHETIC_IMAGE_SIZE, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(frame).save(buffer, format='JPEG', quality=90)
+        blobs.append(('synthetic', buffer.getvalue()))
+    return blobs
+
+
+def resize_longest(image, longest):
+    height, width = image.shape[:2]
+    scale = longest / max(height, width)
+    if scale == 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+
+def largest_face_or_center(image, model):
+    faces = face_recognition.face_locations(image, model=model)
+    if faces:
+        return max(faces, key=lambda face: (face[2] - face[0]) * (face[1] - face[3])), True
+    height, width = image.shape[:2]
+    side = min(height, width) // 2
+    top, left = (height - side) // 2, (width - side) // 2
+    return (top, left + side, top + side, left), False
+
+
+def run_suite(args):
+    results = {}
+    detection_model = args.detection_model or config.service.face_detection_model
+    encoding_model = args.encoding_model or config.service.face_encoding_model
+    pool = FramePool()
+
+    def record(name, timings, **extra):
+        results[name] = summarize(timings, **extra)
+        r = results[name]
+        print(f"  {name:<40} p50 {r['p50_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms   ({r['runs']} runs)")
+
+    print("\nImage decode")
+    blobs = load_test_images(args.images, args.max_images)
+    for name, blob in blobs:
+        def decode():
+            pool.release(pool.decode(blob))
+        record(f"image_decode[{name}]", time_call(decode, args.repeat, args.warmup), bytes=len(blob))
+
+    image = pool.decode(blobs[0][1]).copy()
+
+    print(f"\nDetection ({detection_model}, upsample {args.upsample})")
+    for longest in args.resolutions:
+        scaled = resize_longest(image, longest)
+        def detect():
+            face_recognition.face_locations(scaled, number_of_times_to_upsample=args.upsample, model=detection_model)
+        record(f"detection_{detection_model}[{longest}px]", time_call(detect, args.repeat, args.warmup),
+               shape=list(scaled.shape[:2]))
+
+    box, detected = largest_face_or_center(image, detection_model)
+    if not detected:
+        print("  (no face detected in the first image; landmarks/encoding use a centered box)")
+
+    print(f"\nLandmarks and encoding ({encoding_model}, jitters {args.jitters})")
+    record("landmarks", time_call(lambda: face_recognition.face_landmarks(image, [box]), args.repeat, args.warmup),
+           face_detected=detected)
+    encoding = None
+    def encode():
+        nonlocal encoding
+        encoding = face_recognition.face_encodings(image, [box], num_jitters=args.jitters, model=encoding_model)[0]
+    record(f"encoding_{encoding_model}", time_call(encode, args.repeat, args.warmup), face_detected=detected)
+
+    print("\nGallery decode and matching")
+    for size in args.gallery_sizes:
+        rows = synthetic_gallery(size)
+        repeat = max(1, args.repeat * 1000 // max(size, 1000))
+        gallery = None
+        def decode():
+            nonlocal gallery
+            gallery = decode_gallery(rows)
+        record(f"gallery_decode[{size}]", time_call(decode, repeat, 0), identities=size)
+        record(f"face_distance[{size}]", time_call(lambda: face_recognition.face_distance(gallery, encoding), args.repeat, args.warmup),
+               identities=size)
+        del rows, gallery
+
+    print("\nLiveness")
+    landmarks = landmarks_from_shape(face_recognition.api._raw_face_landmarks(image, [box], model="large")[0])
+    landmarks_frames = np.repeat(landmarks[np.newaxis], LIVENESS_FRAMES, axis=0)
+    locations = [(box[0] + i * 4, box[1] + i * 4, box[2] + i * 4, box[3] + i * 4) for i in range(LIVENESS_FRAMES)]
+    liveness_repeat = args.repeat * 10
+    record("liveness_blink", time_call(lambda: is_blinking(landmarks_frames), liveness_repeat, args.warmup), frames=LIVENESS_FRAMES)
+    record("liveness_head_movement", time_call(lambda: has_head_movement(locations), liveness_repeat, args.warmup), frames=LIVENESS_FRAMES)
+    record("liveness_face_quality", time_call(lambda: detect_face_quality(landmarks, box), liveness_repeat, args.warmup))
+
+    return results, {"detection_model": detection_model, "encoding_model": encoding_model}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Compare medians with a previous run; returns rows for every shared benchmark"""
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        change = (current["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"]
+        rows.append({
+            "benchmark": name,
+            "baseline_p50_ms": previous["p50_ms"],
+            "p50_ms": current["p50_ms"],
+            "change": round(change, 4),
+            "regression": change > tolerance,
+        })
+    return rows
+
+
+def parse_int_list(text):
+    try:
+        return [int(value) for value in text.split(',') if value.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected comma-separated integers, got: {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recognizer pipeline stages offline')
+    parser.add_argument('--images', help='Directory of test images (a synthetic frame is used if omitted)')
+    parser.add_argument('--max-images', type=int, default=5, help='Number of test images to decode')
+    parser.add_argument('--gallery-sizes', type=parse_int_list, default=[1000, 10000, 100000], help='Synthetic gallery sizes')
+    parser.add_argument('--resolutions', type=parse_int_list, default=[320, 480, 640, 960], help='Longest image side for detection runs')
+    parser.add_argument('--detection-model', choices=['hog', 'cnn'], help='Defaults to FACE_DETECTION_MODEL')
+    parser.add_argument('--encoding-model', choices=['small', 'large'], help='Defaults to FACE_ENCODING_MODEL')
+    parser.add_argument('--jitters', type=int, default=config.service.face_jitters, help='num_jitters for encoding')
+    parser.add_argument('--upsample', type=int, default=1, help='number_of_times_to_upsample for detection')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before each benchmark')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results output path')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Relative p50 slowdown flagged as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 if any regression is flagged')
+    args = parser.parse_args()
+
+    print("=" * 90)
+    print(" " * 28 + "RECOGNIZER BENCHMARK")
+    print("=" * 90)
+    results, models = run_suite(args)
+
+    output = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "face_recognition": getattr(face_recognition, '__version__', 'unknown'),
+        },
+        "settings": {
+            **models,
+            "jitters": args.jitters,
+            "upsample": args.upsample,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "gallery_sizes": args.gallery_sizes,
+            "resolutions": args.resolutions,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparison = compare_with_baseline(results, baseline, args.tolerance)
+        regressions = [row for row in comparison if row["regression"]]
+        output["baseline"] = {"path": args.baseline, "tolerance": args.tolerance, "comparison": comparison}
+
+        print("\n" + "-" * 90)
+        print(f"Baseline comparison against {args.baseline} (regression threshold +{args.tolerance * 100:.0f}%)")
+        print("-" * 90)
+        for row in comparison:
+            marker = "▲ REGRESSION" if row["regression"] else ("▼ faster" if row["change"] < -args.tolerance else "")
+            print(f"{row['benchmark']:<40} {row['baseline_p50_ms']:>10.3f} -> {row['p50_ms']:>10.3f} ms "
+                  f"({row['change'] * 100:+6.1f}%) {marker}")
+        if baseline.get("settings") and baseline["settings"] != output["settings"]:
+            print("\n⚠️  Baseline was recorded with different settings; comparisons may not be like for like")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print("\n" + "=" * 90)
+    print(f"Results written to {args.output}")
+    if regressions:
+        print(f"❌ {len(regressions)} benchmark(s) regressed beyond {args.tolerance * 100:.0f}%")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
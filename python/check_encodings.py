@@ -2,17 +2,40 @@
 """
 Quick script to check face encoding status in database.
 
+With --analyze it also loads every stored encoding and audits the gallery.
+It reports:
+  - corrupt vectors: unparsable JSON, wrong length, NaN/Inf, or a norm far
+    from the rest of the gallery
+  - near-duplicate and look-alike staff pairs closer than the match
+    threshold; these identities compete for the same probes
+  - the impostor (staff-to-other-staff) distance distribution and the pair
+    false accept rate at candidate thresholds, for calibrating
+    FACE_DISTANCE_THRESHOLD
+
+The staff-by-staff distance matrix is computed in --block-size square tiles
+and never held whole, so memory stays at a few tiles plus the N x 128 gallery
+(about 50 MB for 50k staff).
+
 Usage:
     python check_encodings.py
+    python check_encodings.py --analyze
+    python check_encodings.py --analyze --threshold 0.5 --block-size 4096 --output gallery_report.json
 """
 
 import os
 import sys
+import json
+import time
 import logging
+import argparse
+from datetime import datetime
+
+import numpy as np
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(__file__))
 
+from config import config
 from recognizer_service import get_db_conn
 
 # Configure logging
@@ -100,8 +123,329 @@ def check_encoding_status():
         sys.exit(1)
 
 
-if __name__ == '__main__':
+ENCODING_DIMENSIONS = 128
+
+# Impostor histogram covers [0, HISTOGRAM_MAX) in HISTOGRAM_BINS bins; larger distances go in the last bin
+HISTOGRAM_MAX = 2.0
+HISTOGRAM_BINS = 400
+
+CANDIDATE_THRESHOLDS = (0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65)
+
+
+def parse_encoding(face_encoding_text):
+    """Return (vector, None) or (None, reason) for a stored face_encoding"""
+    try:
+        values = json.loads(face_encoding_text)
+        arr = np.array(values, dtype='float64')
+    except (ValueError, TypeError) as e:
+        return None, f"unparsable ({type(e).__name__})"
+    if arr.ndim != 1 or arr.shape[0] != ENCODING_DIMENSIONS:
+        return None, f"wrong shape {arr.shape}, expected ({ENCODING_DIMENSIONS},)"
+    if not np.all(np.isfinite(arr)):
+        return None, f"{int(np.sum(~np.isfinite(arr)))} NaN/Inf values"
+    return arr, None
+
+
+def load_gallery():
+    """Stream stored encodings; returns (staff_ids, names, matrix, corrupt)"""
+    batch_size = config.service.gallery_fetch_batch_size
+    staff_ids, names, vectors, corrupt = [], [], [], []
+    with get_db_conn() as conn:
+        cur = conn.cursor(name="check_encodings_gallery")
+        cur.itersize = batch_size
+        cur.execute("""
+            SELECT staff_id, full_name, face_encoding
+            FROM staff
+            WHERE is_active = TRUE
+            AND face_encoding IS NOT NULL
+            AND face_encoding != ''
+            ORDER BY staff_id
+        """)
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            for staff_id, full_name, face_encoding_text in batch:
+                arr, reason = parse_encoding(face_encoding_text)
+                if arr is None:
+                    corrupt.append((staff_id, full_name, reason))
+                    continue
+                staff_ids.append(staff_id)
+                names.append(full_name)
+                vectors.append(arr)
+        cur.close()
+        conn.commit()
+    matrix = np.vstack(vectors) if vectors else np.empty((0, ENCODING_DIMENSIONS), dtype='float64')
+    return staff_ids, names, matrix, corrupt
+
+
+def norm_outliers(matrix, max_deviations):
+    """Indices whose L2 norm is more than max_deviations robust deviations from the median"""
+    norms = np.linalg.norm(matrix, axis=1)
+    if len(norms) == 0:
+        return norms, np.array([], dtype=int), None, None
+    median = float(np.median(norms))
+    # Median absolute deviation, scaled to match a standard deviation
+    spread = float(np.median(np.abs(norms - median))) * 1.4826
+    if spread == 0:
+        outliers = np.nonzero(norms != median)[0]
+    else:
+        outliers = np.nonzero(np.abs(norms - median) > max_deviations * spread)[0]
+    return norms, outliers, median, spread
+
+
+def scan_pairs(matrix, threshold, block_size, max_pairs):
+    """
+    All-pairs Euclidean distances, one block_size x block_size tile at a time.
+    Returns the impostor histogram, each staff member's nearest other staff
+    (distance and index), the max_pairs closest pairs under threshold, and
+    how many pairs fell under threshold in total.
+    """
+    n = len(matrix)
+    edges = np.linspace(0.0, HISTOGRAM_MAX, HISTOGRAM_BINS + 1)
+    histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    nearest = np.full(n, np.inf)
+    nearest_index = np.full(n, -1, dtype=np.int64)
+    squared = np.einsum('ij,ij->i', matrix, matrix)
+    pair_i = np.empty(0, dtype=np.int64)
+    pair_j = np.empty(0, dtype=np.int64)
+    pair_d = np.empty(0)
+    below_threshold = 0
+
+    def keep_closest(i, j, d):
+        if len(d) <= max_pairs:
+            return i, j, d
+        keep = np.argpartition(d, max_pairs)[:max_pairs]
+        return i[keep], j[keep], d[keep]
+
+    for a0 in range(0, n, block_size):
+        a1 = min(a0 + block_size, n)
+        block_a = matrix[a0:a1]
+        for b0 in range(a0, n, block_size):
+            b1 = min(b0 + block_size, n)
+            tile = squared[a0:a1, None] + squared[None, b0:b1] - 2.0 * (block_a @ matrix[b0:b1].T)
+            np.maximum(tile, 0.0, out=tile)
+            np.sqrt(tile, out=tile)
+
+            if a0 == b0:
+                # Diagonal tile: each pair once, never a staff member against themselves
+                np.fill_diagonal(tile, np.inf)
+                rows, cols = np.triu_indices(a1 - a0, k=1)
+                values = tile[rows, cols]
+            else:
+                rows = cols = None
+                values = tile.ravel()
+
+            histogram += np.histogram(np.minimum(values, HISTOGRAM_MAX - 1e-9), bins=edges)[0]
+
+            row_min = tile.argmin(axis=1)
+            row_best = tile[np.arange(a1 - a0), row_min]
+            better = row_best < nearest[a0:a1]
+            nearest[a0:a1][better] = row_best[better]
+            nearest_index[a0:a1][better] = row_min[better] + b0
+            if a0 != b0:
+                col_min = tile.argmin(axis=0)
+                col_best = tile[col_min, np.arange(b1 - b0)]
+                better = col_best < nearest[b0:b1]
+                nearest[b0:b1][better] = col_best[better]
+                nearest_index[b0:b1][better] = col_min[better] + a0
+
+            hits = np.nonzero(values < threshold)[0]
+            if len(hits):
+                below_threshold += len(hits)
+                if rows is not None:
+                    hit_rows, hit_cols = rows[hits], cols[hits]
+                else:
+                    hit_rows, hit_cols = np.divmod(hits, b1 - b0)
+                pair_i, pair_j, pair_d = keep_closest(
+                    np.concatenate([pair_i, hit_rows + a0]),
+                    np.concatenate([pair_j, hit_cols + b0]),
+                    np.concatenate([pair_d, values[hits]]),
+                )
+            del tile, values
+
+    order = np.argsort(pair_d)
+    pairs = list(zip(pair_i[order].tolist(), pair_j[order].tolist(), pair_d[order].tolist()))
+    return histogram, edges, nearest, nearest_index, pairs, below_threshold
+
+
+def histogram_quantile(histogram, edges, q):
+    """Approximate quantile (upper bin edge) of the histogrammed distances"""
+    total = histogram.sum()
+    if total == 0:
+        return None
+    index = int(np.searchsorted(np.cumsum(histogram), q * total))
+    return float(edges[min(index + 1, len(edges) - 1)])
+
+
+def pairs_below(histogram, edges, threshold):
+    """Histogram count of distances below threshold (exact when threshold is on a bin edge)"""
+    index = int(np.searchsorted(edges, threshold, side='left'))
+    return int(histogram[:index].sum())
+
+
+def analyze_gallery(threshold, block_size=2048, max_pairs=200, duplicate_distance=0.2,
+                    norm_deviations=6.0, target_far=0.0001):
+    """Audit stored encodings and return a JSON-serialisable report"""
+    started = time.time()
+    staff_ids, names, matrix, corrupt = load_gallery()
+    norms, outliers, median_norm, norm_spread = norm_outliers(matrix, norm_deviations)
+    odd_norms = [(staff_ids[i], names[i], float(norms[i])) for i in outliers]
+
+    # Odd norms are reported but kept out of the distance statistics
+    keep = np.setdiff1d(np.arange(len(matrix)), outliers)
+    ids = [staff_ids[i] for i in keep]
+    labels = [names[i] for i in keep]
+    matrix = matrix[keep]
+    n = len(matrix)
+    loaded = time.time()
+
+    histogram, edges, nearest, nearest_index, pairs, below = scan_pairs(
+        matrix, threshold, max(1, block_size), max(1, max_pairs))
+    total_pairs = n * (n - 1) // 2
+
+    calibration = []
+    for candidate in sorted(set(CANDIDATE_THRESHOLDS) | {threshold}):
+        count = pairs_below(histogram, edges, candidate)
+        calibration.append({
+            "threshold": candidate,
+            "impostor_pairs": count,
+            "pair_far": count / total_pairs if total_pairs else None,
+            "staff_with_lookalike": int(np.sum(nearest < candidate)),
+        })
+
+    # Highest histogram edge whose pair false accept rate stays within target
+    cumulative = np.concatenate([[0], np.cumsum(histogram)])
+    within = np.nonzero(cumulative <= target_far * total_pairs)[0] if total_pairs else np.array([], dtype=int)
+    suggested = float(edges[within[-1]]) if len(within) else None
+
+    finite_nearest = nearest[np.isfinite(nearest)]
+    return {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "threshold": threshold,
+        "staff_analyzed": n,
+        "pairs_compared": total_pairs,
+        "timing_s": {"load": round(loaded - started, 2), "scan": round(time.time() - loaded, 2)},
+        "corrupt": [{"staff_id": s, "full_name": f, "reason": r} for s, f, r in corrupt],
+        "odd_norms": {
+            "median": median_norm,
+            "robust_std": norm_spread,
+            "max_deviations": norm_deviations,
+            "staff": [{"staff_id": s, "full_name": f, "norm": v} for s, f, v in odd_norms],
+        },
+        "pairs_below_threshold": below,
+        "closest_pairs": [{
+            "staff_a": ids[i], "name_a": labels[i],
+            "staff_b": ids[j], "name_b": labels[j],
+            "distance": round(d, 4),
+            "kind": "duplicate" if d < duplicate_distance else "look-alike",
+        } for i, j, d in pairs],
+        "impostor_distribution": {
+            "quantiles": {f"p{q:g}": histogram_quantile(histogram, edges, q / 100) for q in (0.01, 0.1, 1, 5, 50)},
+            "nearest_neighbour": {
+                "min": float(finite_nearest.min()) if len(finite_nearest) else None,
+                "p1": float(np.percentile(finite_nearest, 1)) if len(finite_nearest) else None,
+                "median": float(np.median(finite_nearest)) if len(finite_nearest) else None,
+            },
+            "histogram": {"bin_width": HISTOGRAM_MAX / HISTOGRAM_BINS, "counts": histogram.tolist()},
+        },
+        "calibration": calibration,
+        "target_pair_far": target_far,
+        "suggested_threshold": suggested,
+    }
+
+
+def print_analytics(report):
+    print("\n" + "="*70)
+    print(" "*22 + "GALLERY ANALYTICS REPORT")
+    print("="*70)
+    print(f"Staff analyzed: {report['staff_analyzed']}   Pairs compared: {report['pairs_compared']:,}   "
+          f"(load {report['timing_s']['load']}s, scan {report['timing_s']['scan']}s)")
+
+    corrupt = report["corrupt"]
+    odd = report["odd_norms"]["staff"]
+    print(f"\n🩺 Corrupt encodings: {len(corrupt)}   Odd norms: {len(odd)}")
+    for entry in corrupt:
+        print(f"   ❌ {entry['staff_id']:<15} {entry['full_name']:<30} {entry['reason']}")
+    if odd:
+        median = report["odd_norms"]["median"]
+        for entry in odd:
+            print(f"   ⚠️  {entry['staff_id']:<15} {entry['full_name']:<30} norm {entry['norm']:.3f} (median {median:.3f})")
+    if corrupt or odd:
+        print("   Re-encode these staff: clear face_encoding and run python populate_encodings.py")
+
+    pairs = report["closest_pairs"]
+    print(f"\n👥 Staff pairs closer than threshold {report['threshold']}: {report['pairs_below_threshold']}")
+    if pairs:
+        print("-"*70)
+        print(f"{'Distance':<10} {'Kind':<11} {'Staff A':<24} {'Staff B':<24}")
+        print("-"*70)
+        for pair in pairs:
+            print(f"{pair['distance']:<10.4f} {pair['kind']:<11} "
+                  f"{(pair['staff_a'] + ' ' + pair['name_a'])[:23]:<24} {(pair['staff_b'] + ' ' + pair['name_b'])[:23]:<24}")
+        if report["pairs_below_threshold"] > len(pairs):
+            print(f"   ... {report['pairs_below_threshold'] - len(pairs)} more (raise --max-pairs)")
+        print("   Duplicates are usually the same person enrolled twice; look-alikes compete for the same probes")
+
+    dist = report["impostor_distribution"]
+    print("\n📏 Impostor distance distribution (staff vs other staff)")
+    print("   quantiles: " + ", ".join(f"{k}={v:.3f}" for k, v in dist["quantiles"].items() if v is not None))
+    nn = dist["nearest_neighbour"]
+    if nn["min"] is not None:
+        print(f"   nearest other staff: min={nn['min']:.3f} p1={nn['p1']:.3f} median={nn['median']:.3f}")
+
+    print("\n🎯 Threshold calibration")
+    print(f"   {'Threshold':<10} {'Impostor pairs':>15} {'Pair FAR':>12} {'Staff w/ look-alike':>20}")
+    for row in report["calibration"]:
+        far = f"{row['pair_far']:.2e}" if row["pair_far"] is not None else "-"
+        marker = "  <- current" if row["threshold"] == report["threshold"] else ""
+        print(f"   {row['threshold']:<10.2f} {row['impostor_pairs']:>15} {far:>12} {row['staff_with_lookalike']:>20}{marker}")
+    if report["suggested_threshold"] is not None:
+        print(f"   Highest threshold with pair FAR <= {report['target_pair_far']:g}: {report['suggested_threshold']:.3f}")
+    print("="*70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check face encoding status and audit the stored gallery')
+    parser.add_argument('--analyze', action='store_true', help='Run duplicate, corruption and threshold analytics')
+    parser.add_argument('--threshold', type=float, default=config.service.face_distance_threshold,
+                        help='Match threshold for look-alike pairs (default: FACE_DISTANCE_THRESHOLD)')
+    parser.add_argument('--block-size', type=int, default=2048, help='Tile size of the blocked distance matrix')
+    parser.add_argument('--max-pairs', type=int, default=200, help='Closest pairs to report')
+    parser.add_argument('--duplicate-distance', type=float, default=0.2, help='Pairs below this are reported as duplicates')
+    parser.add_argument('--norm-deviations', type=float, default=6.0, help='Robust deviations from the median norm flagged as odd')
+    parser.add_argument('--target-far', type=float, default=0.0001, help='Pair false accept rate used for the suggested threshold')
+    parser.add_argument('--output', help='Write the analytics report as JSON to this file')
+    args = parser.parse_args()
+
     check_encoding_status()
+    if not args.analyze:
+        return
+
+    try:
+        report = analyze_gallery(
+            threshold=args.threshold,
+            block_size=args.block_size,
+            max_pairs=args.max_pairs,
+            duplicate_distance=args.duplicate_distance,
+            norm_deviations=args.norm_deviations,
+            target_far=args.target_far,
+        )
+    except Exception as e:
+        logger.error(f"\n❌ Error analyzing gallery: {str(e)}\n")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+    print_analytics(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}\n")
+
+
+if __name__ == '__main__':
+    main()
 
 
 
@@ -88,19 +88,70 @@ class ServiceConfig:
         self.face_distance_threshold = float(os.getenv('FACE_DISTANCE_THRESHOLD', '0.5'))  # 0.5 = 50% min confidence
         self.face_jitters = int(os.getenv('FACE_JITTERS', '1'))
         
+        # Pre-encoding quality gate (a threshold of 0 disables that check)
+        # Off until the thresholds are tuned for the site's cameras (sweep_parameters.py)
+        self.quality_gate_enabled = os.getenv('QUALITY_GATE_ENABLED', 'false').lower() == 'true'
+        self.quality_gate_min_face_size = int(os.getenv('QUALITY_GATE_MIN_FACE_SIZE', '60'))  # shorter box side, px
+        self.quality_gate_min_sharpness = float(os.getenv('QUALITY_GATE_MIN_SHARPNESS', '25'))  # Laplacian variance
+        self.quality_gate_min_pose_symmetry = float(os.getenv('QUALITY_GATE_MIN_POSE_SYMMETRY', '0.35'))  # 1 = frontal
+        
         # Cache settings (0 = keep indefinitely until manual reload)
         self.cache_ttl = int(os.getenv('CACHE_TTL_SECONDS', '0'))
         self.max_cache_size = int(os.getenv('MAX_CACHE_SIZE', '100'))
+        self.gallery_fetch_batch_size = int(os.getenv('GALLERY_FETCH_BATCH_SIZE', '500'))
         
         # Upload settings
         self.max_upload_size = int(os.getenv('MAX_UPLOAD_SIZE_MB', '10')) * 1024 * 1024  # Convert to bytes
         self.allowed_image_formats = os.getenv('ALLOWED_IMAGE_FORMATS', 'jpg,jpeg,png').split(',')
         
+        # Frame buffer pool settings (per worker)
+        self.frame_pool_max_per_shape = int(os.getenv('FRAME_POOL_MAX_PER_SHAPE', '4'))
+        self.frame_pool_max_shapes = int(os.getenv('FRAME_POOL_MAX_SHAPES', '4'))
+        
         # Logging settings
         self.log_level = os.getenv('LOG_LEVEL', 'INFO')
         self.log_file = os.getenv('LOG_FILE', 'recognizer.log')
         self.log_max_size = int(os.getenv('LOG_MAX_SIZE_MB', '10')) * 1024 * 1024
         self.log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+        
+        # Performance log settings
+        self.perf_log_dir = os.getenv('PERF_LOG_DIR', 'logs/performance')
+        self.perf_log_console = os.getenv('PERF_LOG_CONSOLE', 'true').lower() == 'true'
+        
+        # Admin authentication (same secret the Node backend signs its JWTs with)
+        self.jwt_secret = os.getenv('JWT_SECRET', 'your-secret-key')
+        
+        # Sampling profiler settings
+        self.profiler_max_seconds = float(os.getenv('PROFILER_MAX_SECONDS', '60'))
+        self.profiler_output_dir = os.getenv('PROFILER_OUTPUT_DIR', 'logs/profiles')
+        
+        # Traffic capture settings (off by default; frames contain staff faces)
+        self.capture_enabled = os.getenv('CAPTURE_ENABLED', 'false').lower() == 'true'
+        self.capture_dir = os.getenv('CAPTURE_DIR', 'captures')
+        self.capture_sample_rate = float(os.getenv('CAPTURE_SAMPLE_RATE', '1.0'))
+        self.capture_frame_sample_rate = float(os.getenv('CAPTURE_FRAME_SAMPLE_RATE', '0.0'))
+        
+        # Server-side cooldown for repeat matches, shared by all workers (0 disables)
+        self.match_suppression_seconds = float(os.getenv('MATCH_SUPPRESSION_SECONDS', '120'))
+        self.match_suppression_per_camera = os.getenv('MATCH_SUPPRESSION_PER_CAMERA', 'false').lower() == 'true'
+        self.match_suppression_slots = int(os.getenv('MATCH_SUPPRESSION_SLOTS', '4096'))
+        
+        # Write-behind attendance queue for /recognize-and-record
+        self.attendance_queue_enabled = os.getenv('ATTENDANCE_QUEUE_ENABLED', 'false').lower() == 'true'
+        self.attendance_queue_dir = os.getenv('ATTENDANCE_QUEUE_DIR', 'queue/attendance')
+        self.attendance_queue_batch_size = int(os.getenv('ATTENDANCE_QUEUE_BATCH_SIZE', '50'))
+        self.attendance_queue_flush_interval = float(os.getenv('ATTENDANCE_QUEUE_FLUSH_INTERVAL_SECONDS', '1.0'))
+        
+        # GET /ready: when a warm worker reports itself saturated (0 disables a check)
+        self.ready_max_in_flight = int(os.getenv('READY_MAX_IN_FLIGHT', '4'))
+        self.ready_max_p95_ms = float(os.getenv('READY_MAX_P95_MS', '0'))
+        self.ready_latency_window = int(os.getenv('READY_LATENCY_WINDOW', '200'))
+        
+        # Memory governor settings (replaces per-request gc.collect)
+        self.memory_check_interval = float(os.getenv('MEMORY_CHECK_INTERVAL_SECONDS', '5'))
+        self.memory_gc_rss_growth_mb = int(os.getenv('MEMORY_GC_RSS_GROWTH_MB', '64'))
+        self.memory_gc_max_requests = int(os.getenv('MEMORY_GC_MAX_REQUESTS', '500'))
+        self.memory_gc_pending_threshold = int(os.getenv('MEMORY_GC_PENDING_THRESHOLD', '10'))
 
 class Config:
     """Main configuration class"""
@@ -142,6 +193,8 @@ class Config:
             errors.append("Face encoding model must be 'small' or 'large'")
         if not (0.0 <= self.service.face_distance_threshold <= 1.0):
             errors.append("Face distance threshold must be between 0.0 and 1.0")
+        if not (0.0 <= self.service.quality_gate_min_pose_symmetry <= 1.0):
+            errors.append("Quality gate pose symmetry must be between 0.0 and 1.0")
         
         if errors:
             print("Configuration validation errors:")
@@ -173,6 +226,9 @@ class Config:
         print(f"  Encoding Model: {self.service.face_encoding_model}")
         print(f"  Distance Threshold: {self.service.face_distance_threshold}")
         print(f"  Jitters: {self.service.face_jitters}")
+        print(f"  Quality Gate: {'on' if self.service.quality_gate_enabled else 'off'} "
+              f"(min size {self.service.quality_gate_min_face_size}px, min sharpness {self.service.quality_gate_min_sharpness}, "
+              f"min pose symmetry {self.service.quality_gate_min_pose_symmetry})")
         
         print(f"\nCache:")
         print(f"  TTL: {self.service.cache_ttl}s")
@@ -187,6 +243,11 @@ class Config:
         print(f"  File: {self.service.log_file}")
         print(f"  Max Size: {self.service.log_max_size // (1024*1024)}MB")
         print(f"  Backup Count: {self.service.log_backup_count}")
+        
+        print(f"\nMemory Governor:")
+        print(f"  Check Interval: {self.service.memory_check_interval}s")
+        print(f"  RSS Growth Threshold: {self.service.memory_gc_rss_growth_mb}MB")
+        print(f"  Max Requests Between Collections: {self.service.memory_gc_max_requests}")
 
 # Global configuration instance
 config = Config()
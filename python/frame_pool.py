@@ -0,0 +1,90 @@
+"""
+Frame Buffer Pool Module
+Keeps preallocated RGB frame buffers per resolution so continuous scanning
+reuses the same arrays instead of allocating a fresh full frame per image.
+"""
+import io
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class FramePool:
+    """Per-process pool of (height, width, 3) uint8 buffers keyed by resolution"""
+
+    def __init__(self, max_per_shape=4, max_shapes=4):
+        self.max_per_shape = max_per_shape
+        self.max_shapes = max_shapes
+        self._free = OrderedDict()
+        self._lock = Lock()
+        self.allocations = 0
+        self.reuses = 0
+        self.discarded = 0
+        self.outstanding = 0
+
+    def acquire(self, shape):
+        """Return a buffer of the given shape, reusing a released one when available"""
+        shape = tuple(shape)
+        with self._lock:
+            self.outstanding += 1
+            free = self._free.get(shape)
+            if free:
+                self._free.move_to_end(shape)
+                self.reuses += 1
+                return free.pop()
+            self.allocations += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buf):
+        """Hand a buffer back to the pool as soon as the stage using it is done"""
+        if buf is None:
+            return
+        with self._lock:
+            self.outstanding = max(0, self.outstanding - 1)
+            free = self._free.setdefault(buf.shape, [])
+            self._free.move_to_end(buf.shape)
+            if len(free) >= self.max_per_shape or any(b is buf for b in free):
+                self.discarded += 1
+            else:
+                free.append(buf)
+
+            # Drop the least recently used resolutions
+            while len(self._free) > self.max_shapes:
+                _, evicted = self._free.popitem(last=False)
+                self.discarded += len(evicted)
+
+    def decode(self, image_bytes):
+        """
+        Decode an encoded image straight into a pooled RGB buffer.
+        The caller owns the returned buffer and must release() it.
+        """
+        with Image.open(io.BytesIO(image_bytes)) as pil_image:
+            if pil_image.mode == 'RGB':
+                pil_image.load()
+                rgb = pil_image
+            else:
+                rgb = pil_image.convert('RGB')
+            try:
+                buf = self.acquire((rgb.height, rgb.width, 3))
+                buf[...] = rgb
+            finally:
+                if rgb is not pil_image:
+                    rgb.close()
+        return buf
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "discarded": self.discarded,
+                "outstanding": self.outstanding,
+                "pooled_buffers": sum(len(v) for v in self._free.values()),
+                "pooled_bytes": sum(b.nbytes for v in self._free.values() for b in v),
+                "shapes": [f"{s[1]}x{s[0]}" for s in self._free.keys()],
+            }
@@ -0,0 +1,29 @@
+"""
+Gallery Matrix Module
+Growable (n, 128) float64 matrix that gallery encodings are decoded into row
+by row. Preallocated from the expected row count, so a load never builds a
+list of per-person arrays and stacks them afterwards.
+"""
+import numpy as np
+
+
+class GalleryMatrix:
+    """Growable (n, 128) float64 matrix the gallery is decoded into row by row"""
+
+    def __init__(self, capacity=0):
+        self.matrix = np.empty((max(capacity, 1), 128), dtype='float64')
+        self.size = 0
+
+    def append(self, vector):
+        if self.size == len(self.matrix):
+            grown = np.empty((len(self.matrix) * 2, 128), dtype='float64')
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size] = vector
+        self.size += 1
+
+    def finish(self) -> np.ndarray:
+        # Only copy when the spare capacity is worth giving back
+        if len(self.matrix) - self.size > max(64, self.size // 8):
+            return self.matrix[:self.size].copy()
+        return self.matrix[:self.size]
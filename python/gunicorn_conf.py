@@ -0,0 +1,22 @@
+"""
+Gunicorn server hooks for the Face Recognition Service
+Used by start_production.py together with --preload:
+
+- when_ready: runs in the master after the app has been preloaded. Closes the
+  master's database pool and freezes the GC so the shared model and gallery
+  pages stay copy-on-write in every worker.
+- post_fork: runs in each new worker (including ones recycled by
+  --max-requests). Creates the worker's own connection pool and warms the
+  models up before the worker accepts traffic.
+"""
+import recognizer_service
+
+
+def when_ready(server):
+    server.log.info("Preload complete, preparing master for forking workers")
+    recognizer_service.prepare_for_fork()
+
+
+def post_fork(server, worker):
+    server.log.info(f"Initializing worker {worker.pid}")
+    recognizer_service.init_worker()
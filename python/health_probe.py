@@ -0,0 +1,119 @@
+"""
+Health Probe Module
+HTTP health checks for the service manager and the IP monitors.
+
+All probes share one keep-alive session, so a check every monitor cycle reuses
+its connection instead of opening a new one (and a new TLS handshake). The
+scheme that answered last time is remembered per host and port and tried
+first, and several endpoints are probed at once on a small thread pool, so
+one slow or dead service costs a single sub-second timeout instead of
+stalling the whole loop.
+
+wait_with_backoff polls a check (typically a probe) with exponentially
+growing pauses, for readiness waits that end as soon as the service is up.
+"""
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Per attempt; local services answer /health in milliseconds
+PROBE_TIMEOUT_SECONDS = 0.8
+PROBE_WORKERS = 8
+
+# Readiness polling: first pause, doubled after every miss up to the cap
+BACKOFF_INITIAL_SECONDS = 0.25
+BACKOFF_MAX_SECONDS = 2.0
+
+ProbeResult = namedtuple('ProbeResult', 'ok url status elapsed_ms error')
+
+
+def wait_with_backoff(check, timeout, initial=BACKOFF_INITIAL_SECONDS, max_delay=BACKOFF_MAX_SECONDS):
+    """Call check() until it returns True or timeout seconds pass; returns the last result"""
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        if check():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+class HealthProber:
+    def __init__(self, timeout=PROBE_TIMEOUT_SECONDS, max_workers=PROBE_WORKERS):
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Self-signed certificates on the LAN services. Ignoring the environment
+        # keeps proxies and REQUESTS_CA_BUNDLE from overriding that for local probes.
+        self.session.verify = False
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="health-probe")
+        self._schemes = {}
+        self._lock = threading.Lock()
+
+    def probe(self, host, port, path='/health', schemes=('http', 'https'), timeout=None):
+        """
+        GET path on host:port, trying the scheme that worked last time first.
+        Returns a ProbeResult; ok means a 200 response.
+        """
+        with self._lock:
+            known = self._schemes.get((host, port))
+        if known in schemes:
+            schemes = (known,) + tuple(s for s in schemes if s != known)
+
+        start = time.perf_counter()
+        result = None
+        for scheme in schemes:
+            url = f"{scheme}://{host}:{port}{path}"
+            try:
+                response = self.session.get(url, timeout=timeout or self.timeout)
+            except requests.RequestException as e:
+                result = ProbeResult(False, url, None, (time.perf_counter() - start) * 1000, str(e))
+                continue
+            result = ProbeResult(response.status_code == 200, url, response.status_code,
+                                 (time.perf_counter() - start) * 1000, None)
+            # The scheme is right even if the service answered with an error status
+            with self._lock:
+                self._schemes[(host, port)] = scheme
+            break
+        if result is not None and not result.ok:
+            logger.debug(f"Health probe {result.url} failed: {result.error or result.status}")
+        return result
+
+    def probe_many(self, targets, timeout=None):
+        """
+        Probe several endpoints concurrently. targets maps a name to the
+        keyword arguments of probe(); returns a dict of name -> ProbeResult.
+        """
+        futures = {name: self._executor.submit(self.probe, timeout=timeout, **kwargs)
+                   for name, kwargs in targets.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def first_reachable(self, hosts, port, path='/health', schemes=('http', 'https'), timeout=None):
+        """First host (in the given order) whose endpoint answers, probing all at once"""
+        results = self.probe_many({host: dict(host=host, port=port, path=path, schemes=schemes) for host in hosts},
+                                  timeout=timeout)
+        for host in hosts:
+            if results[host].ok:
+                return host, results[host]
+        return None, None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+# Global prober instance
+prober = HealthProber()
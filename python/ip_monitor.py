@@ -8,11 +8,12 @@ import json
 import time
 import socket
 import subprocess
-import requests
 from pathlib import Path
 import logging
 from datetime import datetime
 
+from health_probe import prober
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -208,25 +209,11 @@ class IPMonitor:
     
     def test_service_connection(self, ip, port=8001):
         """Test if the service is accessible at the given IP"""
-        try:
-            # Try HTTP first
-            response = requests.get(f"http://{ip}:{port}/health", timeout=5)
-            if response.status_code == 200:
-                logger.info(f"Service accessible via HTTP at {ip}:{port}")
-                return True
-        except:
-            pass
-        
-        try:
-            # Try HTTPS
-            response = requests.get(f"https://{ip}:{port}/health", timeout=5, verify=False)
-            if response.status_code == 200:
-                logger.info(f"Service accessible via HTTPS at {ip}:{port}")
-                return True
-        except:
-            pass
-        
-        return False
+        # Shared keep-alive session; the scheme that answered last time is tried first
+        result = prober.probe(ip, port, '/health')
+        if result.ok:
+            logger.info(f"Service accessible at {result.url} ({result.elapsed_ms:.0f}ms)")
+        return result.ok
     
     def find_working_ip(self):
         """Find the IP address where the service is actually running"""
@@ -243,13 +230,11 @@ class IPMonitor:
         
         logger.info(f"Testing IPs: {all_ips}")
         
-        # Test each IP
-        for ip in all_ips:
-            if self.test_service_connection(ip):
-                logger.info(f"Found working service at IP: {ip}")
-                return ip
-        
-        return None
+        # Test every IP at once
+        working_ip, result = prober.first_reachable(all_ips, 8001, '/health')
+        if working_ip:
+            logger.info(f"Found working service at IP: {working_ip} ({result.url})")
+        return working_ip
     
     def monitor_and_update(self):
         """Main monitoring loop"""
@@ -1,137 +1,175 @@
+"""
+Liveness Module
+Blink, head movement and face quality checks on dlib's 68-point landmarks,
+plus the pre-encoding quality gate (frame_gate).
+
+Landmarks are carried as one float array of shape (frames, 68, 2) in iBUG
+order, taken straight from the detector's shape (see landmarks_from_shape)
+so no per-frame dicts are built. Every check below is computed for all
+frames at once with NumPy.
+"""
 import numpy as np
-from scipy.spatial import distance as dist
+
+# iBUG 68-point indices (face_recognition calls 36-41 "left_eye")
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+NOSE_TIP = slice(31, 36)
+NOSE_POINT = 30
+JAW_LEFT = 0
+JAW_RIGHT = 16
+LANDMARK_COUNT = 68
+
+# The encoder sees the face as a ~150 px chip, so blur is judged at that scale
+SHARPNESS_SIDE = 150
+_GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def landmarks_from_shape(shape):
+    """(68, 2) array from a dlib full_object_detection"""
+    return np.array([(p.x, p.y) for p in shape.parts()], dtype=np.float64)
+
+
+def landmarks_from_dict(face_landmarks):
+    """
+    (68, 2) array from a face_recognition.face_landmarks() dict (large model).
+    The lip groups repeat points, so the inner lip is rebuilt from them.
+    """
+    points = []
+    for feature in ("chin", "left_eyebrow", "right_eyebrow", "nose_bridge", "nose_tip", "left_eye", "right_eye"):
+        points.extend(face_landmarks[feature])
+    top_lip = face_landmarks["top_lip"]
+    bottom_lip = face_landmarks["bottom_lip"]
+    points.extend(top_lip[0:7])
+    points.extend(bottom_lip[1:6])
+    points.extend([top_lip[11], top_lip[10], top_lip[9], top_lip[8], top_lip[7]])
+    points.extend([bottom_lip[10], bottom_lip[9], bottom_lip[8]])
+    return np.array(points, dtype=np.float64)
+
+
+def as_landmark_array(face_landmarks_list):
+    """Accept a (frames, 68, 2) array, a list of (68, 2) arrays or legacy landmark dicts"""
+    if isinstance(face_landmarks_list, np.ndarray):
+        return face_landmarks_list.reshape(-1, LANDMARK_COUNT, 2)
+    if len(face_landmarks_list) == 0:
+        return np.empty((0, LANDMARK_COUNT, 2))
+    return np.stack([
+        landmarks_from_dict(frame) if isinstance(frame, dict) else np.asarray(frame, dtype=np.float64)
+        for frame in face_landmarks_list
+    ])
+
 
 def eye_aspect_ratio(eye):
     """
-    Compute the eye aspect ratio (EAR) for a given eye.
+    Compute the eye aspect ratio (EAR) for eyes of shape (..., 6, 2).
     The EAR is the ratio of the vertical distance between eye landmarks
     to the horizontal distance, which decreases during a blink.
     """
-    # Compute the euclidean distances between the two sets of
-    # vertical eye landmarks (x, y)-coordinates
-    A = dist.euclidean(eye[1], eye[5])
-    B = dist.euclidean(eye[2], eye[4])
+    eye = np.asarray(eye, dtype=np.float64)
+    # Two vertical distances over the horizontal eye width
+    a = np.linalg.norm(eye[..., 1, :] - eye[..., 5, :], axis=-1)
+    b = np.linalg.norm(eye[..., 2, :] - eye[..., 4, :], axis=-1)
+    c = np.linalg.norm(eye[..., 0, :] - eye[..., 3, :], axis=-1)
+    return (a + b) / (2.0 * c)
 
-    # Compute the euclidean distance between the horizontal
-    # eye landmark (x, y)-coordinates
-    C = dist.euclidean(eye[0], eye[3])
 
-    # Compute the eye aspect ratio
-    ear = (A + B) / (2.0 * C)
+def frame_ears(landmarks):
+    """Mean EAR of both eyes for every frame of a (frames, 68, 2) array"""
+    return (eye_aspect_ratio(landmarks[:, LEFT_EYE]) + eye_aspect_ratio(landmarks[:, RIGHT_EYE])) / 2.0
 
-    # Return the eye aspect ratio
-    return ear
 
 def is_blinking(face_landmarks_list, ear_thresh=0.2, ear_consecutive_frames=2):
     """
     Check for blinks in a sequence of face landmarks.
     A blink is detected if the EAR drops below a threshold for a certain number of consecutive frames.
-    
+
     Args:
-        face_landmarks_list: List of face landmarks dictionaries
+        face_landmarks_list: (frames, 68, 2) landmark array (or list of frames)
         ear_thresh: Eye aspect ratio threshold for blink detection
         ear_consecutive_frames: Number of consecutive frames below threshold to consider a blink
-    
+
     Returns:
         bool: True if blinking is detected, False otherwise
     """
-    if len(face_landmarks_list) < 2:
-        # If we have at least 2 frames, we can still try to detect blinking
-        # but with more lenient requirements
-        if len(face_landmarks_list) == 1:
-            return False
-        ear_consecutive_frames = 1  # More lenient for fewer frames
-
-    blink_counter = 0
-    total_blinks = 0
-
-    for face_landmarks in face_landmarks_list:
-        left_eye = np.array(face_landmarks["left_eye"])
-        right_eye = np.array(face_landmarks["right_eye"])
-
-        left_ear = eye_aspect_ratio(left_eye)
-        right_ear = eye_aspect_ratio(right_eye)
+    landmarks = as_landmark_array(face_landmarks_list)
+    if len(landmarks) < 2:
+        return False
 
-        ear = (left_ear + right_ear) / 2.0
+    closed = (frame_ears(landmarks) < ear_thresh).astype(np.int8)
+    # Start/end of every run of closed-eye frames
+    edges = np.diff(np.concatenate(([0], closed, [0])))
+    run_lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return bool(np.any(run_lengths >= ear_consecutive_frames))
 
-        if ear < ear_thresh:
-            blink_counter += 1
-        else:
-            if blink_counter >= ear_consecutive_frames:
-                total_blinks += 1
-            blink_counter = 0
 
-    if blink_counter >= ear_consecutive_frames:
-        total_blinks += 1
+def face_centres(face_locations_list):
+    """(frames, 2) x/y centres of (top, right, bottom, left) boxes"""
+    boxes = np.asarray(face_locations_list, dtype=np.float64).reshape(-1, 4)
+    return np.column_stack(((boxes[:, 1] + boxes[:, 3]) / 2, (boxes[:, 0] + boxes[:, 2]) / 2))
 
-    return total_blinks > 0
 
 def has_head_movement(face_locations_list, movement_threshold=15):
     """
     Check if there's significant head movement between frames.
-    
+
     Args:
-        face_locations_list: List of face location tuples (top, right, bottom, left)
+        face_locations_list: Face location tuples (top, right, bottom, left), one per frame
         movement_threshold: Minimum pixel movement to consider as head movement
-    
+
     Returns:
         bool: True if head movement is detected, False otherwise
     """
     if len(face_locations_list) < 2:
         return False
 
-    initial_location = face_locations_list[0]
-    last_location = face_locations_list[-1]
-
-    # Simple check for horizontal or vertical movement of the face's center
-    initial_center_x = (initial_location[1] + initial_location[3]) / 2
-    initial_center_y = (initial_location[0] + initial_location[2]) / 2
-
-    last_center_x = (last_location[1] + last_location[3]) / 2
-    last_center_y = (last_location[0] + last_location[2]) / 2
+    # Horizontal or vertical displacement of the face centre, first to last frame
+    centres = face_centres(face_locations_list)
+    return bool(np.any(np.abs(centres[-1] - centres[0]) > movement_threshold))
 
-    movement_x = abs(initial_center_x - last_center_x)
-    movement_y = abs(initial_center_y - last_center_y)
 
-    return movement_x > movement_threshold or movement_y > movement_threshold
+def face_quality(landmarks, face_locations_list, min_face_size=50 * 50):
+    """
+    Size, symmetry and quality score for every frame.
+    Returns a dict of arrays, one value per frame.
+    """
+    landmarks = as_landmark_array(landmarks)
+    boxes = np.asarray(face_locations_list, dtype=np.float64).reshape(-1, 4)
+    face_size = (boxes[:, 1] - boxes[:, 3]) * (boxes[:, 2] - boxes[:, 0])
+
+    # Distance from nose to each eye should be similar for symmetry
+    nose_tip = landmarks[:, NOSE_TIP.start]
+    left_distance = np.linalg.norm(nose_tip - landmarks[:, LEFT_EYE.start], axis=-1)
+    right_distance = np.linalg.norm(nose_tip - landmarks[:, RIGHT_EYE.start], axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        symmetry = 1 - np.abs(left_distance - right_distance) / np.maximum(left_distance, right_distance)
+    symmetry = np.nan_to_num(symmetry)
+
+    size_ok = face_size > min_face_size
+    return {
+        "size": face_size,
+        "symmetry": symmetry,
+        "size_ok": size_ok,
+        "quality_score": (symmetry + size_ok) / 2,
+    }
 
 
 def detect_face_quality(face_landmarks, face_location):
     """
     Assess the quality of the detected face for recognition.
-    
+
     Args:
-        face_landmarks: Dictionary containing facial landmarks
+        face_landmarks: (68, 2) landmark array (or legacy landmark dict)
         face_location: Tuple of (top, right, bottom, left)
-    
+
     Returns:
         dict: Quality metrics including size, symmetry, and clarity
     """
     try:
-        # Calculate face size
-        face_width = face_location[1] - face_location[3]  # right - left
-        face_height = face_location[2] - face_location[0]  # bottom - top
-        face_size = face_width * face_height
-        
-        # Calculate symmetry (simplified)
-        left_eye = np.array(face_landmarks["left_eye"][0])
-        right_eye = np.array(face_landmarks["right_eye"][0])
-        nose_tip = np.array(face_landmarks["nose_tip"][0])
-        
-        # Distance from nose to each eye should be similar for symmetry
-        left_distance = np.linalg.norm(nose_tip - left_eye)
-        right_distance = np.linalg.norm(nose_tip - right_eye)
-        symmetry = 1 - abs(left_distance - right_distance) / max(left_distance, right_distance)
-        
-        # Check if face is too small
-        min_face_size = 50 * 50  # Minimum 50x50 pixels
-        size_ok = face_size > min_face_size
-        
+        quality = face_quality([face_landmarks], [face_location])
         return {
-            "size": int(face_size),
-            "symmetry": float(symmetry),
-            "size_ok": bool(size_ok),
-            "quality_score": float((symmetry + (1 if size_ok else 0)) / 2)
+            "size": int(quality["size"][0]),
+            "symmetry": float(quality["symmetry"][0]),
+            "size_ok": bool(quality["size_ok"][0]),
+            "quality_score": float(quality["quality_score"][0])
         }
     except Exception:
         return {
@@ -140,3 +178,63 @@ def detect_face_quality(face_landmarks, face_location):
             "size_ok": False,
             "quality_score": 0
         }
+
+
+def face_sharpness(img_array, face_location, side=SHARPNESS_SIDE):
+    """Variance of the Laplacian of the grey face region, sampled to about side x side"""
+    top, right, bottom, left = face_location
+    height, width = img_array.shape[:2]
+    roi = img_array[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+    step = max(1, max(roi.shape[:2]) // side)
+    roi = roi[::step, ::step]
+    if roi.shape[0] < 3 or roi.shape[1] < 3:
+        return 0.0
+    gray = roi.astype(np.float32) @ _GRAY_WEIGHTS if roi.ndim == 3 else roi.astype(np.float32)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def pose_symmetry(landmarks):
+    """
+    Ratio of the nose tip's distance to the nearer and the farther jaw edge,
+    per frame: close to 1 for a frontal face, towards 0 as the head turns.
+    """
+    landmarks = as_landmark_array(landmarks)
+    nose = landmarks[:, NOSE_POINT]
+    left = np.linalg.norm(nose - landmarks[:, JAW_LEFT], axis=-1)
+    right = np.linalg.norm(nose - landmarks[:, JAW_RIGHT], axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(np.minimum(left, right) / np.maximum(left, right))
+
+
+def frame_gate(img_array, face_location, face_landmarks, min_face_size=0, min_sharpness=0.0, min_pose_symmetry=0.0):
+    """
+    Cheap check run between landmarks and encoding, cheapest test first.
+    A threshold of 0 disables that test.
+
+    Args:
+        img_array: RGB frame
+        face_location: Tuple of (top, right, bottom, left)
+        face_landmarks: (68, 2) landmark array of that face
+        min_face_size: Minimum length of the shorter box side in pixels
+        min_sharpness: Minimum Laplacian variance of the face region
+        min_pose_symmetry: Minimum pose_symmetry
+
+    Returns:
+        tuple: (reason or None, measurements); reason is face_too_small,
+        face_blurred or face_not_frontal
+    """
+    top, right, bottom, left = face_location
+    quality = {"face_size": int(min(right - left, bottom - top))}
+    if quality["face_size"] < min_face_size:
+        return "face_too_small", quality
+    if min_sharpness > 0:
+        quality["sharpness"] = round(face_sharpness(img_array, face_location), 2)
+        if quality["sharpness"] < min_sharpness:
+            return "face_blurred", quality
+    if min_pose_symmetry > 0:
+        quality["pose_symmetry"] = round(float(pose_symmetry(face_landmarks)[0]), 3)
+        if quality["pose_symmetry"] < min_pose_symmetry:
+            return "face_not_frontal", quality
+    return None, quality
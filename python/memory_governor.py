@@ -0,0 +1,179 @@
+"""
+Memory Governor Module
+Replaces the per-request gc.collect() with a background thread that watches
+process RSS and GC allocation counts, and only runs a full collection when a
+threshold is crossed - preferably while no request is in flight.
+"""
+import gc
+import os
+import time
+import logging
+import threading
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryGovernor:
+    """Per-process memory watcher that collects garbage off the request path"""
+
+    def __init__(self, check_interval=5.0, rss_growth_mb=64, max_requests=500,
+                 pending_threshold=10, hard_limit_factor=2.0):
+        self.check_interval = check_interval
+        self.rss_growth_bytes = rss_growth_mb * MB
+        self.max_requests = max_requests
+        self.pending_threshold = pending_threshold
+        # Above rss_growth * hard_limit_factor we collect even if requests are in flight
+        self.hard_limit_factor = hard_limit_factor
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._process = None
+        self._pid = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.in_flight = 0
+        self.requests_total = 0
+        self.requests_since_collect = 0
+        self.collections = 0
+        self.collection_requested = None
+        self.baseline_rss = 0
+        self.rss_at_last_collect = 0
+        self.peak_rss = 0
+        self.last_rss = 0
+        self.last_collection = None
+
+    def start(self):
+        """Start the watcher thread for the current process (safe to call after fork)"""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+
+        if self._pid != pid:
+            # Counters copied from a parent process describe the parent, not us
+            self._lock = threading.Lock()
+            self._reset_counters()
+
+        self._pid = pid
+        self._process = psutil.Process(pid)
+        rss = self._read_rss()
+        self.baseline_rss = rss
+        self.rss_at_last_collect = rss
+        self.peak_rss = rss
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-governor", daemon=True)
+        self._thread.start()
+        logger.info(f"Memory governor started (pid {pid}, baseline RSS {rss / MB:.1f}MB)")
+
+    def stop(self):
+        """Stop the watcher thread, e.g. in the gunicorn master before forking"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.check_interval + 1)
+        self._thread = None
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.requests_total += 1
+            self.requests_since_collect += 1
+
+    def request_collection(self, reason):
+        """Ask for a full collection at the next idle check instead of running it inline"""
+        self.collection_requested = reason
+
+    def _read_rss(self):
+        try:
+            rss = self._process.memory_info().rss
+        except Exception:
+            return self.last_rss
+        self.last_rss = rss
+        if rss > self.peak_rss:
+            self.peak_rss = rss
+        return rss
+
+    def _collection_reason(self, rss):
+        growth = rss - self.rss_at_last_collect
+        if growth >= self.rss_growth_bytes:
+            return f"rss_growth_{growth // MB}MB"
+        if self.collection_requested:
+            return self.collection_requested
+        if self.max_requests and self.requests_since_collect >= self.max_requests:
+            return "request_count"
+        if gc.get_count()[2] >= self.pending_threshold:
+            return "pending_allocations"
+        return None
+
+    def check(self):
+        """Sample memory and collect if a threshold has been crossed"""
+        rss = self._read_rss()
+        reason = self._collection_reason(rss)
+        if reason is None:
+            return False
+
+        growth = rss - self.rss_at_last_collect
+        if self.in_flight > 0 and growth < self.rss_growth_bytes * self.hard_limit_factor:
+            # Defer until the worker is idle so no request pays for the pause
+            return False
+
+        self._collect(reason, rss)
+        return True
+
+    def _collect(self, reason, rss_before):
+        start = time.time()
+        freed = gc.collect()
+        duration_ms = (time.time() - start) * 1000
+        rss_after = self._read_rss()
+
+        with self._lock:
+            self.collections += 1
+            self.requests_since_collect = 0
+            self.collection_requested = None
+            self.rss_at_last_collect = rss_after
+            self.last_collection = {
+                "reason": reason,
+                "at": time.time(),
+                "duration_ms": round(duration_ms, 2),
+                "objects_freed": freed,
+                "rss_before_mb": round(rss_before / MB, 1),
+                "rss_after_mb": round(rss_after / MB, 1),
+            }
+        logger.debug(f"Memory governor collected {freed} objects in {duration_ms:.2f}ms ({reason})")
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Memory governor check failed: {e}")
+
+    def stats(self):
+        """Snapshot of this worker's memory state"""
+        rss = self._read_rss() if self._process else 0
+        return {
+            "pid": os.getpid(),
+            "rss_mb": round(rss / MB, 1),
+            "peak_rss_mb": round(self.peak_rss / MB, 1),
+            "baseline_rss_mb": round(self.baseline_rss / MB, 1),
+            "growth_since_baseline_mb": round((rss - self.baseline_rss) / MB, 1),
+            "growth_since_collect_mb": round((rss - self.rss_at_last_collect) / MB, 1),
+            "requests_in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "requests_since_collect": self.requests_since_collect,
+            "collections": self.collections,
+            "last_collection": self.last_collection,
+            "gc_counts": list(gc.get_count()),
+            "gc_frozen_objects": gc.get_freeze_count(),
+        }
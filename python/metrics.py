@@ -0,0 +1,235 @@
+"""
+Metrics Module
+In-process, fixed-bucket latency histograms and counters fed by the
+performance logger, served in Prometheus text format on GET /metrics.
+
+Operation names are normalized before they become label values so the number
+of series stays bounded: per-frame names such as "frame_3_face_area" become
+"frame_face_area" with frame="3", and per-staff names such as
+"load_encoding_EMP001" lose the staff id.
+"""
+import re
+import math
+import threading
+
+# Latency buckets in seconds, from fast matching up to slow CNN detection
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Highest frame index kept as its own label value; later frames share one value
+MAX_FRAME_LABEL = 8
+
+# Distinct operation/metric/event names kept per family before folding into "other"
+MAX_NAMES = 64
+
+_FRAME_RE = re.compile(r'(^|_)frame_(\d+)(?=_|$)')
+_PER_STAFF_PREFIXES = ('load_encoding_', 'generate_encoding_')
+
+# First matching rule wins; checked against the normalized operation name
+STAGE_RULES = (
+    ('request', ('total_request',)),
+    ('decode', ('read_image_bytes', 'image_preprocessing', 'read_frame_bytes', 'preprocess_frame')),
+    ('detection', ('face_detection', 'detect_face')),
+    ('landmarks', ('extract_landmarks', 'landmark')),
+    ('encoding', ('face_encoding', 'encode_face', 'generate_encoding')),
+    ('matching', ('face_matching',)),
+    ('liveness', ('liveness', 'blink_detection', 'head_movement', 'face_quality')),
+    ('db_load', ('database_query', 'load_known_faces', 'load_encoding', 'gallery')),
+)
+
+
+def normalize_name(name):
+    """Split a raw operation name into (name, frame) with bounded cardinality"""
+    frame = ''
+    match = _FRAME_RE.search(name)
+    if match:
+        index = int(match.group(2))
+        frame = str(index) if index <= MAX_FRAME_LABEL else f"{MAX_FRAME_LABEL}+"
+        name = _FRAME_RE.sub(r'\1frame', name, count=1)
+    for prefix in _PER_STAFF_PREFIXES:
+        if name.startswith(prefix):
+            name = prefix[:-1]
+            break
+    return name, frame
+
+
+def stage_for(name):
+    """Map a normalized operation name onto a pipeline stage"""
+    for stage, needles in STAGE_RULES:
+        if any(needle in name for needle in needles):
+            return stage
+    return 'other'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    rendered = ','.join(f'{key}="{_escape(value)}"' for key, value in pairs if value != '')
+    return '{' + rendered + '}' if rendered else ''
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile by linear interpolation inside the bucket"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                inside = (rank - seen) / self.counts[i] if self.counts[i] else 0
+                return lower + (bound - lower) * inside
+            seen += self.counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe store for stage histograms, metric summaries and event counters"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, max_names=MAX_NAMES):
+        self.buckets = buckets
+        self.max_names = max_names
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._metrics = {}
+        self._events = {}
+        self._errors = {}
+        self._gauges = {}
+        self._names = {'duration': set(), 'metric': set(), 'event': set(), 'error': set()}
+
+    def _bounded(self, family, name):
+        known = self._names[family]
+        if name in known:
+            return name
+        if len(known) >= self.max_names:
+            return 'other'
+        known.add(name)
+        return name
+
+    def observe_duration(self, operation_name, seconds):
+        name, frame = normalize_name(operation_name)
+        with self._lock:
+            name = self._bounded('duration', name)
+            key = (stage_for(name), name, frame)
+            hist = self._durations.get(key)
+            if hist is None:
+                hist = self._durations[key] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def observe_metric(self, metric_name, value):
+        number = _number(value)
+        if number is None or math.isnan(number):
+            return
+        name, frame = normalize_name(metric_name)
+        with self._lock:
+            key = (self._bounded('metric', name), frame)
+            summary = self._metrics.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += number
+            summary[2] = number
+
+    def count_event(self, event_name):
+        name, frame = normalize_name(event_name)
+        with self._lock:
+            key = (self._bounded('event', name), frame)
+            self._events[key] = self._events.get(key, 0) + 1
+
+    def count_error(self, error_type):
+        name, frame = normalize_name(error_type)
+        with self._lock:
+            key = (self._bounded('error', name), frame)
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def set_gauge(self, name, value, help_text=''):
+        """Set a point-in-time value (known faces, RSS, ...) rendered as-is"""
+        with self._lock:
+            self._gauges[name] = (value, help_text)
+
+    def stage_quantile(self, stage, q):
+        """Approximate quantile in seconds across every operation of a stage"""
+        with self._lock:
+            merged = Histogram(self.buckets)
+            for (hist_stage, _, _), hist in self._durations.items():
+                if hist_stage == stage:
+                    merged.counts = [a + b for a, b in zip(merged.counts, hist.counts)]
+                    merged.count += hist.count
+                    merged.total += hist.total
+        return merged.quantile(q)
+
+    def render(self):
+        """Render everything in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP recognizer_stage_duration_seconds Duration of timed pipeline operations')
+            lines.append('# TYPE recognizer_stage_duration_seconds histogram')
+            for (stage, name, frame), hist in sorted(self._durations.items()):
+                base = [('stage', stage), ('operation', name), ('frame', frame)]
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'recognizer_stage_duration_seconds_bucket{_labels(base + [("le", repr(bound))])} {cumulative}')
+                lines.append(f'recognizer_stage_duration_seconds_bucket{_labels(base + [("le", "+Inf")])} {hist.count}')
+                lines.append(f'recognizer_stage_duration_seconds_sum{_labels(base)} {hist.total}')
+                lines.append(f'recognizer_stage_duration_seconds_count{_labels(base)} {hist.count}')
+
+            lines.append('# HELP recognizer_metric Numeric values reported through log_metric')
+            lines.append('# TYPE recognizer_metric summary')
+            for (name, frame), (count, total, last) in sorted(self._metrics.items()):
+                labels = _labels([('name', name), ('frame', frame)])
+                lines.append(f'recognizer_metric_sum{labels} {total}')
+                lines.append(f'recognizer_metric_count{labels} {count}')
+            lines.append('# HELP recognizer_metric_last Most recent value reported through log_metric')
+            lines.append('# TYPE recognizer_metric_last gauge')
+            for (name, frame), (_, _, last) in sorted(self._metrics.items()):
+                lines.append(f'recognizer_metric_last{_labels([("name", name), ("frame", frame)])} {last}')
+
+            lines.append('# HELP recognizer_events_total Events reported through log_event')
+            lines.append('# TYPE recognizer_events_total counter')
+            for (name, frame), count in sorted(self._events.items()):
+                lines.append(f'recognizer_events_total{_labels([("event", name), ("frame", frame)])} {count}')
+
+            lines.append('# HELP recognizer_errors_total Errors reported through log_error_metric')
+            lines.append('# TYPE recognizer_errors_total counter')
+            for (name, frame), count in sorted(self._errors.items()):
+                lines.append(f'recognizer_errors_total{_labels([("error", name), ("frame", frame)])} {count}')
+
+            for name, (value, help_text) in sorted(self._gauges.items()):
+                if help_text:
+                    lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry; each worker process keeps its own
+registry = MetricsRegistry()
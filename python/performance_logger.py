@@ -1,27 +1,61 @@
 """
 Performance Logger Module
 Logs performance metrics to organized folder structure: YYYY/MMYYYY/DDMMYYYY
+
+Records are only enqueued on the request thread; a background writer thread
+formats them, handles day rollover and appends them to the log in batches.
 """
 import os
+import sys
 import time
-import logging
+import json
+import atexit
+import threading
+import queue
 from datetime import datetime
 from contextlib import contextmanager
 from pathlib import Path
-import json
+
+from allocation_tracker import allocation_tracker
+from config import config
+from metrics import registry as metrics_registry
+import tracing
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
 
 class PerformanceLogger:
     """Logger for tracking performance metrics with organized file structure"""
     
-    def __init__(self, base_log_dir='logs/performance'):
+    def __init__(self, base_log_dir='logs/performance', console=True, min_level='info',
+                 batch_size=512, max_pending=100000):
         self.base_log_dir = base_log_dir
+        self.console = console
+        self.min_level = LEVELS.get(min_level, 20)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
         self.current_log_file = None
-        self.logger = None
-        self._setup_logger()
+        self.dropped = 0
+        self._current_day = None
+        self._file = None
+        self._start_writer()
+        
+        # Writer threads do not survive fork; give each gunicorn worker its own
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start_writer)
+        atexit.register(self.close)
     
-    def _get_log_path(self):
+    def _start_writer(self):
+        """Create the queue and background writer for the current process"""
+        self._queue = queue.SimpleQueue()
+        self._current_day = None
+        self._file = None
+        self._writer = threading.Thread(target=self._run, name="performance-log-writer", daemon=True)
+        self._writer.start()
+    
+    def _get_log_path(self, now=None):
         """Generate log file path with folder structure: YYYY/MMYYYY/DDMMYYYY/performance.log"""
-        now = datetime.now()
+        now = now or datetime.now()
         year = now.strftime('%Y')  # YYYY
         month = now.strftime('%m')  # MM
         day = now.strftime('%d')  # DD
@@ -40,64 +74,97 @@ class PerformanceLogger:
         
         return log_file
     
-    def _setup_logger(self):
-        """Setup logger with current date's log file"""
-        log_file = self._get_log_path()
-        
-        # Only update if log file has changed (new day)
-        if self.current_log_file != log_file:
-            self.current_log_file = log_file
-            
-            # Create new logger
-            self.logger = logging.getLogger('performance')
-            self.logger.setLevel(logging.INFO)
-            
-            # Remove existing handlers
-            self.logger.handlers.clear()
-            
-            # Add file handler
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setLevel(logging.INFO)
-            
-            # Add console handler
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.INFO)
-            
-            # Create formatter
-            formatter = logging.Formatter(
-                '%(asctime)s | %(levelname)s | %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            
-            file_handler.setFormatter(formatter)
-            console_handler.setFormatter(formatter)
-            
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
+    def _open_for_day(self, now):
+        """Switch to the given day's log file (runs once per day, on the writer thread)"""
+        if self._file is not None:
+            self._file.close()
+        self.current_log_file = self._get_log_path(now)
+        # Unbuffered append: each batch is a single write, so workers sharing
+        # the file never interleave partial lines
+        self._file = open(self.current_log_file, 'ab', buffering=0)
+        self._current_day = now.date()
     
     def log(self, message, level='info', **kwargs):
-        """Log a message with optional additional data"""
-        # Check if we need to rotate to a new log file (new day)
-        self._setup_logger()
-        
+        """Queue a message with optional additional data; never blocks on I/O"""
+        if LEVELS.get(level, 20) < self.min_level:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            # Writer cannot keep up; shed load instead of growing without bound
+            self.dropped += 1
+            return
+        trace_id = tracing.current_trace_id()
+        if trace_id is not None:
+            kwargs['trace_id'] = trace_id
+        self._queue.put((time.time(), level, message, kwargs))
+    
+    def _format(self, level, message, kwargs, now):
         # Add extra data if provided
         if kwargs:
-            message = f"{message} | {json.dumps(kwargs)}"
-        
-        if level == 'info':
-            self.logger.info(message)
-        elif level == 'warning':
-            self.logger.warning(message)
-        elif level == 'error':
-            self.logger.error(message)
-        elif level == 'debug':
-            self.logger.debug(message)
+            message = f"{message} | {json.dumps(kwargs, default=str)}"
+        return f"{now.strftime('%Y-%m-%d %H:%M:%S')} | {level.upper()} | {message}\n"
+    
+    def _write(self, lines):
+        if not lines:
+            return
+        data = ''.join(lines)
+        try:
+            self._file.write(data.encode('utf-8'))
+        except Exception as e:
+            sys.stderr.write(f"Performance log write failed: {e}\n")
+        if self.console:
+            sys.stderr.write(data)
+    
+    def _write_batch(self, batch):
+        lines = []
+        for record in batch:
+            if isinstance(record, threading.Event):
+                # flush() marker: everything queued before it has been written
+                self._write(lines)
+                lines = []
+                record.set()
+                continue
+            
+            timestamp, level, message, kwargs = record
+            now = datetime.fromtimestamp(timestamp)
+            if now.date() != self._current_day:
+                # Day rollover: finish the old file before switching
+                self._write(lines)
+                lines = []
+                self._open_for_day(now)
+            lines.append(self._format(level, message, kwargs, now))
+        self._write(lines)
+    
+    def _run(self):
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                sys.stderr.write(f"Performance log writer error: {e}\n")
+    
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        marker = threading.Event()
+        self._queue.put(marker)
+        return marker.wait(timeout)
+    
+    def close(self):
+        """Flush pending records at interpreter exit"""
+        if self._writer.is_alive():
+            self.flush(timeout=2.0)
     
     @contextmanager
     def timer(self, operation_name, **context):
         """Context manager for timing operations"""
-        start_time = time.time()
-        start_time_ms = start_time * 1000
+        span = tracing.start_span(operation_name)
+        allocations = allocation_tracker.stage_enter(operation_name)
+        start_time = time.perf_counter()
         
         self.log(
             f"START: {operation_name}",
@@ -107,9 +174,10 @@ class PerformanceLogger:
         try:
             yield
         finally:
-            end_time = time.time()
-            end_time_ms = end_time * 1000
-            duration_ms = (end_time - start_time) * 1000
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            tracing.end_span(span)
+            allocation_tracker.stage_exit(allocations)
+            metrics_registry.observe_duration(operation_name, duration_ms / 1000)
             
             self.log(
                 f"END: {operation_name}",
@@ -119,7 +187,10 @@ class PerformanceLogger:
 
 
 # Global performance logger instance
-perf_logger = PerformanceLogger()
+perf_logger = PerformanceLogger(
+    base_log_dir=config.service.perf_log_dir,
+    console=config.service.perf_log_console,
+)
 
 
 @contextmanager
@@ -142,6 +213,7 @@ def log_metric(metric_name, value, **context):
     Usage:
         log_metric("face_distance", 0.35, staff_id="EMP001")
     """
+    metrics_registry.observe_metric(metric_name, value)
     perf_logger.log(
         f"METRIC: {metric_name} = {value}",
         value=value,
@@ -156,6 +228,7 @@ def log_event(event_name, **context):
     Usage:
         log_event("face_matched", staff_id="EMP001", confidence=0.95)
     """
+    metrics_registry.count_event(event_name)
     perf_logger.log(
         f"EVENT: {event_name}",
         **context
@@ -169,6 +242,7 @@ def log_error_metric(error_type, error_message, **context):
     Usage:
         log_error_metric("face_detection_failed", str(e), image_path="test.jpg")
     """
+    metrics_registry.count_error(error_type)
     perf_logger.log(
         f"ERROR: {error_type} - {error_message}",
         level='error',
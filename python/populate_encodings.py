@@ -1,46 +1,233 @@
 #!/usr/bin/env python3
 """
-One-time script to populate missing face_encoding values in database.
+Script to populate missing face_encoding values in database.
 This will dramatically improve face recognition performance.
 
+Images are encoded in parallel on all cores. Results are written with
+batched UPDATEs and committed every --batch-size rows, so a crash loses at
+most one batch. Every committed or permanently failed staff member is
+appended to a checkpoint file, and reruns skip them. A failed staff member
+is retried once their image path changes or --retry-failed is given.
+Staff whose encoding was cleared again after a run (e.g. a new photo at
+the same path) can be forced with --reset-checkpoint.
+
+With --watch the script runs as a daemon for newly enrolled staff. It
+waits for a NOTIFY from the staff trigger, or polls every --interval
+seconds, and encodes staff whose encoding is missing or was computed from
+an older photo. It writes the encodings back and asks the recognizer to
+pull them in (POST /gallery/refresh), so a new enrollment is recognisable
+within seconds. Stale-photo detection and NOTIFY need
+backend/sql/migration_add_encoding_tracking.sql.
+
 Usage:
     python populate_encodings.py
+    python populate_encodings.py --yes --workers 4 --batch-size 100
+    python populate_encodings.py --yes --retry-failed
+    python populate_encodings.py --watch --workers 2 --interval 10
 """
 
 import os
 import json
+import time
 import logging
+import select
+import argparse
 import sys
 from datetime import datetime
+from multiprocessing import Pool
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(__file__))
 
 import face_recognition
+import psycopg2
+import requests
+import urllib3
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
 from config import config
 from recognizer_service import get_db_conn, BACKEND_ROOT
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f'populate_encodings_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHECKPOINT = 'populate_encodings.checkpoint.jsonl'
+
+# Channel raised by trg_staff_face_changed (migration_add_encoding_tracking.sql)
+NOTIFY_CHANNEL = 'staff_face_changed'
+
+# Wait after a notification so a bulk import is encoded in one pass
+NOTIFY_DEBOUNCE_SECONDS = 0.5
+
+MISSING_CONDITION = "(face_encoding IS NULL OR face_encoding = '')"
+STALE_CONDITION = "face_encoding_image_path IS DISTINCT FROM face_image_path"
+
+
+def configure_logging():
+    # Only the parent process writes the log file; pool workers just compute
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(f'populate_encodings_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+class Checkpoint:
+    """Append-only JSONL record of staff already handled by earlier runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # Later lines win
+                    self.entries[entry["staff_id"]] = entry
+
+    def should_skip(self, staff_id, face_image_path, retry_failed):
+        entry = self.entries.get(staff_id)
+        # A new upload always gets another chance
+        if entry is None or entry.get("image") != face_image_path:
+            return False
+        return entry.get("status") == "done" or not retry_failed
+
+    def failed_with(self, staff_id, face_image_path):
+        entry = self.entries.get(staff_id)
+        return entry is not None and entry.get("status") == "failed" and entry.get("image") == face_image_path
+
+    def record(self, entries):
+        for entry in entries:
+            self.entries[entry["staff_id"]] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def encode_staff(job):
+    """Pool worker: (staff_id, full_name, face_image_path) -> (staff_id, full_name, path, encoding_json, error)"""
+    staff_id, full_name, face_image_path = job
+    if not face_image_path:
+        return staff_id, full_name, face_image_path, None, "No image path"
+
+    # Build absolute path
+    img_path = face_image_path if os.path.isabs(face_image_path) else os.path.join(BACKEND_ROOT, face_image_path)
+    if not os.path.exists(img_path):
+        return staff_id, full_name, face_image_path, None, f"File not found: {img_path}"
+
+    try:
+        image = face_recognition.load_image_file(img_path)
+        encodings = face_recognition.face_encodings(image)
+    except Exception as e:
+        return staff_id, full_name, face_image_path, None, str(e)
+    if not encodings:
+        return staff_id, full_name, face_image_path, None, "No face detected in image"
+    return staff_id, full_name, face_image_path, json.dumps(encodings[0].tolist()), None
+
+
+def has_encoding_tracking(conn):
+    """True once migration_add_encoding_tracking.sql has been applied"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_name = 'staff'
+            AND column_name IN ('face_encoding_image_path', 'face_encoding_updated_at')
+        """)
+        found = cur.fetchone()[0] == 2
+    conn.commit()
+    return found
+
+
+def write_batch(conn, batch, tracking=False):
+    """One UPDATE for the whole batch of (staff_id, encoding_json, image_path), then commit"""
+    with conn.cursor() as cur:
+        if tracking:
+            # Record the photo the encoding came from; if it was replaced meanwhile the row stays stale
+            execute_values(cur, """
+                UPDATE staff AS s
+                SET face_encoding = v.face_encoding,
+                    face_encoding_image_path = v.image_path,
+                    face_encoding_updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(staff_id, face_encoding, image_path)
+                WHERE s.staff_id = v.staff_id
+            """, batch, page_size=len(batch))
+        else:
+            execute_values(cur, """
+                UPDATE staff AS s
+                SET face_encoding = v.face_encoding
+                FROM (VALUES %s) AS v(staff_id, face_encoding)
+                WHERE s.staff_id = v.staff_id
+            """, [(staff_id, encoding_json) for staff_id, encoding_json, _ in batch], page_size=len(batch))
+    conn.commit()
 
-def populate_missing_encodings():
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def encode_jobs(pool, conn, jobs, batch_size, checkpoint, tracking):
+    """Encode jobs on the pool, writing and checkpointing every batch_size results"""
+    success_count = 0
+    failed_staff = []
+    pending = []
+    pending_checkpoint = []
+    total = len(jobs)
+    start_time = time.time()
+    
+    def flush():
+        if pending:
+            write_batch(conn, pending, tracking)
+            pending.clear()
+        # Checkpoint only after the commit so a crash never marks unsaved work as done
+        checkpoint.record(pending_checkpoint)
+        pending_checkpoint.clear()
+    
+    for idx, (staff_id, full_name, image_path, encoding_json, error) in enumerate(
+            pool.imap_unordered(encode_staff, jobs), 1):
+        elapsed = time.time() - start_time
+        eta = elapsed / idx * (total - idx)
+        progress = f"[{idx}/{total} {idx / total * 100:5.1f}% ETA {format_duration(eta)}]"
+        
+        if error:
+            logger.warning(f"{progress} ⚠️  {staff_id} - {full_name}: {error}")
+            failed_staff.append((staff_id, full_name, error))
+            pending_checkpoint.append({"staff_id": staff_id, "status": "failed", "reason": error, "image": image_path})
+        else:
+            logger.info(f"{progress} ✅ {staff_id} - {full_name}")
+            success_count += 1
+            pending.append((staff_id, encoding_json, image_path))
+            pending_checkpoint.append({"staff_id": staff_id, "status": "done", "image": image_path})
+        
+        if len(pending_checkpoint) >= batch_size:
+            flush()
+    flush()
+    return success_count, failed_staff
+
+
+def populate_missing_encodings(workers=None, batch_size=50, checkpoint_path=DEFAULT_CHECKPOINT, retry_failed=False):
     """
-    One-time script to populate face_encoding in database for all staff members.
+    Populate face_encoding in database for all active staff members that lack one.
     This improves performance by avoiding file-based encoding generation.
     """
+    workers = workers or os.cpu_count() or 1
     logger.info("="*60)
     logger.info("Starting Face Encoding Population Process")
     logger.info("="*60)
     
+    checkpoint = Checkpoint(checkpoint_path)
+    
     try:
         with get_db_conn() as conn:
             cur = conn.cursor()
@@ -52,85 +239,35 @@ def populate_missing_encodings():
                 FROM staff 
                 WHERE is_active = TRUE 
                 AND (face_encoding IS NULL OR face_encoding = '')
+                ORDER BY staff_id
             """)
             
             missing_staff = cur.fetchall()
-            total_missing = len(missing_staff)
+            conn.commit()
+            tracking = has_encoding_tracking(conn)
+            jobs = [row for row in missing_staff if not checkpoint.should_skip(row[0], row[2], retry_failed)]
+            skipped = len(missing_staff) - len(jobs)
+            total_missing = len(jobs)
             
+            if skipped:
+                logger.info(f"Skipping {skipped} staff already handled according to {checkpoint_path}")
             if total_missing == 0:
-                logger.info("✅ All active staff already have face encodings!")
+                logger.info("✅ Nothing to do: all remaining staff are done or failed in an earlier run")
                 return
             
-            logger.info(f"Found {total_missing} staff members with missing encodings")
+            logger.info(f"Encoding {total_missing} staff members with {workers} workers, committing every {batch_size} rows")
             logger.info("-"*60)
             
-            success_count = 0
-            failed_count = 0
-            failed_staff = []
-            
-            for idx, (staff_id, full_name, face_image_path) in enumerate(missing_staff, 1):
-                logger.info(f"[{idx}/{total_missing}] Processing {staff_id} - {full_name}")
-                
-                try:
-                    if not face_image_path:
-                        logger.warning(f"  ⚠️  No face image path for {staff_id}")
-                        failed_count += 1
-                        failed_staff.append((staff_id, full_name, "No image path"))
-                        continue
-                    
-                    # Build absolute path
-                    img_path = face_image_path if os.path.isabs(face_image_path) else os.path.join(BACKEND_ROOT, face_image_path)
-                    
-                    if not os.path.exists(img_path):
-                        logger.warning(f"  ⚠️  Image file not found: {img_path}")
-                        failed_count += 1
-                        failed_staff.append((staff_id, full_name, f"File not found: {img_path}"))
-                        continue
-                    
-                    logger.info(f"  📷 Loading image from: {img_path}")
-                    
-                    # Load image and generate encoding
-                    image = face_recognition.load_image_file(img_path)
-                    encodings = face_recognition.face_encodings(image)
-                    
-                    if not encodings:
-                        logger.warning(f"  ⚠️  No face detected in image for {staff_id}")
-                        failed_count += 1
-                        failed_staff.append((staff_id, full_name, "No face detected in image"))
-                        del image
-                        continue
-                    
-                    # Convert encoding to JSON
-                    encoding_json = json.dumps(encodings[0].tolist())
-                    
-                    # Update database
-                    cur.execute("""
-                        UPDATE staff 
-                        SET face_encoding = %s 
-                        WHERE staff_id = %s
-                    """, (encoding_json, staff_id))
-                    
-                    logger.info(f"  ✅ Successfully populated encoding for {staff_id}")
-                    success_count += 1
-                    
-                    # Clean up
-                    del image
-                    del encodings
-                    
-                except Exception as e:
-                    logger.error(f"  ❌ Failed to generate encoding for {staff_id}: {str(e)}")
-                    failed_count += 1
-                    failed_staff.append((staff_id, full_name, str(e)))
-                    continue
-            
-            # Commit all changes
-            conn.commit()
+            start_time = time.time()
+            with Pool(processes=workers) as pool:
+                success_count, failed_staff = encode_jobs(pool, conn, jobs, batch_size, checkpoint, tracking)
+            failed_count = len(failed_staff)
             
             # Print summary
             logger.info("="*60)
             logger.info("SUMMARY")
             logger.info("="*60)
-            logger.info(f"Total Staff Processed: {total_missing}")
+            logger.info(f"Total Staff Processed: {total_missing} in {format_duration(time.time() - start_time)}")
             logger.info(f"✅ Success: {success_count}")
             logger.info(f"❌ Failed: {failed_count}")
             
@@ -140,6 +277,7 @@ def populate_missing_encodings():
                 logger.info("-"*60)
                 for staff_id, full_name, reason in failed_staff:
                     logger.info(f"  {staff_id} - {full_name}: {reason}")
+                logger.info("(Failed staff are skipped on the next run unless their image changes or --retry-failed is given)")
             
             logger.info("="*60)
             logger.info("✅ Database encoding population complete!")
@@ -153,6 +291,7 @@ def populate_missing_encodings():
                 AND (face_encoding IS NULL OR face_encoding = '')
             """)
             remaining = cur.fetchone()[0]
+            conn.commit()
             
             if remaining > 0:
                 logger.warning(f"⚠️  {remaining} staff members still have missing encodings")
@@ -166,6 +305,111 @@ def populate_missing_encodings():
         raise
 
 
+def find_pending(conn, tracking):
+    """Active staff with a photo whose encoding is missing or (with tracking) was made from another photo"""
+    condition = f"({MISSING_CONDITION} OR {STALE_CONDITION})" if tracking else MISSING_CONDITION
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT staff_id, full_name, face_image_path
+            FROM staff
+            WHERE is_active = TRUE
+            AND face_image_path IS NOT NULL AND face_image_path != ''
+            AND {condition}
+            ORDER BY staff_id
+        """)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def default_recognizer_url():
+    scheme = 'https' if config.service.ssl_enabled else 'http'
+    return f"{scheme}://localhost:{config.service.port}"
+
+
+def notify_recognizer(recognizer_url):
+    """Ask the recognizer to pull the new encodings instead of waiting for its cache TTL"""
+    try:
+        response = requests.post(f"{recognizer_url.rstrip('/')}/gallery/refresh", timeout=5, verify=False)
+        if response.ok:
+            logger.info(f"🔄 Recognizer gallery refreshed: {response.json()}")
+        else:
+            logger.warning(f"⚠️  Recognizer refresh returned HTTP {response.status_code}")
+    except requests.RequestException as e:
+        # Not fatal: the recognizer still picks the rows up when its cache expires
+        logger.warning(f"⚠️  Could not reach recognizer at {recognizer_url}: {e}")
+
+
+def open_listener():
+    """Autocommit connection LISTENing on the staff trigger channel, or None if unavailable"""
+    try:
+        listener = psycopg2.connect(**config.database.get_connection_params())
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with listener.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return listener
+    except psycopg2.Error as e:
+        logger.warning(f"⚠️  LISTEN {NOTIFY_CHANNEL} failed, polling only: {e}")
+        return None
+
+
+def wait_for_change(listener, timeout):
+    """Block until a staff photo changes or timeout passes. Returns the listener (None if it broke)"""
+    if listener is None:
+        time.sleep(timeout)
+        return None
+    try:
+        if select.select([listener], [], [], timeout) != ([], [], []):
+            time.sleep(NOTIFY_DEBOUNCE_SECONDS)
+            listener.poll()
+            changed = {notify.payload for notify in listener.notifies}
+            listener.notifies.clear()
+            logger.info(f"📨 Photo changed for {len(changed)} staff")
+        return listener
+    except (psycopg2.Error, OSError, ValueError) as e:
+        logger.warning(f"⚠️  Lost LISTEN connection, polling until it is re-opened: {e}")
+        try:
+            listener.close()
+        except psycopg2.Error:
+            pass
+        return None
+
+
+def watch_encodings(workers=2, batch_size=20, interval=10.0, checkpoint_path=DEFAULT_CHECKPOINT,
+                    recognizer_url=None, listen=True):
+    """
+    Keep encodings current: encode new or re-photographed staff as they appear,
+    then tell the recognizer to refresh. Runs until interrupted.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    listener = None
+    logger.info("="*60)
+    logger.info(f"Watching for new enrollments ({workers} workers, poll every {interval}s)")
+    logger.info("="*60)
+    
+    with Pool(processes=workers) as pool:
+        while True:
+            try:
+                if listen and listener is None:
+                    listener = open_listener()
+                with get_db_conn() as conn:
+                    tracking = has_encoding_tracking(conn)
+                    # A photo that already failed is retried only after it is replaced
+                    jobs = [row for row in find_pending(conn, tracking)
+                            if not checkpoint.failed_with(row[0], row[2])]
+                    if jobs:
+                        logger.info(f"Encoding {len(jobs)} new or changed staff photos")
+                        success_count, failed_staff = encode_jobs(pool, conn, jobs, batch_size, checkpoint, tracking)
+                        logger.info(f"✅ {success_count} encoded, ❌ {len(failed_staff)} failed")
+                        if success_count and recognizer_url:
+                            notify_recognizer(recognizer_url)
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Watch cycle failed, retrying in {interval}s: {e}")
+            listener = wait_for_change(listener, interval)
+
+
 def check_encoding_status():
     """Check and display current encoding status"""
     logger.info("Checking current encoding status...")
@@ -212,7 +456,43 @@ def check_encoding_status():
         return -1
 
 
-if __name__ == '__main__':
+def main():
+    parser = argparse.ArgumentParser(description='Populate missing face encodings in the staff table')
+    parser.add_argument('--yes', '-y', action='store_true', help='Do not ask for confirmation (scheduled runs)')
+    parser.add_argument('--workers', type=int, help='Parallel encoding processes (default: all cores, 2 with --watch)')
+    parser.add_argument('--batch-size', type=int, default=50, help='Rows written and committed per batch')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Checkpoint file used to skip finished staff')
+    parser.add_argument('--retry-failed', action='store_true', help='Retry staff that failed in an earlier run')
+    parser.add_argument('--reset-checkpoint', action='store_true', help='Forget earlier runs and process every missing encoding')
+    parser.add_argument('--watch', action='store_true', help='Keep running and encode new or changed staff photos as they appear')
+    parser.add_argument('--interval', type=float, default=10.0, help='Watch mode: seconds between polls')
+    parser.add_argument('--no-listen', action='store_true', help='Watch mode: poll only, do not LISTEN for staff photo changes')
+    parser.add_argument('--recognizer-url', default=default_recognizer_url(), help='Watch mode: recognizer asked to refresh its gallery')
+    parser.add_argument('--no-refresh', action='store_true', help='Watch mode: do not call the recognizer after encoding')
+    args = parser.parse_args()
+    
+    configure_logging()
+    
+    if args.reset_checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+        logger.info(f"Removed checkpoint {args.checkpoint}")
+    
+    if args.watch:
+        # The recognizer normally runs with a self-signed certificate
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        try:
+            watch_encodings(
+                workers=max(1, args.workers or 2),
+                batch_size=max(1, args.batch_size),
+                interval=max(0.5, args.interval),
+                checkpoint_path=args.checkpoint,
+                recognizer_url=None if args.no_refresh else args.recognizer_url,
+                listen=not args.no_listen,
+            )
+        except KeyboardInterrupt:
+            print("\n👋 Watcher stopped\n")
+        return
+    
     print("\n" + "="*60)
     print("Face Encoding Population Script")
     print("="*60 + "\n")
@@ -229,19 +509,25 @@ if __name__ == '__main__':
         sys.exit(1)
     
     # Ask for confirmation
-    print(f"\nThis script will populate face encodings for {missing_count} staff members.")
+    print(f"\nThis script will populate face encodings for up to {missing_count} staff members.")
     print("This process may take a few minutes.\n")
     
-    response = input("Do you want to continue? (yes/no): ").lower().strip()
-    
-    if response not in ['yes', 'y']:
-        print("\n❌ Operation cancelled by user\n")
-        sys.exit(0)
+    if not args.yes:
+        response = input("Do you want to continue? (yes/no): ").lower().strip()
+        
+        if response not in ['yes', 'y']:
+            print("\n❌ Operation cancelled by user\n")
+            sys.exit(0)
     
     print("\n🚀 Starting encoding population...\n")
     
     try:
-        populate_missing_encodings()
+        populate_missing_encodings(
+            workers=max(1, args.workers or os.cpu_count() or 1),
+            batch_size=max(1, args.batch_size),
+            checkpoint_path=args.checkpoint,
+            retry_failed=args.retry_failed,
+        )
         print("\n✅ Process completed successfully!")
         print("You can now restart the face recognition service for improved performance.\n")
     except Exception as e:
@@ -249,11 +535,5 @@ if __name__ == '__main__':
         sys.exit(1)
 
 
-
-
-
-
-
-
-
-
+if __name__ == '__main__':
+    main()
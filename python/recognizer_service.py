@@ -1,25 +1,37 @@
 import os
-import io
 import json
 import time
 import gc
 import logging
 import traceback
-from typing import Dict, List, Tuple
+import multiprocessing
+from typing import Dict, List, NamedTuple, Tuple
+from collections import deque
 from contextlib import contextmanager
-from threading import Lock
+from threading import Event, Lock, Thread
 
-from flask import Flask, request, jsonify
-from PIL import Image
+from flask import Flask, request, jsonify, Response
 import numpy as np
 import face_recognition
 import psycopg2
 import ssl
 from psycopg2 import pool
 
-from liveness import is_blinking, has_head_movement, detect_face_quality
+from liveness import is_blinking, has_head_movement, detect_face_quality, landmarks_from_shape, frame_gate
+from admin_auth import require_admin, require_role
+from attendance_queue import AttendanceQueue
+from attendance_recorder import crop_face_jpeg, record_face_event
+from allocation_tracker import allocation_tracker, TrackerInactive
 from config import config
+from frame_pool import FramePool
+from gallery_matrix import GalleryMatrix
+from memory_governor import MemoryGovernor
+from metrics import registry as metrics_registry
 from performance_logger import log_performance, log_metric, log_event, log_error_metric
+from sampling_profiler import SamplingProfiler, ProfilerBusy
+from shared_state import RecentMatchCache
+from traffic_capture import TrafficCapture
+import tracing
 #fix recogniser memory leak 29/09/2025
 # Configure logging
 logging.basicConfig(
@@ -38,6 +50,31 @@ BACKEND_ROOT = os.path.join(REPO_ROOT, 'backend')
 
 # Global connection pool
 connection_pool = None
+_pool_lock = Lock()
+_pool_retry_lock = Lock()
+_pool_retry_thread = None
+# Last pool creation error (None once the pool exists) and connections
+# currently checked out through get_db_conn
+db_state = {"error": None, "in_use": 0}
+_checkout_lock = Lock()
+
+# Retry of a failed pool creation or first gallery load: first pause,
+# doubled after every failure up to the cap
+DB_RETRY_INITIAL_SECONDS = 5
+DB_RETRY_MAX_SECONDS = 60
+
+# Side length of the blank frame used to exercise the models at worker start-up
+WARMUP_IMAGE_SIZE = 150
+
+# Per-process warm-up status, reset in each forked worker
+warmup_state = {"warmed_up": False, "warmup_ms": None, "pid": None, "error": None}
+
+# Durations (ms) of the latest requests in this worker, for /ready's p95
+recent_latencies = deque(maxlen=config.service.ready_latency_window)
+
+# Only recognition requests feed the p95; probes, scrapes, reloads and debug
+# runs (a profile takes seconds) would mark the worker saturated
+TIMED_PATHS = frozenset(('/recognize', '/recognize-simple', '/recognize-and-record', '/liveness-check'))
 
 def init_connection_pool():
     """Initialize database connection pool"""
@@ -48,19 +85,64 @@ def init_connection_pool():
             maxconn=config.database.max_connections,
             **config.database.get_connection_params()
         )
+        db_state["error"] = None
         logger.info(f"Database connection pool initialized with {config.database.min_connections}-{config.database.max_connections} connections")
     except Exception as e:
+        db_state["error"] = str(e)
         logger.error(f"Failed to initialize connection pool: {e}")
         raise
 
+def _ensure_pool():
+    """Create the pool if this process has none yet; one creator at a time"""
+    with _pool_lock:
+        if connection_pool is None:
+            init_connection_pool()
+    return connection_pool
+
+def init_pool_in_background():
+    """
+    Keep retrying pool creation on a daemon thread until it succeeds, so a
+    worker that started while the database was down recovers without traffic.
+    Returns at once; does nothing if the pool exists or a retry is running.
+    """
+    global _pool_retry_thread
+    with _pool_retry_lock:
+        if connection_pool is not None or (_pool_retry_thread is not None and _pool_retry_thread.is_alive()):
+            return
+        _pool_retry_thread = Thread(target=_retry_pool, name="db-pool-retry", daemon=True)
+        _pool_retry_thread.start()
+
+def _retry_pool():
+    delay = DB_RETRY_INITIAL_SECONDS
+    while connection_pool is None:
+        time.sleep(delay)
+        try:
+            _ensure_pool()
+        except Exception as e:
+            delay = min(delay * 2, DB_RETRY_MAX_SECONDS)
+            logger.warning(f"Connection pool retry failed: {e}; next attempt in {delay}s")
+
+def close_connection_pool():
+    """Close every connection held by the pool and forget it"""
+    global connection_pool
+    if connection_pool is not None:
+        try:
+            connection_pool.closeall()
+            logger.info("Database connection pool closed")
+        except Exception as e:
+            logger.warning(f"Error closing connection pool: {e}")
+        connection_pool = None
+
 @contextmanager
 def get_db_conn():
     """Get database connection from pool with proper cleanup"""
     conn = None
+    pool_ = None
     try:
-        if connection_pool is None:
-            init_connection_pool()
-        conn = connection_pool.getconn()
+        pool_ = _ensure_pool()
+        conn = pool_.getconn()
+        with _checkout_lock:
+            db_state["in_use"] += 1
         yield conn
     except Exception as e:
         logger.error(f"Database connection error: {e}")
@@ -69,23 +151,59 @@ def get_db_conn():
         raise
     finally:
         if conn:
-            connection_pool.putconn(conn)
+            # Back to the pool it came from, even if the global was replaced meanwhile
+            pool_.putconn(conn)
+            with _checkout_lock:
+                db_state["in_use"] -= 1
+
+# Collects garbage in the background when RSS or allocation thresholds are crossed
+memory_governor = MemoryGovernor(
+    check_interval=config.service.memory_check_interval,
+    rss_growth_mb=config.service.memory_gc_rss_growth_mb,
+    max_requests=config.service.memory_gc_max_requests,
+    pending_threshold=config.service.memory_gc_pending_threshold,
+)
 
-def cleanup_resources():
-    """Clean up resources to prevent memory leaks"""
-    try:
-        gc.collect()
-        logger.debug("Memory cleanup completed")
-    except Exception as e:
-        logger.warning(f"Error during cleanup: {e}")
+# Preallocated decode buffers reused across requests in this worker
+frame_pool = FramePool(
+    max_per_shape=config.service.frame_pool_max_per_shape,
+    max_shapes=config.service.frame_pool_max_shapes,
+)
+
+def cleanup_resources(reason="cleanup"):
+    """Ask the memory governor for a collection off the request path"""
+    memory_governor.request_collection(reason)
+    logger.debug(f"Memory cleanup scheduled ({reason})")
 
 
-def load_known_faces() -> Tuple[List[np.ndarray], List[str], Dict[str, Dict[str, str]]]:
-    """Load known faces from database with proper error handling"""
+def load_known_faces() -> Tuple[np.ndarray, List[str], Dict[str, Dict[str, str]]]:
+    """
+    Load known faces from database with proper error handling.
+    Rows are streamed through a named (server-side) cursor in batches of
+    GALLERY_FETCH_BATCH_SIZE and decoded straight into the gallery matrix, so
+    the full result set is never held in memory at once.
+    """
+    batch_size = config.service.gallery_fetch_batch_size
+    staff_ids: List[str] = []
+    staff_meta: Dict[str, Dict[str, str]] = {}
+    # Staff without a usable stored encoding; only ids and paths are kept
+    needs_image: List[Tuple[str, str, str]] = []
+
+    rows_fetched = 0
+    encodings_from_db = 0
+    encodings_from_files = 0
+    failed_encodings = 0
+
     try:
-        with log_performance("database_query_staff"):
+        with log_performance("database_query_staff", batch_size=batch_size):
             with get_db_conn() as conn:
-                cur = conn.cursor()
+                count_cur = conn.cursor()
+                count_cur.execute("SELECT COUNT(*) FROM staff WHERE is_active = TRUE")
+                gallery = GalleryMatrix(count_cur.fetchone()[0])
+                count_cur.close()
+
+                cur = conn.cursor(name="load_known_faces")
+                cur.itersize = batch_size
                 cur.execute(
                     """
                     SELECT staff_id, full_name, COALESCE(face_encoding, ''), COALESCE(face_image_path, '')
@@ -93,68 +211,68 @@ def load_known_faces() -> Tuple[List[np.ndarray], List[str], Dict[str, Dict[str,
                     WHERE is_active = TRUE
                     """
                 )
-                rows = cur.fetchall()
-                log_metric("staff_records_fetched", len(rows))
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    rows_fetched += len(batch)
+                    with log_performance("load_encoding_batch", rows=len(batch)):
+                        for staff_id, full_name, face_encoding_text, face_image_path in batch:
+                            if face_encoding_text:
+                                try:
+                                    arr = np.array(json.loads(face_encoding_text), dtype='float64')
+                                    if arr.ndim == 1 and arr.shape[0] == 128:
+                                        gallery.append(arr)
+                                        staff_ids.append(staff_id)
+                                        staff_meta[staff_id] = {"full_name": full_name}
+                                        encodings_from_db += 1
+                                        continue
+                                except Exception as e:
+                                    logger.warning(f"Failed to load encoding for {staff_id}: {e}")
+                                    log_error_metric(f"encoding_load_failed", str(e), staff_id=staff_id)
+                                    failed_encodings += 1
+                            if face_image_path:
+                                needs_image.append((staff_id, full_name, face_image_path))
+                    del batch
+                cur.close()
+                # End the read transaction before the connection goes back to the pool
+                conn.commit()
+                log_metric("staff_records_fetched", rows_fetched)
     except Exception as e:
         logger.error(f"Error loading known faces: {e}")
         log_error_metric("database_load_error", str(e))
-        return [], [], {}
-
-    encodings: List[np.ndarray] = []
-    staff_ids: List[str] = []
-    staff_meta: Dict[str, Dict[str, str]] = {}
-
-    encodings_from_db = 0
-    encodings_from_files = 0
-    failed_encodings = 0
+        # Raise so the store keeps its current gallery and version instead of
+        # publishing an empty one as loaded
+        raise
 
-    for staff_id, full_name, face_encoding_text, face_image_path in rows:
-        encoding_loaded = False
+    # Slow path, outside the DB transaction: encode from the stored photo
+    for staff_id, full_name, face_image_path in needs_image:
+        # Build absolute path if relative like 'uploads/faces/...'
+        img_path = face_image_path
+        if not os.path.isabs(img_path):
+            img_path = os.path.join(BACKEND_ROOT, img_path)
+        if not os.path.exists(img_path):
+            continue
         try:
-            if face_encoding_text:
-                try:
-                    with log_performance(f"load_encoding_{staff_id}"):
-                        arr = np.array(json.loads(face_encoding_text), dtype='float64')
-                        if arr.ndim == 1 and arr.shape[0] == 128:
-                            encodings.append(arr)
-                            staff_ids.append(staff_id)
-                            staff_meta[staff_id] = {"full_name": full_name}
-                            encoding_loaded = True
-                            encodings_from_db += 1
-                except Exception as e:
-                    logger.warning(f"Failed to load encoding for {staff_id}: {e}")
-                    log_error_metric(f"encoding_load_failed", str(e), staff_id=staff_id)
-                    failed_encodings += 1
-            
-            if not encoding_loaded and face_image_path:
-                # Build absolute path if relative like 'uploads/faces/...'
-                img_path = face_image_path
-                if not os.path.isabs(img_path):
-                    img_path = os.path.join(BACKEND_ROOT, img_path)
-                if os.path.exists(img_path):
-                    try:
-                        with log_performance(f"generate_encoding_{staff_id}"):
-                            image = face_recognition.load_image_file(img_path)
-                            encs = face_recognition.face_encodings(image)
-                            if encs:
-                                encodings.append(encs[0])
-                                staff_ids.append(staff_id)
-                                staff_meta[staff_id] = {"full_name": full_name}
-                                encodings_from_files += 1
-                                # Clean up image data
-                                del image
-                    except Exception as e:
-                        logger.warning(f"Failed to process image for {staff_id}: {e}")
-                        log_error_metric("image_encoding_failed", str(e), staff_id=staff_id)
-                        failed_encodings += 1
+            with log_performance(f"generate_encoding_{staff_id}"):
+                image = face_recognition.load_image_file(img_path)
+                encs = face_recognition.face_encodings(image)
+                if encs:
+                    gallery.append(encs[0])
+                    staff_ids.append(staff_id)
+                    staff_meta[staff_id] = {"full_name": full_name}
+                    encodings_from_files += 1
+                # Clean up image data
+                del image
         except Exception as e:
-            logger.error(f"Error processing staff {staff_id}: {e}")
-            log_error_metric("staff_processing_error", str(e), staff_id=staff_id)
+            logger.warning(f"Failed to process image for {staff_id}: {e}")
+            log_error_metric("image_encoding_failed", str(e), staff_id=staff_id)
             failed_encodings += 1
-            continue
 
-    # Clean up resources
-    cleanup_resources()
+    encodings = gallery.finish()
+
+    # Reload leaves a lot of garbage behind; let the governor collect it when idle
+    cleanup_resources("gallery_reload")
     logger.info(f"Loaded {len(encodings)} known faces")
     
     log_metric("encodings_from_database", encodings_from_db)
@@ -167,12 +285,70 @@ def load_known_faces() -> Tuple[List[np.ndarray], List[str], Dict[str, Dict[str,
 
 app = Flask(__name__)
 
+# Request recorder for load replay; None unless CAPTURE_ENABLED=true
+traffic_capture = TrafficCapture(
+    directory=config.service.capture_dir,
+    sample_rate=config.service.capture_sample_rate,
+    frame_sample_rate=config.service.capture_frame_sample_rate,
+) if config.service.capture_enabled else None
+
+# Write-behind journal for /recognize-and-record; None unless ATTENDANCE_QUEUE_ENABLED=true
+attendance_queue = AttendanceQueue(
+    directory=config.service.attendance_queue_dir,
+    backend_root=BACKEND_ROOT,
+    connection_factory=get_db_conn,
+    batch_size=config.service.attendance_queue_batch_size,
+    flush_interval=config.service.attendance_queue_flush_interval,
+) if config.service.attendance_queue_enabled else None
+
+
+@app.before_request
+def track_request_start():
+    memory_governor.request_started()
+    tracing.begin(request.headers)
+
+
+@app.teardown_request
+def track_request_end(exc):
+    memory_governor.request_finished()
+    tracing.end()
+
+
+@app.after_request
+def add_timing_headers(response):
+    """Expose the request's trace ID and per-stage timings"""
+    trace = tracing.current()
+    if trace is None:
+        return response
+    trace.finish()
+    if request.path in TIMED_PATHS:
+        recent_latencies.append(trace.total_ms)
+    response.headers['X-Request-ID'] = trace.trace_id
+    response.headers['Server-Timing'] = trace.server_timing()
+
+    if traffic_capture is not None:
+        try:
+            traffic_capture.record(request, response, trace.total_ms, trace.trace_id)
+        except Exception as e:
+            logger.warning(f"Traffic capture failed: {e}")
+
+    # Full span breakdown in the JSON body only when the caller asks for it
+    wants_timing = request.args.get('timing') == '1' or request.headers.get('X-Include-Timing') == '1'
+    if wants_timing and response.is_json:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['timing'] = trace.to_dict()
+            response.set_data(json.dumps(data))
+    return response
+
 
 @app.after_request
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Request-ID, X-Include-Timing, X-Camera-ID'
+    response.headers['Access-Control-Expose-Headers'] = 'Server-Timing, X-Request-ID'
+    response.headers['Timing-Allow-Origin'] = '*'
     return response
 
 
@@ -191,30 +367,163 @@ def health_options():
     return ('', 204)
 
 
+@app.route('/ready', methods=['OPTIONS'])
+def ready_options():
+    return ('', 204)
+
+
 @app.route('/recognize-simple', methods=['OPTIONS'])
 def recognize_simple_options():
     return ('', 204)
 
 
+@app.route('/recognize-and-record', methods=['OPTIONS'])
+def recognize_and_record_options():
+    return ('', 204)
+
+
+@app.route('/recent-matches/mark', methods=['OPTIONS'])
+def mark_recent_match_options():
+    return ('', 204)
+
+
+# Bumped by POST /gallery/refresh. Created before gunicorn forks, so every
+# worker sees the same counter and pulls the changed rows on its next request.
+gallery_generation = multiprocessing.Value('L', 0)
+
+# Overlap between delta queries so rows committed late are not missed
+GALLERY_DELTA_OVERLAP_SECONDS = 5
+
+# Repeat matches of the same person inside the window are flagged "suppressed".
+# The window opens only once attendance has been written (here, or by the kiosk
+# through /recent-matches/mark). Created before gunicorn forks, so a person
+# recorded at one kiosk or worker is suppressed at all of them.
+recent_matches = RecentMatchCache(
+    window_seconds=config.service.match_suppression_seconds,
+    slots=config.service.match_suppression_slots,
+    per_camera=config.service.match_suppression_per_camera,
+) if config.service.match_suppression_seconds > 0 else None
+
+
+def _camera_id():
+    return request.headers.get('X-Camera-ID') or request.form.get('cameraId')
+
+
+def _check_suppressed(staff_id):
+    """(suppressed, seconds since the window opened) for a confident match; does not open one"""
+    if recent_matches is None:
+        return False, None
+    suppressed, age = recent_matches.check(staff_id, _camera_id())
+    if suppressed:
+        log_event("match_suppressed", staff_id=staff_id, seconds_ago=f"{age:.1f}")
+    return suppressed, age
+
+
+def _mark_recorded(staff_id):
+    """Open the suppression window once attendance for staff_id has been written"""
+    if recent_matches is not None:
+        recent_matches.mark(staff_id, _camera_id())
+
+
+def _parse_encoding(face_encoding_text):
+    if not face_encoding_text:
+        return None
+    arr = np.array(json.loads(face_encoding_text), dtype='float64')
+    return arr if arr.ndim == 1 and arr.shape[0] == 128 else None
+
+
+def _face_shape(img, box):
+    """dlib 68-point shape of one face box, shared by liveness and the encoder"""
+    return face_recognition.api._raw_face_landmarks(img, [box], model="large")[0]
+
+
+def _encode_face(img, box, shape):
+    """Encoding of one face; the large encoder reuses the 68-point shape instead of predicting it again"""
+    if config.service.face_encoding_model == 'large':
+        return np.array(face_recognition.api.face_encoder.compute_face_descriptor(img, shape, config.service.face_jitters))
+    encs = face_recognition.face_encodings(img, [box], num_jitters=config.service.face_jitters, model=config.service.face_encoding_model)
+    return encs[0] if encs else None
+
+
+def _quality_gate(img, box, landmarks):
+    """(reason, measurements) when the face is not worth encoding, (None, measurements) otherwise"""
+    if not config.service.quality_gate_enabled:
+        return None, {}
+    with log_performance("quality_gate"):
+        reason, quality = frame_gate(
+            img, box, landmarks,
+            min_face_size=config.service.quality_gate_min_face_size,
+            min_sharpness=config.service.quality_gate_min_sharpness,
+            min_pose_symmetry=config.service.quality_gate_min_pose_symmetry,
+        )
+    if reason:
+        log_event("quality_gate_rejected", reason=reason, **quality)
+    return reason, quality
+
+
+def _retry_response(reason, quality, **extra):
+    """No match attempted: the frame was unusable and the client should send another"""
+    return jsonify({"matches": [], "retry": True, "reason": reason, "quality": quality, **extra})
+
+
+class Gallery(NamedTuple):
+    """
+    One immutable version of the known faces. Row i of encodings belongs to
+    staff_ids[i]; a refresh builds a new Gallery and swaps it in with a single
+    assignment, so a request that reads store.gallery once always sees rows,
+    ids and names from the same version.
+    """
+    encodings: np.ndarray
+    staff_ids: Tuple[str, ...]
+    staff_meta: Dict[str, Dict[str, str]]
+
+
+def _make_gallery(encodings, staff_ids, staff_meta) -> Gallery:
+    encodings.flags.writeable = False
+    return Gallery(encodings, tuple(staff_ids), staff_meta)
+
+
 class FaceStore:
     def __init__(self):
-        self.encodings: List[np.ndarray] = []
-        self.staff_ids: List[str] = []
-        self.staff_meta: Dict[str, Dict[str, str]] = {}
+        self.gallery = _make_gallery(np.empty((0, 128), dtype='float64'), (), {})
         self.last_loaded = 0.0
         self.version = 0
+        # Wall time of the last successful full or incremental sync
+        self.refreshed_at = None
+        # Database time of the last full or incremental load
+        self.synced_at = None
+        self.generation_seen = 0
         self._lock = Lock()
+        self._retry_lock = Lock()
+        self._retry_thread = None
+        self._retry_stop = Event()
+
+    # Convenience views for counts; anything that pairs rows with ids must
+    # read self.gallery once and use that snapshot
+    @property
+    def encodings(self) -> np.ndarray:
+        return self.gallery.encodings
+
+    @property
+    def staff_ids(self) -> Tuple[str, ...]:
+        return self.gallery.staff_ids
+
+    @property
+    def staff_meta(self) -> Dict[str, Dict[str, str]]:
+        return self.gallery.staff_meta
 
     def ensure_loaded(self, force: bool = False):
         cache_ttl = getattr(config.service, "cache_ttl", 0)
         now = time.time()
         needs_reload = (
             force
-            or not self.encodings
+            or len(self.encodings) == 0
             or (cache_ttl > 0 and (now - self.last_loaded) > cache_ttl)
         )
 
         if not needs_reload:
+            if gallery_generation.value != self.generation_seen:
+                self.refresh_changed()
             return
 
         with self._lock:
@@ -222,21 +531,159 @@ class FaceStore:
             now = time.time()
             needs_reload = (
                 force
-                or not self.encodings
+                or len(self.encodings) == 0
                 or (cache_ttl > 0 and (now - self.last_loaded) > cache_ttl)
             )
             if not needs_reload:
                 return
 
-            logger.info("Refreshing known face cache%s", " (forced)" if force else "")
-            self.encodings, self.staff_ids, self.staff_meta = load_known_faces()
-            self.last_loaded = now
-            self.version += 1
-            logger.info(
-                "Known face cache ready with %d entries (version %d)",
-                len(self.staff_ids),
-                self.version,
-            )
+            self._full_reload(force)
+
+    def load_in_background(self):
+        """
+        Keep retrying the first load on a daemon thread until it succeeds, so a
+        worker whose start-up load failed does not stay cold. Returns at once;
+        does nothing if a gallery is loaded or a retry is already running
+        (a thread copied across a fork is not alive in the child).
+        """
+        with self._retry_lock:
+            if self.version or (self._retry_thread is not None and self._retry_thread.is_alive()):
+                return
+            self._retry_stop = Event()
+            self._retry_thread = Thread(target=self._retry_load, args=(self._retry_stop,),
+                                        name="gallery-load-retry", daemon=True)
+            self._retry_thread.start()
+
+    def stop_background_load(self):
+        self._retry_stop.set()
+
+    def _retry_load(self, stop):
+        delay = DB_RETRY_INITIAL_SECONDS
+        while self.version == 0:
+            if stop.wait(delay):
+                return
+            try:
+                self.ensure_loaded()
+            except Exception as e:
+                delay = min(delay * 2, DB_RETRY_MAX_SECONDS)
+                logger.warning(f"Gallery load retry failed: {e}; next attempt in {delay}s")
+        logger.info(f"Gallery loaded after retry ({len(self.staff_ids)} known faces)")
+
+    def _full_reload(self, force=False):
+        logger.info("Refreshing known face cache%s", " (forced)" if force else "")
+        generation = gallery_generation.value
+        try:
+            with get_db_conn() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT NOW()")
+                synced_at = cur.fetchone()[0]
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Could not read database time before reload: {e}")
+            synced_at = None
+        self.gallery = _make_gallery(*load_known_faces())
+        self.synced_at = synced_at
+        self.generation_seen = generation
+        self.last_loaded = time.time()
+        self.refreshed_at = self.last_loaded
+        self.version += 1
+        logger.info(
+            "Known face cache ready with %d entries (version %d)",
+            len(self.staff_ids),
+            self.version,
+        )
+
+    def refresh_changed(self):
+        """
+        Apply only the staff rows whose encoding or record changed since the
+        last load, and drop staff that were deleted or deactivated. Falls back
+        to a full reload if change tracking is unavailable
+        (backend/sql/migration_add_encoding_tracking.sql not applied).
+        """
+        with self._lock:
+            generation = gallery_generation.value
+            if generation == self.generation_seen:
+                return {"upserted": 0, "removed": 0}
+            if self.synced_at is None:
+                self._full_reload()
+                return {"upserted": len(self.staff_ids), "removed": 0, "full": True}
+
+            try:
+                with log_performance("gallery_delta_query"):
+                    with get_db_conn() as conn:
+                        cur = conn.cursor()
+                        cur.execute("SELECT NOW()")
+                        synced_at = cur.fetchone()[0]
+                        cur.execute(
+                            """
+                            SELECT staff_id, full_name, COALESCE(face_encoding, ''), is_active
+                            FROM staff
+                            WHERE face_encoding_updated_at > %s - make_interval(secs => %s)
+                               OR updated_at > %s - make_interval(secs => %s)
+                            """,
+                            (self.synced_at, GALLERY_DELTA_OVERLAP_SECONDS, self.synced_at, GALLERY_DELTA_OVERLAP_SECONDS),
+                        )
+                        changed = cur.fetchall()
+                        cur.execute("SELECT staff_id FROM staff WHERE is_active = TRUE")
+                        active_ids = {row[0] for row in cur.fetchall()}
+                        conn.commit()
+            except Exception as e:
+                logger.warning(f"Incremental gallery refresh failed ({e}); doing a full reload")
+                log_error_metric("gallery_delta_failed", str(e))
+                self._full_reload()
+                return {"upserted": len(self.staff_ids), "removed": 0, "full": True}
+
+            with log_performance("gallery_delta_apply", changed=len(changed)):
+                current = self.gallery
+                index = {staff_id: i for i, staff_id in enumerate(current.staff_ids)}
+                encodings = current.encodings.copy()
+                staff_ids = list(current.staff_ids)
+                staff_meta = dict(current.staff_meta)
+                new_rows = []
+                removed = {staff_id for staff_id in staff_ids if staff_id not in active_ids}
+                upserted = 0
+
+                for staff_id, full_name, face_encoding_text, is_active in changed:
+                    try:
+                        arr = _parse_encoding(face_encoding_text) if is_active else None
+                    except Exception as e:
+                        logger.warning(f"Failed to load encoding for {staff_id}: {e}")
+                        arr = None
+                    if arr is None:
+                        # Keep a file-generated encoding rather than dropping an active staff member
+                        if not is_active:
+                            removed.add(staff_id)
+                        continue
+                    removed.discard(staff_id)
+                    i = index.get(staff_id)
+                    if i is None:
+                        index[staff_id] = len(staff_ids)
+                        staff_ids.append(staff_id)
+                        new_rows.append(arr)
+                    else:
+                        encodings[i] = arr
+                    staff_meta[staff_id] = {"full_name": full_name}
+                    upserted += 1
+
+                if new_rows:
+                    encodings = np.vstack([encodings, np.array(new_rows)])
+                if removed:
+                    keep = [i for i, staff_id in enumerate(staff_ids) if staff_id not in removed]
+                    encodings = encodings[keep]
+                    staff_ids = [staff_ids[i] for i in keep]
+                    for staff_id in removed:
+                        staff_meta.pop(staff_id, None)
+
+                self.gallery = _make_gallery(encodings, staff_ids, staff_meta)
+                self.synced_at = synced_at
+                self.generation_seen = generation
+                self.refreshed_at = time.time()
+                if upserted or removed:
+                    self.version += 1
+
+            log_event("gallery_delta_applied", upserted=upserted, removed=len(removed), known=len(staff_ids))
+            logger.info(f"Gallery refreshed incrementally: {upserted} upserted, {len(removed)} removed, {len(staff_ids)} known")
+            return {"upserted": upserted, "removed": len(removed)}
 
 
 store = FaceStore()
@@ -247,12 +694,246 @@ def health():
     return jsonify({"status": "ok", "known": len(store.staff_ids)})
 
 
+def _pool_usage():
+    if connection_pool is None:
+        return None
+    return {"inUse": db_state["in_use"], "max": config.database.max_connections}
+
+
+def _listen_backlog(port):
+    """
+    Connections waiting in the kernel's accept queue of the service port, i.e.
+    requests no worker has picked up yet (shared by all gunicorn workers).
+    Linux only (/proc/net/tcp*); None elsewhere.
+    """
+    waiting = None
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table, 'r', encoding='ascii') as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # st 0A is LISTEN; for a listener rx_queue is the accept queue length
+                    if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) == port:
+                        waiting = (waiting or 0) + int(fields[4].split(':')[1], 16)
+        except (OSError, StopIteration, IndexError, ValueError):
+            continue
+    return waiting
+
+
+@app.get('/ready')
+def ready():
+    """
+    Readiness of this worker for supervisors and load balancers. Reads only
+    in-memory state (no database or model calls), so it is safe to poll often.
+    503 while cold (warm-up or first gallery load not done) or saturated.
+    A missing gallery starts a background load retry rather than waiting here.
+    """
+    now = time.time()
+    if connection_pool is None:
+        init_pool_in_background()
+    if store.version == 0:
+        store.load_in_background()
+    # A single-threaded worker (gunicorn sync) is busy with this request, so
+    # its in-flight count is always 0; queueing shows in the listen backlog
+    threaded = bool(request.environ.get('wsgi.multithread'))
+    # This request is counted too
+    in_flight = max(0, memory_governor.in_flight - 1) if threaded else None
+    latencies = list(recent_latencies)
+    p95_ms = float(np.percentile(latencies, 95)) if latencies else None
+    db_pool = _pool_usage()
+
+    warming_up = not warmup_state["warmed_up"] and warmup_state["error"] is None
+    cold_reasons = []
+    if warming_up:
+        cold_reasons.append("model_warmup")
+    if connection_pool is None:
+        cold_reasons.append("db_unavailable")
+    if store.version == 0:
+        cold_reasons.append("gallery_not_loaded")
+    busy_reasons = []
+    if threaded and config.service.ready_max_in_flight > 0 and in_flight >= config.service.ready_max_in_flight:
+        busy_reasons.append("in_flight")
+    if db_pool is not None and db_pool["inUse"] >= db_pool["max"]:
+        busy_reasons.append("db_pool_exhausted")
+    if config.service.ready_max_p95_ms > 0 and p95_ms is not None and p95_ms > config.service.ready_max_p95_ms:
+        busy_reasons.append("p95_latency")
+
+    status = "cold" if cold_reasons else "saturated" if busy_reasons else "ready"
+    body = {
+        "status": status,
+        "reasons": cold_reasons + busy_reasons,
+        "pid": os.getpid(),
+        "warmup": {
+            "warmedUp": warmup_state["warmed_up"],
+            "warmupMs": warmup_state["warmup_ms"],
+            "error": warmup_state["error"],
+        },
+        "gallery": {
+            "known": len(store.staff_ids),
+            "version": store.version,
+            "ageSeconds": round(now - store.refreshed_at, 1) if store.refreshed_at else None,
+        },
+        "dbPool": db_pool,
+        "dbError": db_state["error"] if connection_pool is None else None,
+        "inFlight": in_flight,
+        "maxInFlight": config.service.ready_max_in_flight if threaded else None,
+        "listenBacklog": _listen_backlog(config.service.port),
+        "p95Ms": round(p95_ms, 1) if p95_ms is not None else None,
+        "latencySamples": len(latencies),
+    }
+    return jsonify(body), 200 if status == "ready" else 503
+
+
+@app.get('/memory-stats')
+def memory_stats():
+    """Per-worker memory and garbage collection statistics"""
+    stats = memory_governor.stats()
+    stats["frame_pool"] = frame_pool.stats()
+    if traffic_capture is not None:
+        stats["traffic_capture"] = traffic_capture.stats()
+    if attendance_queue is not None:
+        stats["attendance_queue"] = attendance_queue.stats()
+    if recent_matches is not None:
+        stats["recent_matches"] = recent_matches.stats()
+    return jsonify(stats)
+
+
+@app.get('/metrics')
+def metrics():
+    """Prometheus text-format histograms and counters for this worker"""
+    memory = memory_governor.stats()
+    metrics_registry.set_gauge("recognizer_known_faces", len(store.staff_ids), "Identities in the loaded gallery")
+    metrics_registry.set_gauge("recognizer_gallery_version", store.version, "Gallery reload counter")
+    metrics_registry.set_gauge("recognizer_process_rss_bytes", int(memory["rss_mb"] * 1024 * 1024), "Resident memory of this worker")
+    metrics_registry.set_gauge("recognizer_requests_in_flight", memory["requests_in_flight"], "Requests currently being handled")
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Stack sampler for live diagnosis; idle until an admin requests a profile
+profiler = SamplingProfiler(max_duration=config.service.profiler_max_seconds)
+
+
+@app.post('/debug/profile')
+@require_admin
+def debug_profile():
+    """
+    Sample every thread of this worker (only the one that answers) for N
+    seconds and write collapsed stacks for a flamegraph under
+    PROFILER_OUTPUT_DIR; returns 202 at once. Query parameters:
+        seconds      - sampling duration (default 10, capped by PROFILER_MAX_SECONDS)
+        interval_ms  - time between samples (default 10)
+        idle=1       - keep stacks of parked threads
+        wait=1       - hold the request and return the stacks instead; refused
+                       (409) when this worker has a single request thread
+                       (gunicorn sync), which would serve nothing meanwhile
+        format=json  - with wait=1, return JSON with sample counts instead of plain text
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 10)) / 1000
+    except ValueError:
+        return jsonify({"message": "seconds and interval_ms must be numbers"}), 400
+    include_idle = request.args.get('idle') == '1'
+    wait = request.args.get('wait') == '1' or request.args.get('background') == '0'
+    if wait and not request.environ.get('wsgi.multithread'):
+        return jsonify({
+            "message": "wait=1 needs a multi-threaded worker; this one would stop serving while it samples. "
+                       "Omit wait and read the file named in the response.",
+            "pid": os.getpid(),
+        }), 409
+
+    try:
+        if not wait:
+            path = os.path.join(
+                config.service.profiler_output_dir,
+                f"profile-{os.getpid()}-{time.strftime('%Y%m%d_%H%M%S')}.folded",
+            )
+            profiler.profile_to_file(path, seconds, interval, include_idle)
+            return jsonify({"started": True, "pid": os.getpid(), "output": path}), 202
+
+        result = profiler.profile(seconds, interval, include_idle)
+    except ProfilerBusy as e:
+        return jsonify({"message": str(e)}), 409
+
+    log_event("profile_collected", samples=result["samples"], duration_s=result["duration_s"])
+    if request.args.get('format') == 'json':
+        return jsonify(result)
+    response = Response(result["collapsed"] + "\n", mimetype="text/plain")
+    response.headers['X-Profile-Samples'] = str(result["samples"])
+    response.headers['X-Profile-Pid'] = str(result["pid"])
+    return response
+
+
+@app.get('/debug/allocations')
+@require_admin
+def debug_allocations_status():
+    """Whether allocation tracking is on in this worker, and per-stage growth since the last snapshot"""
+    return jsonify(allocation_tracker.status())
+
+
+@app.post('/debug/allocations/start')
+@require_admin
+def debug_allocations_start():
+    """Start tracemalloc in this worker (?frames=N sets the traceback depth, default 25)"""
+    try:
+        frames = int(request.args.get('frames', 25))
+    except ValueError:
+        return jsonify({"message": "frames must be an integer"}), 400
+    started = allocation_tracker.start(frames)
+    log_event("allocation_tracking_started" if started else "allocation_tracking_already_running", frames=frames)
+    return jsonify({"started": started, **allocation_tracker.status()})
+
+
+@app.post('/debug/allocations/snapshot')
+@require_admin
+def debug_allocations_snapshot():
+    """
+    Take a snapshot and report the top allocation growth sites since the
+    previous one, plus net growth per pipeline stage over the same window.
+    Query parameters: limit (default 20), group_by=lineno|traceback|filename.
+    """
+    try:
+        limit = int(request.args.get('limit', 20))
+        report = allocation_tracker.snapshot(limit, request.args.get('group_by', 'lineno'))
+    except TrackerInactive as e:
+        return jsonify({"message": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return jsonify(report)
+
+
+@app.post('/debug/allocations/stop')
+@require_admin
+def debug_allocations_stop():
+    stopped = allocation_tracker.stop()
+    if stopped:
+        log_event("allocation_tracking_stopped")
+    return jsonify({"stopped": stopped, "last_report": allocation_tracker.last_report})
+
+
 @app.post('/reload')
 def reload_data():
     store.ensure_loaded(force=True)
     return jsonify({"reloaded": True, "known": len(store.staff_ids)})
 
 
+@app.post('/gallery/refresh')
+def gallery_refresh():
+    """
+    Pull staff whose encodings changed (called by populate_encodings.py --watch).
+    Every worker picks the change up on its next request; this one applies it now.
+    """
+    with gallery_generation.get_lock():
+        gallery_generation.value += 1
+    if len(store.encodings) == 0:
+        store.ensure_loaded()
+        result = {"full": True}
+    else:
+        result = store.refresh_changed()
+    return jsonify({"refreshed": True, **result, "known": len(store.staff_ids), "version": store.version})
+
+
 @app.post('/liveness-check')
 def liveness_check():
     """
@@ -261,7 +942,6 @@ def liveness_check():
     """
     face_locations_list = []
     face_landmarks_list = []
-    processed_images = []
     
     try:
         logger.info(f"Liveness check request received. Files: {list(request.files.keys())}")
@@ -275,14 +955,13 @@ def liveness_check():
             return jsonify({"message": "No images provided"}), 400
 
         for i, file in enumerate(image_files):
+            img_array = None
             try:
                 image_bytes = file.read()
                 if not image_bytes:
                     continue
 
-                pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-                img_array = np.array(pil_image)
-                processed_images.append((pil_image, img_array))
+                img_array = frame_pool.decode(image_bytes)
 
                 # Face detection
                 face_locations = face_recognition.face_locations(img_array, model=config.service.face_detection_model)
@@ -291,13 +970,14 @@ def liveness_check():
                 face_locations_list.append(face_locations[0])
 
                 # Face landmarks for liveness detection
-                face_landmarks = face_recognition.face_landmarks(img_array, face_locations)
-                if face_landmarks:
-                    face_landmarks_list.append(face_landmarks[0])
+                face_landmarks_list.append(landmarks_from_shape(_face_shape(img_array, face_locations[0])))
                     
             except Exception as e:
                 logger.error(f"Error processing image {i}: {e}")
                 continue
+            finally:
+                # The frame is not needed once its landmarks are extracted
+                frame_pool.release(img_array)
 
         if not face_landmarks_list:
             return jsonify({"message": "No faces detected in any of the provided images"}), 400
@@ -312,8 +992,9 @@ def liveness_check():
 
         try:
             if face_landmarks_list:
-                liveness_details["blinking_detected"] = bool(is_blinking(face_landmarks_list))
-                liveness_details["face_quality"] = detect_face_quality(face_landmarks_list[0], face_locations_list[0])
+                landmarks = np.stack(face_landmarks_list)
+                liveness_details["blinking_detected"] = bool(is_blinking(landmarks))
+                liveness_details["face_quality"] = detect_face_quality(landmarks[0], face_locations_list[0])
 
             if face_locations_list:
                 liveness_details["head_movement_detected"] = bool(has_head_movement(face_locations_list))
@@ -334,15 +1015,6 @@ def liveness_check():
         logger.error(f"Unexpected error in liveness_check: {e}")
         logger.error(traceback.format_exc())
         return jsonify({"message": f"Internal server error: {str(e)}"}), 500
-    finally:
-        # Clean up resources
-        for pil_image, img_array in processed_images:
-            try:
-                del pil_image
-                del img_array
-            except:
-                pass
-        cleanup_resources()
 
 
 @app.post('/recognize-simple')
@@ -351,7 +1023,6 @@ def recognize_simple():
     Simple face recognition endpoint without liveness detection.
     Takes a single image and returns recognition results.
     """
-    pil_image = None
     img_array = None
     request_start = time.time()
     
@@ -376,8 +1047,7 @@ def recognize_simple():
                 return jsonify({"message": "empty image"}), 400
 
             with log_performance("image_preprocessing"):
-                pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-                img_array = np.array(pil_image)
+                img_array = frame_pool.decode(image_bytes)
                 log_metric("image_dimensions", f"{img_array.shape[1]}x{img_array.shape[0]}")
             
             with log_performance("face_detection", model=config.service.face_detection_model):
@@ -388,29 +1058,40 @@ def recognize_simple():
                 log_event("no_faces_detected")
                 return jsonify({"matches": []})
 
+            # Use the first detected face
+            with log_performance("extract_landmarks"):
+                shape = _face_shape(img_array, faces[0])
+            reason, quality = _quality_gate(img_array, faces[0], landmarks_from_shape(shape))
+            if reason:
+                return _retry_response(reason, quality)
+
             with log_performance("face_encoding", num_jitters=config.service.face_jitters, model=config.service.face_encoding_model):
-                encs = face_recognition.face_encodings(img_array, faces, num_jitters=config.service.face_jitters, model=config.service.face_encoding_model)
-                log_metric("encodings_generated", len(encs))
+                enc = _encode_face(img_array, faces[0], shape)
+                log_metric("encodings_generated", int(enc is not None))
+            
+            # Matching only needs the encoding, so hand the frame back now
+            frame_pool.release(img_array)
+            img_array = None
                 
-            if not encs:
+            if enc is None:
                 log_event("no_encodings_generated")
                 return jsonify({"matches": []})
 
-            # Use the first detected face
-            enc = encs[0]
             (top, right, bottom, left) = faces[0]
             face_area = (right - left) * (bottom - top)
             log_metric("face_area_pixels", face_area)
 
             results = []
-            if store.encodings:
+            # One snapshot for the whole match, so a concurrent refresh cannot mix versions
+            gallery = store.gallery
+            if len(gallery.encodings):
                 try:
-                    with log_performance("face_matching", known_faces=len(store.encodings)):
-                        distances = face_recognition.face_distance(store.encodings, enc)
+                    with log_performance("face_matching", known_faces=len(gallery.encodings)):
+                        distances = face_recognition.face_distance(gallery.encodings, enc)
                         best_idx = int(np.argmin(distances))
                         best_dist = float(distances[best_idx])
-                        staff_id = store.staff_ids[best_idx]
-                        meta = store.staff_meta.get(staff_id, {})
+                        staff_id = gallery.staff_ids[best_idx]
+                        meta = gallery.staff_meta.get(staff_id, {})
                         # Convert distance to a rough similarity score
                         score = max(0.0, 1.0 - best_dist)
                         matched = best_dist < config.service.face_distance_threshold
@@ -423,6 +1104,7 @@ def recognize_simple():
                             log_event("face_matched", staff_id=staff_id, staff_name=meta.get("full_name"), distance=f"{best_dist:.4f}", score=f"{score:.4f}")
                         else:
                             log_event("face_not_matched", best_distance=f"{best_dist:.4f}", threshold=config.service.face_distance_threshold)
+                        suppressed, suppressed_age = _check_suppressed(staff_id) if matched else (False, None)
                         
                         results.append({
                             "staffId": staff_id,
@@ -431,6 +1113,8 @@ def recognize_simple():
                             "distance": best_dist,
                             "score": score,
                             "matched": matched,
+                            "suppressed": suppressed,
+                            "suppressedSecondsAgo": suppressed_age,
                             "liveness_passed": True,  # Always true for simple mode
                             "liveness_details": {
                                 "blinking_detected": False,
@@ -452,18 +1136,138 @@ def recognize_simple():
         logger.error(traceback.format_exc())
         return jsonify({"message": f"Internal server error: {str(e)}"}), 500
     finally:
-        # Clean up resources
-        if pil_image:
-            try:
-                del pil_image
-            except:
-                pass
+        # Return the frame if an early exit skipped the release above
         if img_array is not None:
-            try:
-                del img_array
-            except:
-                pass
-        cleanup_resources()
+            frame_pool.release(img_array)
+
+
+def _best_match(enc):
+    """(staff_id, full_name, distance, score, matched) of the closest known face, or None if the gallery is empty"""
+    gallery = store.gallery
+    if not len(gallery.encodings):
+        return None
+    distances = face_recognition.face_distance(gallery.encodings, enc)
+    best_idx = int(np.argmin(distances))
+    best_dist = float(distances[best_idx])
+    staff_id = gallery.staff_ids[best_idx]
+    full_name = gallery.staff_meta.get(staff_id, {}).get("full_name", staff_id)
+    # Convert distance to a rough similarity score
+    score = max(0.0, 1.0 - best_dist)
+    return staff_id, full_name, best_dist, score, best_dist < config.service.face_distance_threshold
+
+
+@app.post('/recognize-and-record')
+@require_role('admin', 'operator')
+def recognize_and_record():
+    """
+    Recognise one frame and, on a confident match, record the check-in or
+    check-out directly (same rules as the backend's /api/attendance/face-event).
+    Saves the kiosk a second upload of the same image to the backend.
+    """
+    img_array = None
+    try:
+        with log_performance("total_request", endpoint="recognize_and_record"):
+            with log_performance("load_known_faces"):
+                store.ensure_loaded()
+
+            if 'image' not in request.files:
+                return jsonify({"message": "image field required"}), 400
+            image_bytes = request.files['image'].read()
+            if not image_bytes:
+                return jsonify({"message": "empty image"}), 400
+
+            with log_performance("image_preprocessing"):
+                img_array = frame_pool.decode(image_bytes)
+
+            with log_performance("face_detection", model=config.service.face_detection_model):
+                faces = face_recognition.face_locations(img_array, model=config.service.face_detection_model)
+            if not faces:
+                log_event("no_faces_detected")
+                return jsonify({"matches": [], "attendance": None})
+
+            largest_face = max(faces, key=lambda face: (face[2] - face[0]) * (face[1] - face[3]))
+            (top, right, bottom, left) = largest_face
+            with log_performance("extract_landmarks"):
+                shape = _face_shape(img_array, largest_face)
+            reason, quality = _quality_gate(img_array, largest_face, landmarks_from_shape(shape))
+            if reason:
+                return _retry_response(reason, quality, attendance=None)
+
+            with log_performance("face_encoding", num_jitters=config.service.face_jitters, model=config.service.face_encoding_model):
+                enc = _encode_face(img_array, largest_face, shape)
+            if enc is None:
+                log_event("no_encodings_generated")
+                return jsonify({"matches": [], "attendance": None})
+
+            with log_performance("face_matching", known_faces=len(store.encodings)):
+                best = _best_match(enc)
+            if best is None:
+                return jsonify({"matches": [], "attendance": None})
+            staff_id, full_name, best_dist, score, matched = best
+            match = {
+                "staffId": staff_id,
+                "fullName": full_name,
+                "bbox": [left, top, right, bottom],
+                "distance": best_dist,
+                "score": score,
+                "matched": matched,
+                "suppressed": False,
+                "suppressedSecondsAgo": None,
+            }
+            if not matched:
+                log_event("face_not_matched", best_distance=f"{best_dist:.4f}", threshold=config.service.face_distance_threshold)
+                return jsonify({"matches": [match], "attendance": None})
+
+            # Repeat scan inside the cooldown window: no capture, no attendance write
+            suppressed, suppressed_age = _check_suppressed(staff_id)
+            if suppressed:
+                match.update(suppressed=True, suppressedSecondsAgo=suppressed_age)
+                return jsonify({"matches": [match], "action": "suppressed", "attendance": None})
+
+            with log_performance("crop_face_capture"):
+                crop = crop_face_jpeg(img_array, (left, top, right, bottom))
+            frame_pool.release(img_array)
+            img_array = None
+
+            if attendance_queue is not None:
+                # Journal the scan and answer now; the queue writer applies it
+                with log_performance("enqueue_attendance", staff_id=staff_id):
+                    event = attendance_queue.enqueue(staff_id, score, crop)
+                _mark_recorded(staff_id)
+                log_event("attendance_queued", staff_id=staff_id, event_id=event["event_id"])
+                return jsonify({"matches": [match], "action": "queued", "eventId": event["event_id"], "attendance": None}), 202
+
+            with log_performance("record_attendance", staff_id=staff_id):
+                with get_db_conn() as conn:
+                    action, attendance = record_face_event(conn, staff_id, score, crop, BACKEND_ROOT)
+            _mark_recorded(staff_id)
+            log_event("attendance_recorded", staff_id=staff_id, action=action, score=f"{score:.4f}")
+            status = 201 if action == "checked_in" else 200
+            return jsonify({"matches": [match], "action": action, "attendance": attendance}), status
+
+    except Exception as e:
+        logger.error(f"Unexpected error in recognize_and_record: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"message": f"Internal server error: {str(e)}"}), 500
+    finally:
+        if img_array is not None:
+            frame_pool.release(img_array)
+
+
+@app.post('/recent-matches/mark')
+@require_role('admin', 'operator')
+def mark_recent_match():
+    """
+    Open the suppression window for a staff member whose attendance the kiosk
+    just wrote through the backend's face-event endpoint. Call it only after
+    that write succeeded, so a failed write never suppresses the next scan.
+    """
+    staff_id = request.form.get('staffId')
+    if not staff_id:
+        return jsonify({"message": "staffId is required"}), 400
+    _mark_recorded(staff_id)
+    log_event("recent_match_marked", staff_id=staff_id)
+    return jsonify({"marked": recent_matches is not None, "staffId": staff_id})
 
 
 @app.post('/recognize')
@@ -471,7 +1275,8 @@ def recognize():
     face_locations_list = []
     face_landmarks_list = []
     face_encodings_list = []
-    processed_images = []
+    encoded_location = None
+    gate_rejection = None
     request_start = time.time()
     
     try:
@@ -492,6 +1297,7 @@ def recognize():
                 log_metric("frames_for_liveness", len(image_files))
                 
                 for i, file in enumerate(image_files):
+                    img_array = None
                     try:
                         with log_performance(f"process_frame_{i+1}"):
                             with log_performance(f"read_frame_{i+1}_bytes"):
@@ -502,9 +1308,7 @@ def recognize():
                                 continue
                             
                             with log_performance(f"preprocess_frame_{i+1}"):
-                                pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-                                img_array = np.array(pil_image)
-                                processed_images.append((pil_image, img_array))
+                                img_array = frame_pool.decode(image_bytes)
                                 log_metric(f"frame_{i+1}_dimensions", f"{img_array.shape[1]}x{img_array.shape[0]}")
                             
                             # Face detection with configured model
@@ -526,25 +1330,38 @@ def recognize():
                             
                             # Face landmarks for liveness detection
                             with log_performance(f"extract_landmarks_frame_{i+1}"):
-                                face_landmarks = face_recognition.face_landmarks(img_array, [largest_face])
-                                if face_landmarks:
-                                    face_landmarks_list.append(face_landmarks[0])
-                                    log_metric(f"frame_{i+1}_landmarks_extracted", True)
+                                shape = _face_shape(img_array, largest_face)
+                                face_landmarks_list.append(landmarks_from_shape(shape))
+                                log_metric(f"frame_{i+1}_landmarks_extracted", True)
                             
-                            # Face encodings for recognition
+                            # Only the first usable frame is matched, later frames feed liveness only
+                            if face_encodings_list:
+                                continue
+                            reason, quality = _quality_gate(img_array, largest_face, face_landmarks_list[-1])
+                            if reason:
+                                gate_rejection = gate_rejection or (reason, quality)
+                                continue
+                            
+                            # Face encodings for recognition, from the same shape
                             with log_performance(f"encode_face_frame_{i+1}", num_jitters=config.service.face_jitters):
-                                face_encodings = face_recognition.face_encodings(img_array, [largest_face], num_jitters=config.service.face_jitters, model=config.service.face_encoding_model)
-                                if face_encodings:
-                                    face_encodings_list.append(face_encodings[0])
+                                face_encoding = _encode_face(img_array, largest_face, shape)
+                                if face_encoding is not None:
+                                    face_encodings_list.append(face_encoding)
+                                    encoded_location = largest_face
                                     log_metric(f"frame_{i+1}_encoding_generated", True)
                             
                     except Exception as e:
                         logger.error(f"Error processing image {i}: {e}")
                         log_error_metric(f"frame_{i+1}_processing_error", str(e))
                         continue
+                    finally:
+                        # Release each frame as soon as it is encoded, not at the end of the request
+                        frame_pool.release(img_array)
             
                 if not face_encodings_list:
                     log_event("no_encodings_from_frames", frames_processed=len(image_files))
+                    if gate_rejection:
+                        return _retry_response(*gate_rejection)
                     return jsonify({"message": "No faces detected in any of the provided images"}), 400
                 
                 # Liveness Detection
@@ -558,12 +1375,13 @@ def recognize():
                 try:
                     with log_performance("liveness_detection"):
                         if face_landmarks_list:
-                            with log_performance("blink_detection", frames=len(face_landmarks_list)):
-                                liveness_details["blinking_detected"] = bool(is_blinking(face_landmarks_list))
+                            landmarks = np.stack(face_landmarks_list)
+                            with log_performance("blink_detection", frames=len(landmarks)):
+                                liveness_details["blinking_detected"] = bool(is_blinking(landmarks))
                                 log_metric("blinking_detected", liveness_details["blinking_detected"])
                             
                             with log_performance("face_quality_assessment"):
-                                liveness_details["face_quality"] = detect_face_quality(face_landmarks_list[0], face_locations_list[0])
+                                liveness_details["face_quality"] = detect_face_quality(landmarks[0], face_locations_list[0])
                                 log_metric("face_quality_score", liveness_details["face_quality"].get("quality_score", 0))
                         
                         if face_locations_list:
@@ -596,7 +1414,7 @@ def recognize():
             
                 # Face Recognition (using the first detected face encoding)
                 enc = face_encodings_list[0]
-                (top, right, bottom, left) = face_locations_list[0]
+                (top, right, bottom, left) = encoded_location
                 face_area = (right - left) * (bottom - top)
                 log_metric("final_face_area", face_area)
             
@@ -609,17 +1427,20 @@ def recognize():
                 if not image_bytes:
                     return jsonify({"message": "empty image"}), 400
 
+                img = None
                 try:
-                    pil = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-                    img = np.array(pil)
-                    processed_images.append((pil, img))
+                    img = frame_pool.decode(image_bytes)
                     
                     faces = face_recognition.face_locations(img, model=config.service.face_detection_model)
                     if not faces:
                         return jsonify({"matches": []})
                     
-                    encs = face_recognition.face_encodings(img, faces, num_jitters=config.service.face_jitters, model=config.service.face_encoding_model)
-                    face_landmarks = face_recognition.face_landmarks(img, faces)
+                    shape = _face_shape(img, faces[0])
+                    landmarks = landmarks_from_shape(shape)
+                    reason, quality = _quality_gate(img, faces[0], landmarks)
+                    if reason:
+                        return _retry_response(reason, quality)
+                    enc = _encode_face(img, faces[0], shape)
                     
                     # Basic liveness check for single image
                     liveness_passed = True
@@ -629,24 +1450,26 @@ def recognize():
                         "face_quality": {}
                     }
                     
-                    if face_landmarks:
-                        liveness_details["face_quality"] = detect_face_quality(face_landmarks[0], faces[0])
+                    liveness_details["face_quality"] = detect_face_quality(landmarks, faces[0])
                     
-                    enc = encs[0]
                     (top, right, bottom, left) = faces[0]
                 except Exception as e:
                     logger.error(f"Error processing single image: {e}")
                     return jsonify({"message": f"Image processing error: {str(e)}"}), 500
+                finally:
+                    frame_pool.release(img)
 
             results = []
-            if store.encodings:
+            # One snapshot for the whole match, so a concurrent refresh cannot mix versions
+            gallery = store.gallery
+            if len(gallery.encodings):
                 try:
-                    with log_performance("face_matching_with_liveness", known_faces=len(store.encodings)):
-                        distances = face_recognition.face_distance(store.encodings, enc)
+                    with log_performance("face_matching_with_liveness", known_faces=len(gallery.encodings)):
+                        distances = face_recognition.face_distance(gallery.encodings, enc)
                         best_idx = int(np.argmin(distances))
                         best_dist = float(distances[best_idx])
-                        staff_id = store.staff_ids[best_idx]
-                        meta = store.staff_meta.get(staff_id, {})
+                        staff_id = gallery.staff_ids[best_idx]
+                        meta = gallery.staff_meta.get(staff_id, {})
                         # Convert distance to a rough similarity score
                         score = max(0.0, 1.0 - best_dist)
                         matched = best_dist < config.service.face_distance_threshold
@@ -667,6 +1490,7 @@ def recognize():
                                      best_distance=f"{best_dist:.4f}", 
                                      threshold=config.service.face_distance_threshold,
                                      liveness_passed=liveness_passed)
+                        suppressed, suppressed_age = _check_suppressed(staff_id) if matched and liveness_passed else (False, None)
                         
                         results.append({
                             "staffId": staff_id,
@@ -675,6 +1499,8 @@ def recognize():
                             "distance": best_dist,
                             "score": score,
                             "matched": matched,
+                            "suppressed": suppressed,
+                            "suppressedSecondsAgo": suppressed_age,
                             "liveness_passed": liveness_passed,
                             "liveness_details": liveness_details
                         })
@@ -691,25 +1517,82 @@ def recognize():
         logger.error(f"Unexpected error in recognize: {e}")
         logger.error(traceback.format_exc())
         return jsonify({"message": f"Internal server error: {str(e)}"}), 500
-    finally:
-        # Clean up resources
-        for pil_image, img_array in processed_images:
-            try:
-                del pil_image
-                del img_array
-            except:
-                pass
-        cleanup_resources()
+
+
+def warm_up_models():
+    """Run one throwaway inference so dlib's first-call cost is paid before serving traffic"""
+    start = time.time()
+    try:
+        with log_performance("model_warmup", detection_model=config.service.face_detection_model):
+            probe = np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8)
+            face_box = (0, WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 0)
+            face_recognition.face_locations(probe, model=config.service.face_detection_model)
+            shape = _face_shape(probe, face_box)
+            landmarks_from_shape(shape)
+            enc = _encode_face(probe, face_box, shape)
+            gallery = store.gallery
+            if len(gallery.encodings) and enc is not None:
+                face_recognition.face_distance(gallery.encodings, enc)
+        warmup_state.update({
+            "warmed_up": True,
+            "warmup_ms": round((time.time() - start) * 1000, 2),
+            "pid": os.getpid(),
+        })
+        logger.info(f"Model warm-up completed in {warmup_state['warmup_ms']}ms (pid {os.getpid()})")
+    except Exception as e:
+        # Not fatal: the first real request pays the cost instead
+        warmup_state["error"] = str(e)
+        logger.warning(f"Model warm-up failed: {e}")
+
+
+def prepare_for_fork():
+    """
+    Called in the gunicorn master once the preloaded app is ready.
+    Drops the master's DB sockets so no worker inherits them, then freezes
+    the preloaded objects so the GC never touches (and un-shares) their pages.
+    """
+    memory_governor.stop()
+    store.stop_background_load()
+    if attendance_queue is not None:
+        attendance_queue.stop()
+    close_connection_pool()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def init_worker():
+    """Called in each forked worker before it accepts traffic"""
+    global connection_pool
+    # Any pool object copied from the master is unusable here; never reuse its sockets
+    connection_pool = None
+    db_state["in_use"] = 0
+    warmup_state.update({"warmed_up": False, "warmup_ms": None, "pid": os.getpid(), "error": None})
+    recent_latencies.clear()
+    try:
+        init_connection_pool()
+    except Exception as e:
+        # Never fatal here: an exception in post_fork halts gunicorn. The pool
+        # is retried in the background (and on first use); /ready reports cold.
+        logger.warning(f"Database unavailable at worker start, retrying in the background: {e}")
+        init_pool_in_background()
+    if store.version == 0:
+        # The master's start-up load failed; its retry thread did not survive the fork
+        store.load_in_background()
+    warm_up_models()
+    memory_governor.start()
+    if attendance_queue is not None:
+        attendance_queue.start()
 
 
 def create_app():
     """Create and configure the Flask application"""
-    # Initialize connection pool
+    # Initialize connection pool; without a database the service still starts
+    # cold, and the gallery load below keeps retrying (creating the pool with it)
     try:
         init_connection_pool()
     except Exception as e:
-        logger.error(f"Failed to initialize connection pool: {e}")
-        raise
+        logger.error(f"Failed to initialize connection pool, starting cold: {e}")
     
     # Load known faces at startup
     try:
@@ -717,8 +1600,14 @@ def create_app():
         logger.info(f"Loaded {len(store.staff_ids)} known faces at startup")
     except Exception as e:
         logger.error(f"Failed to load known faces: {e}")
-        # Don't raise here, allow service to start and retry later
+        # Don't raise here; serve (cold) and keep retrying in the background
+        store.load_in_background()
     
+    warm_up_models()
+    memory_governor.start()
+    if attendance_queue is not None:
+        # Also picks up journals left by a previous run
+        attendance_queue.start()
     return app
 
 if __name__ == '__main__':
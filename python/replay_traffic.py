@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator that replays captured recognizer traffic.
+
+Reads the JSONL files written by the recognizer's capture mode
+(CAPTURE_ENABLED=true, see traffic_capture.py) and sends the same mix of
+/recognize, /recognize-simple and /liveness-check requests to a target
+service. Arrivals follow a fixed schedule that does not wait for earlier
+responses (open loop). Either the recorded inter-arrival gaps are replayed,
+scaled by --speed, or a Poisson process at --rate requests per second is used.
+Latency is measured from the scheduled send time, so queueing inside the
+load generator or the service counts against it instead of being hidden.
+
+Requests whose frames were not sampled into the blob store are sent with
+images from --images, keeping the recorded frame count.
+
+Usage:
+    python replay_traffic.py --captures captures --target https://localhost:8001 --insecure
+    python replay_traffic.py --captures captures --rate 5 --duration 300 --concurrency 16 --images test_images
+    python replay_traffic.py --captures captures --speed 4 --output replay_report.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import urllib3
+
+REPLAY_PATHS = ('/recognize', '/recognize-simple', '/liveness-check')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_captures(capture_dir, paths):
+    """Return captured records for the given endpoints, sorted by arrival time"""
+    records = []
+    for root, _, files in os.walk(capture_dir):
+        for name in files:
+            if not (name.startswith('requests-') and name.endswith('.jsonl')):
+                continue
+            with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("path") in paths and record.get("files"):
+                        records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def load_fallback_images(images_dir):
+    images = []
+    if images_dir:
+        for name in sorted(os.listdir(images_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(images_dir, name), 'rb') as f:
+                    images.append(f.read())
+    return images
+
+
+class Replayer:
+    def __init__(self, args, records, fallback_images):
+        self.args = args
+        self.records = records
+        self.fallback_images = fallback_images
+        self.target = args.target.rstrip('/')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._blob_cache = {}
+        self._fallback_index = 0
+        self.results = []
+        self.skipped = 0
+
+    def _session(self):
+        # One keep-alive session per sender thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.verify = not self.args.insecure
+        return session
+
+    def _blob(self, relative):
+        with self._lock:
+            data = self._blob_cache.get(relative)
+        if data is None:
+            path = os.path.join(self.args.captures, relative)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            with self._lock:
+                self._blob_cache[relative] = data
+        return data
+
+    def _fallback(self):
+        if not self.fallback_images:
+            return None
+        with self._lock:
+            data = self.fallback_images[self._fallback_index % len(self.fallback_images)]
+            self._fallback_index += 1
+        return data
+
+    def build_files(self, record):
+        """Multipart payload matching the recorded fields and frame count"""
+        files = []
+        for entry in record["files"]:
+            data = self._blob(entry["blob"]) if entry.get("blob") else None
+            if data is None:
+                data = self._fallback()
+            if data is None:
+                return None
+            files.append((entry["field"], (f"frame{len(files)}.jpg", data, entry.get("content_type") or 'image/jpeg')))
+        return files
+
+    def schedule(self):
+        """Yield (offset_seconds, record) pairs for the run"""
+        args = self.args
+        if args.rate:
+            # Poisson arrivals at a fixed rate, drawing requests from the captured mix
+            rng = random.Random(args.seed)
+            offset = 0.0
+            count = 0
+            while True:
+                offset += rng.expovariate(args.rate)
+                if (args.duration and offset > args.duration) or (args.limit and count >= args.limit):
+                    return
+                yield offset, rng.choice(self.records)
+                count += 1
+        else:
+            # Recorded inter-arrival gaps, compressed by --speed
+            first = self.records[0]["ts"]
+            for count, record in enumerate(self.records):
+                offset = (record["ts"] - first) / args.speed
+                if (args.duration and offset > args.duration) or (args.limit and count >= args.limit):
+                    return
+                yield offset, record
+
+    def send(self, record, scheduled_at):
+        files = self.build_files(record)
+        if files is None:
+            with self._lock:
+                self.skipped += 1
+            return
+        url = self.target + record["path"]
+        started = time.perf_counter()
+        status = None
+        error = None
+        try:
+            response = self._session().post(url, files=files, timeout=self.args.timeout)
+            status = response.status_code
+        except requests.RequestException as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with self._lock:
+            self.results.append({
+                "path": record["path"],
+                "status": status,
+                "error": error,
+                "latency_ms": (finished - scheduled_at) * 1000,
+                "service_ms": (finished - started) * 1000,
+                "queued_ms": (started - scheduled_at) * 1000,
+            })
+
+    def run(self):
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            run_start = time.perf_counter()
+            for offset, record in self.schedule():
+                scheduled_at = run_start + offset
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self.send, record, scheduled_at))
+            last_scheduled = time.perf_counter() - run_start
+        for future in futures:
+            future.result()
+        return len(futures), last_scheduled, time.perf_counter() - run_start
+
+
+def percentiles(values):
+    if not values:
+        return {f"p{p}_ms": None for p in PERCENTILES}
+    array = np.array(values)
+    summary = {f"p{p}_ms": round(float(np.percentile(array, p)), 2) for p in PERCENTILES}
+    summary["max_ms"] = round(float(array.max()), 2)
+    return summary
+
+
+def build_report(replayer, scheduled, schedule_span, elapsed):
+    results = replayer.results
+    ok = [r for r in results if r["status"] is not None and r["status"] < 500]
+    report = {
+        "target": replayer.target,
+        "scheduled": scheduled,
+        "completed": len(results),
+        "skipped_no_images": replayer.skipped,
+        "elapsed_s": round(elapsed, 2),
+        "offered_rps": round(scheduled / schedule_span, 2) if schedule_span > 0 else None,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else None,
+        "status_codes": dict(Counter(str(r["status"] or r["error"]) for r in results)),
+        "latency": percentiles([r["latency_ms"] for r in ok]),
+        "service_time": percentiles([r["service_ms"] for r in ok]),
+        "queue_delay": percentiles([r["queued_ms"] for r in ok]),
+        "by_endpoint": {},
+    }
+    for path in sorted({r["path"] for r in results}):
+        endpoint = [r for r in ok if r["path"] == path]
+        report["by_endpoint"][path] = {
+            "count": sum(1 for r in results if r["path"] == path),
+            "ok": len(endpoint),
+            **percentiles([r["latency_ms"] for r in endpoint]),
+        }
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 80)
+    print(" " * 28 + "REPLAY REPORT")
+    print("=" * 80)
+    print(f"Target:          {report['target']}")
+    print(f"Scheduled:       {report['scheduled']}   Completed: {report['completed']}   "
+          f"Skipped (no images): {report['skipped_no_images']}")
+    print(f"Offered rate:    {report['offered_rps']} req/s")
+    print(f"Throughput:      {report['throughput_rps']} req/s (non-5xx) over {report['elapsed_s']}s")
+    print(f"Status codes:    {report['status_codes']}")
+
+    def row(label, values):
+        cells = "  ".join(f"{key[:-3]:>4} {value:>9.1f}" if value is not None else f"{key[:-3]:>4} {'-':>9}"
+                          for key, value in values.items())
+        print(f"{label:<22} {cells}")
+
+    print("\nLatency (ms)")
+    print("-" * 80)
+    row("end-to-end", report["latency"])
+    row("service time", report["service_time"])
+    row("client queue delay", report["queue_delay"])
+    print("\nBy endpoint (end-to-end ms)")
+    print("-" * 80)
+    for path, stats in report["by_endpoint"].items():
+        row(f"{path} ({stats['ok']}/{stats['count']})", {k: v for k, v in stats.items() if k.endswith('_ms')})
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured recognizer traffic as open-loop load')
+    parser.add_argument('--captures', default='captures', help='Capture directory written by CAPTURE_ENABLED=true')
+    parser.add_argument('--target', default='https://localhost:8001', help='Recognizer base URL')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS verification (self-signed certificates)')
+    parser.add_argument('--images', help='Images used for requests whose frames were not captured')
+    parser.add_argument('--endpoints', default=','.join(REPLAY_PATHS), help='Comma-separated endpoints to replay')
+    parser.add_argument('--rate', type=float, help='Poisson arrival rate in req/s (default: recorded timing)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Time compression for recorded timing')
+    parser.add_argument('--duration', type=float, help='Stop scheduling after this many seconds')
+    parser.add_argument('--limit', type=int, help='Stop after this many requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for --rate schedules')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    if args.rate and not (args.duration or args.limit):
+        parser.error("--rate needs --duration or --limit")
+    if args.insecure:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    paths = tuple(p.strip() for p in args.endpoints.split(',') if p.strip())
+    records = load_captures(args.captures, paths)
+    if not records:
+        print(f"No captured requests for {', '.join(paths)} under {args.captures}")
+        sys.exit(1)
+    fallback_images = load_fallback_images(args.images)
+    sampled = sum(1 for r in records if all(f.get("blob") for f in r["files"]))
+    print(f"Loaded {len(records)} captured requests ({sampled} with frames), "
+          f"{len(fallback_images)} fallback images")
+    print(f"Mix: {dict(Counter(r['path'] for r in records))}")
+
+    replayer = Replayer(args, records, fallback_images)
+    scheduled, schedule_span, elapsed = replayer.run()
+    report = build_report(replayer, scheduled, schedule_span, elapsed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Sampling Profiler Module
+Low-overhead stack sampler for the live recognizer. A background thread reads
+sys._current_frames() at a fixed interval for a bounded duration and folds
+the stacks of every other thread into collapsed-stack format
+("thread;outer;...;inner count"), ready for flamegraph.pl or speedscope.
+
+Nothing runs until a profile is requested, and only one profile can run per
+process at a time.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Leaf frames that mean "thread is parked", skipped unless idle stacks are requested
+IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+    ('queue.py', 'get'),
+}
+
+MAX_STACK_DEPTH = 128
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self, max_duration=60.0, min_interval=0.001):
+        self.max_duration = max_duration
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self.last_result = None
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _collapse(self, frame):
+        labels = []
+        leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+        labels.reverse()
+        return leaf, labels
+
+    def _sample(self, duration, interval, include_idle, exclude, stacks, stats):
+        own = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or thread_id in exclude:
+                    continue
+                leaf, labels = self._collapse(frame)
+                if not include_idle and leaf in IDLE_LEAVES:
+                    stats["idle_samples"] += 1
+                    continue
+                thread_name = names.get(thread_id, str(thread_id)).replace(';', '_')
+                stacks[';'.join([thread_name] + labels)] += 1
+                stats["samples"] += 1
+            stats["ticks"] += 1
+            time.sleep(interval)
+
+    def profile(self, duration, interval=0.01, include_idle=False, exclude=()):
+        """Sample all other threads for `duration` seconds and return the collapsed stacks"""
+        duration = max(0.1, min(float(duration), self.max_duration))
+        interval = max(float(interval), self.min_interval)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running in this process")
+        try:
+            stacks = Counter()
+            stats = {"samples": 0, "idle_samples": 0, "ticks": 0}
+            started = time.time()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(duration, interval, include_idle, set(exclude), stacks, stats),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            sampler.start()
+            sampler.join()
+            result = {
+                "pid": os.getpid(),
+                "started_at": started,
+                "duration_s": round(time.time() - started, 3),
+                "interval_ms": round(interval * 1000, 3),
+                **stats,
+                "collapsed": '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()),
+            }
+            self.last_result = result
+            return result
+        finally:
+            self._lock.release()
+
+    def profile_to_file(self, path, duration, interval=0.01, include_idle=False):
+        """Run a profile in the background and write the collapsed stacks to `path`"""
+        if self._lock.locked():
+            raise ProfilerBusy("A profile is already running in this process")
+
+        def run():
+            try:
+                result = self.profile(duration, interval, include_idle, exclude=(threading.get_ident(),))
+            except ProfilerBusy:
+                return
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(result["collapsed"] + "\n")
+
+        threading.Thread(target=run, name="sampling-profiler-runner", daemon=True).start()
+        return path
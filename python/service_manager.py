@@ -14,10 +14,12 @@ import logging
 from datetime import datetime
 import threading
 import socket
-import requests
 import json
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from health_probe import prober, wait_with_backoff
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +32,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# The port ownership snapshot is reused for one monitor cycle
+PORT_INDEX_MAX_AGE_SECONDS = 30
+
+# Longest wait for a stopped service's port to be free again before restarting it
+PORT_RELEASE_TIMEOUT_SECONDS = 10
+
 class IPMonitor:
     def __init__(self, project_root):
         self.project_root = project_root
@@ -236,23 +244,10 @@ class IPMonitor:
     
     def test_service_connection(self, ip, port=8001):
         """Test if the service is accessible at the given IP"""
-        try:
-            response = requests.get(f"http://{ip}:{port}/health", timeout=5)
-            if response.status_code == 200:
-                logger.info(f"Service accessible via HTTP at {ip}:{port}")
-                return True
-        except:
-            pass
-        
-        try:
-            response = requests.get(f"https://{ip}:{port}/health", timeout=5, verify=False)
-            if response.status_code == 200:
-                logger.info(f"Service accessible via HTTPS at {ip}:{port}")
-                return True
-        except:
-            pass
-        
-        return False
+        result = prober.probe(ip, port, '/health')
+        if result.ok:
+            logger.info(f"Service accessible at {result.url} ({result.elapsed_ms:.0f}ms)")
+        return result.ok
     
     def find_working_ip(self):
         """Find the IP address where the service is actually running"""
@@ -267,12 +262,11 @@ class IPMonitor:
         
         logger.info(f"Testing IPs: {all_ips}")
         
-        for ip in all_ips:
-            if self.test_service_connection(ip):
-                logger.info(f"Found working service at IP: {ip}")
-                return ip
-        
-        return None
+        # All candidates at once, so dead addresses cost one timeout in total
+        working_ip, result = prober.first_reachable(all_ips, 8001, '/health')
+        if working_ip:
+            logger.info(f"Found working service at IP: {working_ip} ({result.url})")
+        return working_ip
     
     def check_and_update_ip(self):
         """Check for IP changes and update configuration if needed"""
@@ -348,25 +342,76 @@ class ServiceManager:
                 'command': f'cd "{self.project_root}\\backend" && npm start',
                 'port': 5000,
                 'process': None,
-                'pid_file': str(self.project_root / 'backend.pid')
+                'pid_file': str(self.project_root / 'backend.pid'),
+                'ready_path': '/api/health',
+                'ready_schemes': ('http', 'https'),
+                'ready_timeout': 60,
+                'depends_on': ()
             },
             'frontend': {
                 'name': 'React Frontend',
                 'command': f'cd "{self.project_root}\\frontend" && npm run dev',
                 'port': 5173,
                 'process': None,
-                'pid_file': str(self.project_root / 'frontend.pid')
+                'pid_file': str(self.project_root / 'frontend.pid'),
+                'ready_path': '/',
+                'ready_schemes': ('https', 'http'),
+                'ready_timeout': 60,
+                'depends_on': ('backend', 'recognizer')
             },
             'recognizer': {
                 'name': 'Python Recognition Service',
                 'command': f'cd "{self.project_root}\\python" && .\\venv\\Scripts\\activate && python start_https_production.py',
                 'port': 8001,
                 'process': None,
-                'pid_file': str(self.project_root / 'recognizer.pid')
+                'pid_file': str(self.project_root / 'recognizer.pid'),
+                # 200 only once the gallery is loaded and the models are warm
+                'ready_path': '/ready',
+                'ready_schemes': ('https', 'http'),
+                'ready_timeout': 180,
+                # Still answering (503, cold) after the timeout counts as started:
+                # it keeps retrying the gallery load in the background
+                'allow_cold': True,
+                'depends_on': ()
             }
         }
         self.running = False
+        self._port_index = {}
+        self._port_index_at = None
+        self._port_index_wall = 0.0
         
+    def refresh_port_index(self):
+        """Snapshot which PIDs listen on which TCP ports with one psutil.net_connections() call"""
+        index = {}
+        try:
+            for conn in psutil.net_connections(kind='tcp'):
+                if conn.status == psutil.CONN_LISTEN and conn.pid and conn.laddr:
+                    index.setdefault(conn.laddr.port, set()).add(conn.pid)
+        except psutil.AccessDenied as e:
+            logger.debug(f"Port index unavailable: {e}")
+        self._port_index = index
+        self._port_index_at = time.monotonic()
+        self._port_index_wall = time.time()
+        return index
+    
+    def port_owners(self, port, refresh=False):
+        """PIDs listening on a port, from the snapshot of the current monitor cycle"""
+        if refresh or self._port_index_at is None or time.monotonic() - self._port_index_at > PORT_INDEX_MAX_AGE_SECONDS:
+            self.refresh_port_index()
+        return self._port_index.get(port, set())
+    
+    @staticmethod
+    def _is_service_process(service_name, process_name):
+        """Whether an executable name fits the service (node for backend/frontend, python for the recognizer)"""
+        process_name = process_name.lower()
+        if service_name == 'backend':
+            return 'node' in process_name
+        if service_name == 'frontend':
+            return 'vite' in process_name or 'node' in process_name
+        if service_name == 'recognizer':
+            return 'python' in process_name
+        return False
+    
     def is_service_running(self, service_name):
         """Check if a service is running"""
         service = self.services[service_name]
@@ -381,16 +426,9 @@ class ServiceManager:
                 # Check if process is actually running
                 if psutil.pid_exists(pid):
                     try:
-                        process = psutil.Process(pid)
                         # More flexible process name checking
-                        process_name = process.name().lower()
-                        if service_name == 'backend' and 'node' in process_name:
-                            logger.debug(f"{service['name']} is running (PID: {pid}, Name: {process_name})")
-                            return True
-                        elif service_name == 'frontend' and ('vite' in process_name or 'node' in process_name):
-                            logger.debug(f"{service['name']} is running (PID: {pid}, Name: {process_name})")
-                            return True
-                        elif service_name == 'recognizer' and 'python' in process_name:
+                        process_name = psutil.Process(pid).name().lower()
+                        if self._is_service_process(service_name, process_name):
                             logger.debug(f"{service['name']} is running (PID: {pid}, Name: {process_name})")
                             return True
                     except Exception as e:
@@ -402,61 +440,40 @@ class ServiceManager:
             except Exception as e:
                 logger.debug(f"Error reading PID file for {service['name']}: {e}")
         
+        # No usable PID file (lost, or the service was started by hand): adopt the port's listener
+        for pid in self.port_owners(service['port']):
+            try:
+                process_name = psutil.Process(pid).name().lower()
+            except psutil.Error:
+                continue
+            if self._is_service_process(service_name, process_name):
+                with open(service['pid_file'], 'w') as f:
+                    f.write(str(pid))
+                logger.info(f"{service['name']} is running on port {service['port']} (PID: {pid}, Name: {process_name})")
+                return True
+        
         logger.debug(f"{service['name']} is not running")
         return False
     
     def check_frontend_connectivity(self):
         """Check if frontend can connect to backend services"""
         try:
-            backend_ok = False
+            # Both probed at once; the backend is usually plain HTTP, the recognizer HTTPS
+            results = prober.probe_many({
+                'backend': dict(host='127.0.0.1', port=self.services['backend']['port'],
+                                path='/api/health', schemes=('http', 'https')),
+                'recognizer': dict(host='127.0.0.1', port=self.services['recognizer']['port'],
+                                   path='/health', schemes=('https', 'http')),
+            })
+            for name, result in results.items():
+                if result.ok:
+                    logger.debug(f"{self.services[name]['name']} health reachable at {result.url} ({result.elapsed_ms:.0f}ms)")
             
-            # Try HTTP first (non-SSL backend)
-            try:
-                backend_response = requests.get("http://127.0.0.1:5000/api/health", timeout=5)
-                backend_ok = backend_response.status_code == 200
-                if backend_ok:
-                    logger.debug("Backend health reachable over HTTP")
-            except Exception as http_error:
-                logger.debug(f"Backend HTTP health check failed: {http_error}")
-            
-            # Fallback to HTTPS (self-signed certs, so skip verification)
-            if not backend_ok:
-                try:
-                    backend_response = requests.get(
-                        "https://127.0.0.1:5000/api/health",
-                        timeout=5,
-                        verify=False
-                    )
-                    backend_ok = backend_response.status_code == 200
-                    if backend_ok:
-                        logger.debug("Backend health reachable over HTTPS")
-                except Exception as https_error:
-                    logger.debug(f"Backend HTTPS health check failed: {https_error}")
-            
-            if not backend_ok:
+            if not results['backend'].ok:
                 logger.warning("Frontend cannot connect to backend")
                 return False
             
-            # Test recognizer connection (already HTTPS, but allow fallback to HTTP just in case)
-            recognizer_ok = False
-            try:
-                recognizer_response = requests.get("https://127.0.0.1:8001/health", timeout=5, verify=False)
-                recognizer_ok = recognizer_response.status_code == 200
-                if recognizer_ok:
-                    logger.debug("Recognizer health reachable over HTTPS")
-            except Exception as https_error:
-                logger.debug(f"Recognizer HTTPS health check failed: {https_error}")
-            
-            if not recognizer_ok:
-                try:
-                    recognizer_response = requests.get("http://127.0.0.1:8001/health", timeout=5)
-                    recognizer_ok = recognizer_response.status_code == 200
-                    if recognizer_ok:
-                        logger.debug("Recognizer health reachable over HTTP")
-                except Exception as http_error:
-                    logger.debug(f"Recognizer HTTP health check failed: {http_error}")
-            
-            if not recognizer_ok:
+            if not results['recognizer'].ok:
                 logger.warning("Frontend cannot connect to recognizer service")
                 return False
             
@@ -471,7 +488,8 @@ class ServiceManager:
         
         if self.is_service_running(service_name):
             logger.info(f"{service['name']} is already running")
-            return True
+            # Dependants start only once it answers
+            return self.wait_until_ready(service_name) or self.accept_cold(service_name)
         
         try:
             logger.info(f"Starting {service['name']}...")
@@ -495,8 +513,8 @@ class ServiceManager:
             service['process'] = process
             logger.info(f"{service['name']} started with shell PID {process.pid}")
             
-            # Wait a bit to see if it starts successfully
-            time.sleep(5)
+            # Poll the readiness probe until it answers or the shell exits
+            ready = self.wait_until_ready(service_name, process)
             
             if process.poll() is None:  # Still running
                 # Find the actual service process (not the shell)
@@ -512,6 +530,11 @@ class ServiceManager:
                         f.write(str(process.pid))
                     logger.warning(f"Could not find actual service process, using shell PID: {process.pid}")
                 
+                if not ready:
+                    if self.accept_cold(service_name):
+                        return True
+                    logger.error(f"{service['name']} did not become ready within {service['ready_timeout']}s")
+                    return False
                 logger.info(f"{service['name']} started successfully")
                 return True
             else:
@@ -522,25 +545,67 @@ class ServiceManager:
             logger.error(f"Error starting {service['name']}: {e}")
             return False
     
+    def wait_until_ready(self, service_name, process=None):
+        """Poll the service's readiness endpoint with backoff; True once it answers 200"""
+        service = self.services[service_name]
+        start = time.monotonic()
+        exited = lambda: process is not None and process.poll() is not None
+        
+        def check():
+            # An exited shell will never become ready, so stop waiting
+            if exited():
+                return True
+            return prober.probe('127.0.0.1', service['port'], service['ready_path'], service['ready_schemes']).ok
+        
+        ready = wait_with_backoff(check, service['ready_timeout']) and not exited()
+        if ready:
+            logger.info(f"{service['name']} ready after {time.monotonic() - start:.1f}s")
+        return ready
+    
+    def accept_cold(self, service_name):
+        """
+        True if a service that may run cold is alive but not ready yet: its
+        readiness endpoint answers, just not with 200. It is then treated as
+        started (and monitored) instead of failing the whole stack.
+        """
+        service = self.services[service_name]
+        if not service.get('allow_cold'):
+            return False
+        result = prober.probe('127.0.0.1', service['port'], service['ready_path'], service['ready_schemes'])
+        if result is None or result.status is None:
+            return False
+        logger.warning(f"{service['name']} is running but not ready after {service['ready_timeout']}s "
+                       f"(HTTP {result.status}); continuing while it warms up")
+        return True
+    
+    def wait_port_released(self, service_name):
+        """Wait (with backoff) until nothing listens on the service port any more"""
+        port = self.services[service_name]['port']
+        released = wait_with_backoff(lambda: not self.port_owners(port, refresh=True), PORT_RELEASE_TIMEOUT_SECONDS)
+        if not released:
+            logger.warning(f"Port {port} still in use after {PORT_RELEASE_TIMEOUT_SECONDS}s")
+        return released
+    
     def find_service_process(self, service_name, parent_pid):
         """Find the actual service process spawned by the shell"""
         try:
             parent = psutil.Process(parent_pid)
             children = parent.children(recursive=True)
-            
-            for child in children:
-                try:
-                    name = child.name().lower()
-                    if service_name == 'backend' and 'node' in name:
-                        return child.pid
-                    elif service_name == 'frontend' and ('vite' in name or 'node' in name):
-                        return child.pid
-                    elif service_name == 'recognizer' and 'python' in name:
-                        return child.pid
-                except:
-                    continue
-        except:
-            pass
+        except psutil.Error:
+            return None
+        
+        # The child that listens on the service port, once it has bound it
+        listeners = self.port_owners(self.services[service_name]['port'], refresh=True)
+        for child in children:
+            if child.pid in listeners:
+                return child.pid
+        
+        for child in children:
+            try:
+                if self._is_service_process(service_name, child.name()):
+                    return child.pid
+            except psutil.Error:
+                continue
         return None
     
     def stop_service(self, service_name):
@@ -568,37 +633,31 @@ class ServiceManager:
                 
                 pid_file.unlink()
             
-            # Also try to kill by process name and port
-            for proc in psutil.process_iter(['pid', 'name', 'connections']):
+            # Also stop whatever else listens on the port, from this cycle's port index
+            owners = []
+            for pid in self.port_owners(service['port']):
+                try:
+                    proc = psutil.Process(pid)
+                    # Skip a PID reused by a new process since the snapshot
+                    if proc.create_time() <= self._port_index_wall:
+                        owners.append(proc)
+                except psutil.Error:
+                    continue
+            for proc in owners:
                 try:
-                    # Check if process is using the service port
-                    for conn in proc.connections():
-                        if hasattr(conn, 'laddr') and conn.laddr.port == service['port']:
-                            proc.terminate()
-                            logger.info(f"Stopped process using port {service['port']}")
-                            break
-                except:
+                    proc.terminate()
+                    logger.info(f"Stopped process {proc.pid} using port {service['port']}")
+                except psutil.Error:
                     pass
             
-            # Additional cleanup: kill any remaining processes on the port
-            try:
-                if os.name == 'nt':  # Windows
-                    # Find processes using the port
-                    result = subprocess.run(f'netstat -ano | findstr :{service["port"]}', shell=True, capture_output=True, text=True)
-                    if result.stdout:
-                        lines = result.stdout.strip().split('\n')
-                        for line in lines:
-                            if f':{service["port"]}' in line:
-                                parts = line.split()
-                                if len(parts) >= 5:
-                                    pid = parts[-1]
-                                    try:
-                                        subprocess.run(f'taskkill /f /pid {pid}', shell=True, capture_output=True)
-                                        logger.info(f"Killed process {pid} using port {service['port']}")
-                                    except:
-                                        pass
-            except Exception as e:
-                logger.debug(f"Port cleanup error: {e}")
+            # Force-kill anything that ignored the request
+            _, alive = psutil.wait_procs(owners, timeout=5)
+            for proc in alive:
+                try:
+                    proc.kill()
+                    logger.info(f"Killed process {proc.pid} using port {service['port']}")
+                except psutil.Error:
+                    pass
                     
         except Exception as e:
             logger.error(f"Error stopping {service['name']}: {e}")
@@ -608,22 +667,31 @@ class ServiceManager:
         service = self.services[service_name]
         logger.info(f"Restarting {service['name']}...")
         self.stop_service(service_name)
-        time.sleep(3)  # Increased delay to ensure port is released
+        self.wait_port_released(service_name)
         return self.start_service(service_name)
     
     def start_all_services(self):
-        """Start all services"""
+        """Start all services, each as soon as the services it depends on are ready"""
         logger.info("Starting all services...")
+        start = time.monotonic()
         
-        # Start in order: backend, recognizer, frontend
-        start_order = ['backend', 'recognizer', 'frontend']
+        # Backend and recognizer start together; the frontend waits for both
+        pending = {name: set(service['depends_on']) for name, service in self.services.items()}
+        started = set()
+        with ThreadPoolExecutor(max_workers=len(self.services)) as pool:
+            while pending:
+                wave = [name for name, deps in pending.items() if deps <= started]
+                if not wave:
+                    logger.error(f"Unresolvable service dependencies: {pending}")
+                    return False
+                for service_name, ok in zip(wave, pool.map(self.start_service, wave)):
+                    if not ok:
+                        logger.error(f"Failed to start {service_name}")
+                        return False
+                    started.add(service_name)
+                    del pending[service_name]
         
-        for service_name in start_order:
-            if not self.start_service(service_name):
-                logger.error(f"Failed to start {service_name}")
-                return False
-        
-        logger.info("All services started successfully")
+        logger.info(f"All services started successfully in {time.monotonic() - start:.1f}s")
         return True
     
     def stop_all_services(self):
@@ -633,6 +701,9 @@ class ServiceManager:
         # Stop in reverse order
         stop_order = ['frontend', 'recognizer', 'backend']
         
+        # One port snapshot shared by every stop below
+        self.refresh_port_index()
+        
         for service_name in stop_order:
             self.stop_service(service_name)
         
@@ -644,6 +715,9 @@ class ServiceManager:
         
         while self.running:
             try:
+                # One port snapshot per cycle, shared by every check and restart below
+                self.refresh_port_index()
+                
                 # Check services
                 for service_name, service in self.services.items():
                     is_running = self.is_service_running(service_name)
@@ -751,7 +825,8 @@ def main():
         elif args.restart_only:
             print("Restarting all services...")
             manager.stop_all_services()
-            time.sleep(2)
+            for service_name in manager.services:
+                manager.wait_port_released(service_name)
             if manager.start_all_services():
                 print("All services restarted successfully.")
             else:
@@ -0,0 +1,92 @@
+"""
+Shared State Module
+State that every recognizer worker must see. It lives in an anonymous shared
+memory map created at import time, in the gunicorn master (--preload), so
+forked workers share the pages instead of copying them. Under a single
+process server (waitress, app.run) the map is simply process-local.
+"""
+import mmap
+import time
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+_SLOT_DTYPE = np.dtype([('key', '<u8'), ('marked_at', '<f8')])
+
+
+class RecentMatchCache:
+    """
+    Time-windowed record of recent attendance writes, keyed by staff ID and
+    optionally camera. check() reports whether a match falls inside a window
+    so the caller can skip the attendance write and the face capture; mark()
+    opens the window, and is called only after the write succeeded. Fixed
+    number of slots: when full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, window_seconds, slots=4096, per_camera=False):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.per_camera = per_camera
+        self._map = mmap.mmap(-1, slots * _SLOT_DTYPE.itemsize)
+        self._table = np.frombuffer(self._map, dtype=_SLOT_DTYPE)
+        self._lock = multiprocessing.Lock()
+        # checks, suppressed, evicted_live
+        self._counters = multiprocessing.RawArray('q', 3)
+
+    def _key(self, staff_id, camera_id):
+        text = f"{staff_id}\x00{camera_id or ''}" if self.per_camera else str(staff_id)
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little') | 1
+
+    def check(self, staff_id, camera_id=None):
+        """
+        Return (suppressed, seconds_since_first_match) without touching the
+        window; a person outside any window returns (False, None).
+        """
+        key = self._key(staff_id, camera_id)
+        now = time.time()
+        with self._lock:
+            self._counters[0] += 1
+            found = np.flatnonzero(self._table['key'] == key)
+            if len(found):
+                age = now - float(self._table['marked_at'][int(found[0])])
+                if 0 <= age < self.window_seconds:
+                    self._counters[1] += 1
+                    return True, age
+        return False, None
+
+    def mark(self, staff_id, camera_id=None):
+        """
+        Start a window for a person once their attendance has been written.
+        An open window is left alone, so its age counts from the first write.
+        """
+        key = self._key(staff_id, camera_id)
+        now = time.time()
+        with self._lock:
+            found = np.flatnonzero(self._table['key'] == key)
+            if len(found):
+                slot = int(found[0])
+                if 0 <= now - float(self._table['marked_at'][slot]) < self.window_seconds:
+                    return
+            else:
+                # Empty slots have marked_at 0, so they are taken before any live entry
+                slot = int(np.argmin(self._table['marked_at']))
+                if now - float(self._table['marked_at'][slot]) < self.window_seconds:
+                    self._counters[2] += 1
+            self._table[slot] = (key, now)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            active = int(np.count_nonzero(now - self._table['marked_at'] < self.window_seconds))
+            checks, suppressed, evicted = self._counters[:]
+        return {
+            "window_seconds": self.window_seconds,
+            "per_camera": self.per_camera,
+            "slots": self.slots,
+            "active": active,
+            "checks": checks,
+            "suppressed": suppressed,
+            "evicted_live": evicted,
+        }
@@ -70,6 +70,7 @@ def start_gunicorn():
         "--timeout", "120",
         "--keep-alive", "5",
         "--preload",
+        "--config", "gunicorn_conf.py",
         "--access-logfile", "-",
         "--error-logfile", "-",
         "--log-level", "info",
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Speed-versus-accuracy sweep over the recognizer's tuning parameters.
+
+Runs a labelled local image set through every combination of
+    detection model (hog/cnn), upsample count, detection resolution,
+    encoding model (small/large), jitters and distance threshold
+and measures per-stage latency plus false accept (FAR), misidentification
+(MIR) and false reject (FRR) rates. The Pareto frontier (no other setting is
+faster AND at least as accurate) is printed, along with the fastest setting
+that meets --max-far / --max-frr.
+
+It also measures what the recognizer's quality gate checks (face size,
+sharpness, pose symmetry) on every detected face, and suggests the
+QUALITY_GATE_* thresholds that would reject only --gate-percentile percent
+of these known-good photos.
+
+Dataset layout, one folder per person:
+    dataset/
+        EMP001/ img1.jpg img2.jpg ...
+        EMP002/ ...
+The first --enroll images of each person form the gallery and the rest are
+probes. People listed only under --impostors are never enrolled; every match
+for them is a false accept, and FAR is measured only when they are given.
+
+Expensive stages are shared between combinations: detection runs once per
+(model, upsample, resolution), encoding once per detection result and
+(encoding model, jitters), and thresholds only re-score cached distances.
+
+Usage:
+    python sweep_parameters.py --dataset dataset
+    python sweep_parameters.py --dataset dataset --impostors strangers --resolutions 0,480,640 --jitters 1,2
+    python sweep_parameters.py --dataset dataset --detection-models hog,cnn --max-far 0.01 --max-frr 0.05 --output sweep.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(__file__))
+
+import face_recognition
+from liveness import face_sharpness, pose_symmetry, landmarks_from_dict
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_dataset(root, label_prefix=''):
+    """Return [(label, path)] for every image under root/<label>/"""
+    items = []
+    for label in sorted(os.listdir(root)):
+        folder = os.path.join(root, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((label_prefix + label, os.path.join(folder, name)))
+    return items
+
+
+def resize_longest(image, longest):
+    """Downscale so the longest side is `longest` pixels (0 keeps native size)"""
+    height, width = image.shape[:2]
+    if not longest or max(height, width) <= longest:
+        return image
+    scale = longest / max(height, width)
+    size = (round(width * scale), round(height * scale))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+
+def largest(faces):
+    return max(faces, key=lambda face: (face[2] - face[0]) * (face[1] - face[3]))
+
+
+def detect_all(images, model, upsample, resolution):
+    """Detect the largest face in every image; returns per-image (scaled image, box) and timings"""
+    detections = []
+    timings = []
+    for image in images:
+        scaled = resize_longest(image, resolution)
+        start = time.perf_counter()
+        faces = face_recognition.face_locations(scaled, number_of_times_to_upsample=upsample, model=model)
+        timings.append((time.perf_counter() - start) * 1000)
+        detections.append((scaled, largest(faces) if faces else None))
+    return detections, timings
+
+
+def encode_all(detections, model, jitters):
+    encodings = []
+    timings = []
+    for scaled, box in detections:
+        if box is None:
+            encodings.append(None)
+            continue
+        start = time.perf_counter()
+        encs = face_recognition.face_encodings(scaled, [box], num_jitters=jitters, model=model)
+        timings.append((time.perf_counter() - start) * 1000)
+        encodings.append(encs[0] if encs else None)
+    return encodings, timings
+
+
+def gate_measurements(detections):
+    """Quality gate inputs (see liveness.frame_gate) for every detected face"""
+    measured = {"face_size": [], "sharpness": [], "pose_symmetry": []}
+    for scaled, box in detections:
+        if box is None:
+            continue
+        top, right, bottom, left = box
+        measured["face_size"].append(min(right - left, bottom - top))
+        measured["sharpness"].append(face_sharpness(scaled, box))
+        marks = face_recognition.face_landmarks(scaled, [box])
+        if marks:
+            measured["pose_symmetry"].append(float(pose_symmetry(landmarks_from_dict(marks[0]))[0]))
+    return measured
+
+
+def gate_report(measured, percentile):
+    """Percentiles of each measurement and the threshold at the given lower percentile"""
+    report = {}
+    for name, values in measured.items():
+        if not values:
+            continue
+        p1, p5, p50 = np.percentile(values, [1, 5, 50])
+        report[name] = {
+            "faces": len(values),
+            "p1": round(float(p1), 3),
+            "p5": round(float(p5), 3),
+            "p50": round(float(p50), 3),
+            "suggested": round(float(np.percentile(values, percentile)), 3),
+        }
+    return report
+
+
+def split_gallery(labels, enroll, impostor_labels):
+    """Indices of gallery images and probe images"""
+    gallery, probes, seen = [], [], {}
+    for i, label in enumerate(labels):
+        if label in impostor_labels:
+            probes.append(i)
+        elif seen.get(label, 0) < enroll:
+            gallery.append(i)
+            seen[label] = seen.get(label, 0) + 1
+        else:
+            probes.append(i)
+    return gallery, probes
+
+
+def nearest_matches(encodings, labels, gallery, probes):
+    """For each probe: (true label, nearest gallery label, distance) or None when no face/encoding"""
+    enrolled = [i for i in gallery if encodings[i] is not None]
+    if not enrolled:
+        return [None] * len(probes)
+    matrix = np.stack([encodings[i] for i in enrolled])
+    results = []
+    for i in probes:
+        if encodings[i] is None:
+            results.append((labels[i], None, None))
+            continue
+        distances = np.linalg.norm(matrix - encodings[i], axis=1)
+        best = int(np.argmin(distances))
+        results.append((labels[i], labels[enrolled[best]], float(distances[best])))
+    return results
+
+
+def score(matches, threshold, gallery_labels):
+    """
+    Error rates at one threshold. FAR is accepted impostors over impostor
+    probes (None without an impostor set). An enrolled person matched to
+    someone else is a misidentification: reported on its own (MIR) and, as
+    that person was not recognized, also counted as a false reject.
+    """
+    genuine = impostor = false_accepts = false_rejects = misidentified = 0
+    for result in matches:
+        if result is None:
+            continue
+        true_label, best_label, distance = result
+        is_enrolled = true_label in gallery_labels
+        accepted = distance is not None and distance < threshold
+        if is_enrolled:
+            genuine += 1
+            if accepted and best_label != true_label:
+                misidentified += 1
+            if not accepted or best_label != true_label:
+                false_rejects += 1
+        else:
+            impostor += 1
+            if accepted:
+                false_accepts += 1
+    return {
+        "probes": genuine + impostor,
+        "genuine_probes": genuine,
+        "impostor_probes": impostor,
+        "far": round(false_accepts / impostor, 4) if impostor else None,
+        "frr": round(false_rejects / genuine, 4) if genuine else None,
+        "mir": round(misidentified / genuine, 4) if genuine else None,
+        "false_accepts": false_accepts,
+        "false_rejects": false_rejects,
+        "misidentified": misidentified,
+    }
+
+
+def p50(values):
+    return round(float(np.median(values)), 2) if values else None
+
+
+def pareto_frontier(rows):
+    """Rows not dominated on (latency, FAR, MIR, FRR); all are minimized"""
+    def key(row):
+        # Without impostors FAR is None in every row, so it compares equal
+        return (row["latency_ms"], row["far"] or 0.0, row["mir"], row["frr"])
+
+    frontier = []
+    for row in rows:
+        a = key(row)
+        dominated = any(
+            all(x <= y for x, y in zip(key(other), a)) and key(other) != a
+            for other in rows
+        )
+        if not dominated:
+            frontier.append(row)
+    return sorted(frontier, key=key)
+
+
+def parse_list(cast):
+    def parse(text):
+        try:
+            return [cast(value) for value in text.split(',') if value.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid list: {text}")
+    return parse
+
+
+def describe(row):
+    resolution = row["resolution"] or "native"
+    return (f"{row['detection_model']}/up{row['upsample']}/{resolution}px "
+            f"{row['encoding_model']}/j{row['jitters']} thr={row['threshold']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep recognition parameters for speed vs accuracy')
+    parser.add_argument('--dataset', required=True, help='Folder with one sub-folder of images per person')
+    parser.add_argument('--impostors', help='Folder of people who are never enrolled (same layout)')
+    parser.add_argument('--enroll', type=int, default=1, help='Images per person used as the gallery')
+    parser.add_argument('--detection-models', type=parse_list(str), default=['hog'], help='e.g. hog,cnn')
+    parser.add_argument('--upsample', type=parse_list(int), default=[0, 1], help='Upsample counts, e.g. 0,1,2')
+    parser.add_argument('--resolutions', type=parse_list(int), default=[0, 480, 640], help='Longest side; 0 = native')
+    parser.add_argument('--encoding-models', type=parse_list(str), default=['small', 'large'], help='e.g. small,large')
+    parser.add_argument('--jitters', type=parse_list(int), default=[1], help='num_jitters values, e.g. 1,2,5')
+    parser.add_argument('--thresholds', type=parse_list(float), default=[0.4, 0.45, 0.5, 0.55, 0.6], help='Distance thresholds')
+    parser.add_argument('--max-far', type=float, default=0.01, help='Accuracy target: maximum false accept rate')
+    parser.add_argument('--max-frr', type=float, default=0.05, help='Accuracy target: maximum false reject rate')
+    parser.add_argument('--gate-percentile', type=float, default=5, help='Share of good photos the suggested quality gate may reject')
+    parser.add_argument('--output', default='parameter_sweep.json', help='JSON results output path')
+    args = parser.parse_args()
+
+    items = load_dataset(args.dataset)
+    if args.impostors:
+        items += load_dataset(args.impostors, label_prefix='impostor:')
+    if not items:
+        print(f"No images found under {args.dataset}")
+        sys.exit(1)
+    labels = [label for label, _ in items]
+    impostor_labels = {label for label in labels if label.startswith('impostor:')}
+    images = [face_recognition.load_image_file(path) for _, path in items]
+    gallery, probes = split_gallery(labels, args.enroll, impostor_labels)
+    gallery_labels = {labels[i] for i in gallery}
+    if not probes:
+        print("No probe images left after enrollment; add more images per person or lower --enroll")
+        sys.exit(1)
+    print(f"Loaded {len(images)} images: {len(gallery_labels)} enrolled people, "
+          f"{len(gallery)} gallery images, {len(probes)} probes ({len(impostor_labels)} impostor identities)")
+
+    rows = []
+    quality_gate = None
+    for det_model, upsample, resolution in itertools.product(args.detection_models, args.upsample, args.resolutions):
+        print(f"\nDetection {det_model} upsample={upsample} resolution={resolution or 'native'} ...")
+        detections, det_times = detect_all(images, det_model, upsample, resolution)
+        detected = sum(1 for _, box in detections if box is not None)
+        if quality_gate is None:
+            # Measured once, on the first detection setting
+            quality_gate = gate_report(gate_measurements(detections), args.gate_percentile)
+        for enc_model, jitters in itertools.product(args.encoding_models, args.jitters):
+            encodings, enc_times = encode_all(detections, enc_model, jitters)
+            matches = nearest_matches(encodings, labels, gallery, probes)
+            detection_ms, encoding_ms = p50(det_times), p50(enc_times)
+            for threshold in args.thresholds:
+                rows.append({
+                    "detection_model": det_model,
+                    "upsample": upsample,
+                    "resolution": resolution,
+                    "encoding_model": enc_model,
+                    "jitters": jitters,
+                    "threshold": threshold,
+                    "detection_rate": round(detected / len(images), 4),
+                    "detection_p50_ms": detection_ms,
+                    "encoding_p50_ms": encoding_ms,
+                    "latency_ms": round((detection_ms or 0) + (encoding_ms or 0), 2),
+                    **score(matches, threshold, gallery_labels),
+                })
+            print(f"  {enc_model}/j{jitters}: detect p50 {detection_ms} ms, encode p50 {encoding_ms} ms, "
+                  f"faces found {detected}/{len(images)}")
+
+    rows = [row for row in rows if row["frr"] is not None]
+    if not rows:
+        print("\nNo configuration produced scorable probes (no faces detected?)")
+        sys.exit(1)
+    far_measured = bool(impostor_labels)
+    frontier = pareto_frontier(rows)
+    meeting = [row for row in rows
+               if (not far_measured or row["far"] <= args.max_far) and row["frr"] <= args.max_frr]
+    recommended = min(meeting, key=lambda r: (r["latency_ms"], (r["far"] or 0.0) + r["frr"])) if meeting else None
+    target = f"FAR <= {args.max_far} and FRR <= {args.max_frr}" if far_measured else f"FRR <= {args.max_frr}"
+
+    print("\n" + "=" * 108)
+    print(" " * 32 + "PARETO FRONTIER (latency vs FAR vs MIR vs FRR)")
+    print("=" * 108)
+    print(f"{'Configuration':<48} {'Detect ms':>10} {'Encode ms':>10} {'Total ms':>10} {'FAR':>8} {'MIR':>8} {'FRR':>8}")
+    print("-" * 108)
+    for row in frontier:
+        far = f"{row['far']:>8.3f}" if row["far"] is not None else f"{'n/a':>8}"
+        print(f"{describe(row):<48} {row['detection_p50_ms'] or 0:>10.1f} {row['encoding_p50_ms'] or 0:>10.1f} "
+              f"{row['latency_ms']:>10.1f} {far} {row['mir']:>8.3f} {row['frr']:>8.3f}")
+    print("-" * 108)
+    if not far_measured:
+        print("⚠️  No --impostors set: FAR is not measured and the recommendation below ignores --max-far.")
+        print("   MIR (enrolled people matched to someone else) is shown, but it does not replace FAR.")
+    if recommended:
+        print(f"✅ Fastest setting with {target}:")
+        print(f"   {describe(recommended)}  ({recommended['latency_ms']} ms per frame)")
+        print(f"   FACE_DETECTION_MODEL={recommended['detection_model']} FACE_ENCODING_MODEL={recommended['encoding_model']} "
+              f"FACE_JITTERS={recommended['jitters']} FACE_DISTANCE_THRESHOLD={recommended['threshold']}")
+        if recommended["resolution"] or recommended["upsample"] != 1:
+            print(f"   (detection resolution {recommended['resolution'] or 'native'}, upsample {recommended['upsample']})")
+    else:
+        print(f"❌ No setting met {target}")
+    print("=" * 108)
+
+    if quality_gate:
+        print(f"\nQuality gate measurements on detected faces (suggested = {args.gate_percentile:g}th percentile):")
+        print(f"{'Measurement':<16} {'Faces':>6} {'p1':>10} {'p5':>10} {'p50':>10} {'Suggested':>10}")
+        for name, row in quality_gate.items():
+            print(f"{name:<16} {row['faces']:>6} {row['p1']:>10.3f} {row['p5']:>10.3f} {row['p50']:>10.3f} {row['suggested']:>10.3f}")
+        env = {"face_size": "QUALITY_GATE_MIN_FACE_SIZE", "sharpness": "QUALITY_GATE_MIN_SHARPNESS",
+               "pose_symmetry": "QUALITY_GATE_MIN_POSE_SYMMETRY"}
+        suggested = [f"{env[name]}={int(row['suggested']) if name == 'face_size' else row['suggested']}"
+                     for name, row in quality_gate.items()]
+        print(f"   QUALITY_GATE_ENABLED=true {' '.join(suggested)}")
+        print("   Photos taken at the kiosk give better thresholds than enrollment photos.")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "generated_at": datetime.now().isoformat(timespec='seconds'),
+            "dataset": args.dataset,
+            "impostors": args.impostors,
+            "images": len(images),
+            "gallery_images": len(gallery),
+            "probes": len(probes),
+            "targets": {"max_far": args.max_far, "max_frr": args.max_frr},
+            "recommended": recommended,
+            "quality_gate": quality_gate,
+            "frontier": frontier,
+            "results": rows,
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
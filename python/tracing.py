@@ -0,0 +1,158 @@
+"""
+Request Tracing Module
+Gives every request a trace ID and records the nested log_performance blocks
+as spans, so concurrent requests can be told apart in the performance log and
+a per-stage breakdown can be returned in a Server-Timing header.
+"""
+import re
+import time
+import uuid
+import contextvars
+
+from metrics import normalize_name, stage_for
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_TRACEPARENT_RE = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$')
+
+# Pipeline stages reported in Server-Timing, in pipeline order
+SERVER_TIMING_NAMES = (
+    ('db_load', 'db'),
+    ('decode', 'decode'),
+    ('detection', 'detect'),
+    ('landmarks', 'landmarks'),
+    ('encoding', 'encode'),
+    ('liveness', 'liveness'),
+    ('matching', 'match'),
+)
+
+
+class Span:
+    __slots__ = ('name', 'stage', 'start', 'end', 'depth', 'parent')
+
+    def __init__(self, name, stage, depth, parent):
+        self.name = name
+        self.stage = stage
+        self.depth = depth
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class Trace:
+    """Spans recorded for a single request"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self._stack = []
+
+    def start_span(self, name):
+        normalized, _ = normalize_name(name)
+        parent = self._stack[-1] if self._stack else None
+        span = Span(name, stage_for(normalized), len(self._stack), parent)
+        self.spans.append(span)
+        self._stack.append(span)
+        return span
+
+    def end_span(self, span):
+        span.end = time.perf_counter()
+        if self._stack and self._stack[-1] is span:
+            self._stack.pop()
+        elif span in self._stack:
+            self._stack.remove(span)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def total_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def stage_totals(self):
+        """Milliseconds per stage; nested spans of the same stage are counted once"""
+        totals = {}
+        for span in self.spans:
+            ancestor = span.parent
+            while ancestor is not None and ancestor.stage != span.stage:
+                ancestor = ancestor.parent
+            if ancestor is None:
+                totals[span.stage] = totals.get(span.stage, 0.0) + span.duration_ms
+        return totals
+
+    def server_timing(self):
+        """Compact Server-Timing header value, e.g. 'decode;dur=4.1, detect;dur=210.3, total;dur=240.9'"""
+        totals = self.stage_totals()
+        parts = [f"{label};dur={totals[stage]:.1f}" for stage, label in SERVER_TIMING_NAMES if stage in totals]
+        parts.append(f"total;dur={self.total_ms:.1f}")
+        return ', '.join(parts)
+
+    def to_dict(self):
+        """Breakdown for the optional JSON 'timing' field"""
+        return {
+            "traceId": self.trace_id,
+            "totalMs": round(self.total_ms, 2),
+            "stages": {stage: round(ms, 2) for stage, ms in self.stage_totals().items()},
+            "spans": [
+                {
+                    "name": span.name,
+                    "depth": span.depth,
+                    "offsetMs": round((span.start - self.start) * 1000, 2),
+                    "durationMs": round(span.duration_ms, 2),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+def trace_id_from_headers(headers):
+    """Accept an incoming X-Request-ID or W3C traceparent, otherwise mint a new ID"""
+    request_id = (headers.get('X-Request-ID') or '').strip()
+    if request_id and _REQUEST_ID_RE.match(request_id):
+        return request_id
+    match = _TRACEPARENT_RE.match((headers.get('traceparent') or '').strip())
+    if match:
+        return match.group(1)
+    return uuid.uuid4().hex
+
+
+def begin(headers):
+    trace = Trace(trace_id_from_headers(headers))
+    _current_trace.set(trace)
+    return trace
+
+
+def current():
+    return _current_trace.get()
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def end():
+    _current_trace.set(None)
+
+
+def start_span(name):
+    trace = _current_trace.get()
+    return trace.start_span(name) if trace is not None else None
+
+
+def end_span(span):
+    if span is None:
+        return
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.end_span(span)
@@ -0,0 +1,149 @@
+"""
+Traffic Capture Module
+Opt-in recording of recognizer traffic for load replay (see replay_traffic.py).
+
+Each captured request becomes one JSON line with its endpoint, arrival time,
+uploaded file sizes, status, latency and outcome. A sampled fraction of
+requests also keeps the uploaded frames in a content-addressed blob store, so
+a replay can send the same images. Files are written by a background thread;
+the request thread only enqueues.
+
+Layout under the capture directory:
+    YYYYMMDD/requests-<pid>.jsonl
+    blobs/<sha1[:2]>/<sha1>.jpg
+
+Captured frames are staff faces: keep the capture directory private and
+delete it once the replay set is built.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import queue
+
+logger = logging.getLogger(__name__)
+
+# Endpoints whose traffic is worth replaying
+CAPTURE_PATHS = ('/recognize', '/recognize-simple', '/liveness-check')
+
+_CONTENT_EXTENSIONS = {'image/png': '.png', 'image/bmp': '.bmp'}
+
+
+class TrafficCapture:
+    def __init__(self, directory='captures', sample_rate=1.0, frame_sample_rate=0.0, max_pending=1000):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.frame_sample_rate = frame_sample_rate
+        self.max_pending = max_pending
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_writer(self):
+        # Started lazily so each forked worker gets its own writer thread
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            self._queue = queue.SimpleQueue()
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._write_loop, name="traffic-capture-writer", daemon=True)
+            self._writer.start()
+
+    def record(self, request, response, duration_ms, trace_id=None):
+        """Capture one finished request; cheap no-op for unsampled traffic"""
+        if request.path not in CAPTURE_PATHS or random.random() >= self.sample_rate:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+
+        keep_frames = random.random() < self.frame_sample_rate
+        files = []
+        for field, storage in request.files.items(multi=True):
+            entry = {"field": field, "content_type": storage.mimetype or None}
+            data = None
+            try:
+                # Size from the end offset; the bytes are copied only for kept frames
+                storage.stream.seek(0, os.SEEK_END)
+                entry["size"] = storage.stream.tell()
+                if keep_frames and entry["size"]:
+                    storage.stream.seek(0)
+                    data = storage.stream.read()
+            except Exception:
+                entry["size"] = storage.content_length or 0
+                data = None
+            files.append((entry, data or None))
+
+        outcome = {}
+        if response.is_json:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                if 'matches' in body:
+                    outcome["matches"] = len(body["matches"] or [])
+                    outcome["matched"] = any(m.get("matched") for m in body["matches"] or [] if isinstance(m, dict))
+                if 'liveness_passed' in body:
+                    outcome["liveness_passed"] = body["liveness_passed"]
+
+        record = {
+            "ts": time.time() - duration_ms / 1000,
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode('utf-8', 'replace') or None,
+            "trace_id": trace_id,
+            "pid": os.getpid(),
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "outcome": outcome,
+        }
+        self._ensure_writer()
+        self._queue.put((record, files))
+
+    def _write_blob(self, data, content_type):
+        digest = hashlib.sha1(data).hexdigest()
+        relative = os.path.join('blobs', digest[:2], digest + _CONTENT_EXTENSIONS.get(content_type, '.jpg'))
+        path = os.path.join(self.directory, relative)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return relative.replace(os.sep, '/')
+
+    def _write_loop(self):
+        while True:
+            record, files = self._queue.get()
+            try:
+                entries = []
+                for entry, data in files:
+                    if data is not None:
+                        entry["blob"] = self._write_blob(data, entry["content_type"])
+                    entries.append(entry)
+                record["files"] = entries
+
+                day_dir = os.path.join(self.directory, time.strftime('%Y%m%d', time.localtime(record["ts"])))
+                os.makedirs(day_dir, exist_ok=True)
+                with open(os.path.join(day_dir, f"requests-{os.getpid()}.jsonl"), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                self.captured += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.warning(f"Traffic capture write failed: {e}")
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "sample_rate": self.sample_rate,
+            "frame_sample_rate": self.frame_sample_rate,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize(),
+        }